@@ -0,0 +1 @@
+"""手动运行的性能基准脚本（python -m backend.benchmarks.<name>）。"""
@@ -0,0 +1,164 @@
+"""大批量写入期间图库读接口的延迟（p50/p99）：SQLite 默认配置与调优配置对比。
+
+    python -m backend.benchmarks.concurrent_reads --readers 4 --seconds 10
+
+写线程模拟导入/哈希任务，每个事务写入 --batch 行 image_hashes；读线程同时调用图集列表
+和图片列表接口。
+"""
+
+import argparse
+import random
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from sqlalchemy import insert
+from sqlalchemy.orm import sessionmaker
+
+from ..database import SQLITE_PRAGMAS, Base, create_db_engine
+from ..models import Coser, Cosplay, ImageHash, MediaFile
+from ..routers.cosplays import _image_list, list_cosplays
+
+_IMAGES = 20
+
+
+def _seed(engine, count: int) -> None:
+    start = datetime(2024, 1, 1)
+    with engine.begin() as conn:
+        conn.execute(insert(Coser), [{"name": "bench", "created_at": start}])
+        conn.execute(
+            insert(Cosplay),
+            [
+                {
+                    "title": f"set{i}",
+                    "coser_id": 1,
+                    "dir_path": f"/library/set{i}",
+                    "dir_mtime_ns": 1,
+                    "photo_count": _IMAGES,
+                    "video_count": 0,
+                    "total_size": 0,
+                    "created_at": start + timedelta(minutes=i),
+                }
+                for i in range(count)
+            ],
+        )
+        conn.execute(
+            insert(MediaFile),
+            [
+                {
+                    "cosplay_id": cosplay_id,
+                    "filename": f"{n:04d}.jpg",
+                    "kind": "image",
+                    "size": 1,
+                    "mtime_ns": 1,
+                    "inode": 1,
+                    "position": n,
+                }
+                for cosplay_id in range(1, count + 1)
+                for n in range(_IMAGES)
+            ],
+        )
+
+
+def _run(tmp: Path, tuned: bool, args: argparse.Namespace) -> None:
+    url = f"sqlite:///{tmp / ('tuned' if tuned else 'default')}.sqlite"
+    pragmas = SQLITE_PRAGMAS if tuned else {}
+    write_engine = create_db_engine(url, pragmas=pragmas)
+    read_engine = create_db_engine(url, read_only=tuned, pragmas=pragmas)
+    Base.metadata.create_all(write_engine)
+    _seed(write_engine, args.cosplays)
+    WriteSession = sessionmaker(bind=write_engine)
+    ReadSession = sessionmaker(bind=read_engine)
+
+    stop = threading.Event()
+    written = 0
+
+    def writer() -> None:
+        nonlocal written
+        batch = 0
+        while not stop.is_set():
+            with WriteSession() as db:
+                db.execute(
+                    insert(ImageHash),
+                    [
+                        {
+                            "cosplay_id": 1 + (batch * args.batch + n) % args.cosplays,
+                            "filename": f"ingest-{batch}-{n}.jpg",
+                            "phash": f"{n:016x}",
+                            "phash_int": n,
+                            "blurhash": "L00000fQfQfQfQfQfQfQfQfQfQfQ",
+                        }
+                        for n in range(args.batch)
+                    ],
+                )
+                db.commit()
+            written += args.batch
+            batch += 1
+
+    latencies: list[float] = []
+    lock = threading.Lock()
+
+    def reader(seed: int) -> None:
+        rng = random.Random(seed)
+        mine = []
+        while not stop.is_set():
+            start = time.perf_counter()
+            with ReadSession() as db:
+                if rng.random() < 0.5:
+                    list_cosplays(
+                        page=rng.randint(1, args.cosplays // 20),
+                        page_size=20,
+                        coser_id=None,
+                        parody_id=None,
+                        cursor=None,
+                        include_total=False,
+                        db=db,
+                    )
+                else:
+                    _image_list(db, rng.randint(1, args.cosplays))
+            mine.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(mine)
+
+    threads = [threading.Thread(target=writer)]
+    threads += [threading.Thread(target=reader, args=(i,)) for i in range(args.readers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    write_engine.dispose()
+    read_engine.dispose()
+
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2] * 1000
+    p99 = latencies[int(len(latencies) * 0.99)] * 1000
+    print(
+        f"{'tuned' if tuned else 'default':>8} {len(latencies) / args.seconds:>8.0f}"
+        f" {p50:>8.1f} {p99:>8.1f} {latencies[-1] * 1000:>8.1f}"
+        f" {written / args.seconds:>10.0f}"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cosplays", type=int, default=5000)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--batch", type=int, default=20000)
+    parser.add_argument("--seconds", type=float, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        print(
+            f"{'profile':>8} {'reads/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8}"
+            f" {'rows/s':>10}"
+        )
+        for tuned in (False, True):
+            _run(Path(tmp), tuned, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""/api/files 每秒请求数：关闭与开启路径缓存对比（需要 httpx 以使用 TestClient）。
+
+python -m backend.benchmarks.file_requests --cosplays 20 --images 100
+"""
+
+import argparse
+import random
+import tempfile
+import time
+from pathlib import Path
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from PIL import Image
+from sqlalchemy import create_engine
+
+from .. import config, database
+from ..database import Base
+from ..models import Coser, Cosplay
+from ..routers import files
+from ..services import path_cache, thumbnail
+from ..services.scanner import sync_cosplay_files
+
+
+def _setup(tmp: Path, cosplays: int, images: int) -> None:
+    engine = create_engine(
+        f"sqlite:///{tmp / 'db.sqlite'}", connect_args={"check_same_thread": False}
+    )
+    Base.metadata.create_all(engine)
+    database.SessionLocal.configure(bind=engine)
+    database.ReadSessionLocal.configure(bind=engine)
+    thumbnail.THUMBNAIL_DIR = tmp / "thumbnails"
+
+    # 所有图片硬链接到同一个小文件，只测请求开销而不是磁盘吞吐
+    sample = tmp / "sample.jpg"
+    Image.new("RGB", (40, 30)).save(sample)
+    with database.SessionLocal() as db:
+        coser = Coser(name="bench")
+        db.add(coser)
+        db.flush()
+        for c in range(cosplays):
+            dir_path = tmp / "library" / f"set{c}"
+            thumb_dir = thumbnail.THUMBNAIL_DIR / str(c + 1)
+            dir_path.mkdir(parents=True)
+            thumb_dir.mkdir(parents=True)
+            for i in range(images):
+                (dir_path / f"{i:04d}.jpg").hardlink_to(sample)
+                (thumb_dir / f"{i:04d}.jpg.avif").hardlink_to(sample)
+            cosplay = Cosplay(
+                title=f"set{c}", coser_id=coser.id, dir_path=str(dir_path)
+            )
+            db.add(cosplay)
+            db.flush()
+            sync_cosplay_files(db, cosplay)
+        db.commit()
+
+
+def _run(client: TestClient, urls: list[str], conditional: bool) -> float:
+    etags: dict[str, str] = {}
+    if conditional:
+        for url in set(urls):
+            etags[url] = client.get(url).headers["etag"]
+    start = time.perf_counter()
+    for url in urls:
+        headers = {"If-None-Match": etags[url]} if conditional else {}
+        response = client.get(url, headers=headers)
+        assert response.status_code == (304 if conditional else 200)
+    return len(urls) / (time.perf_counter() - start)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cosplays", type=int, default=20)
+    parser.add_argument("--images", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=5000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        _setup(Path(tmp), args.cosplays, args.images)
+        app = FastAPI()
+        app.include_router(files.router, prefix="/api/files")
+        # 浏览器会声明支持 AVIF，命中预先生成的 400px 缩略图
+        client = TestClient(app, headers={"Accept": "image/avif"})
+
+        rng = random.Random(0)
+        urls = [
+            f"/api/files/thumbnail/{rng.randint(1, args.cosplays)}/"
+            f"{rng.randrange(args.images):04d}.jpg"
+            for _ in range(args.requests)
+        ]
+        print(f"{'cache':>6} {'200 req/s':>10} {'304 req/s':>10}")
+        for enabled in (False, True):
+            size = config.PATH_CACHE_SIZE if enabled else 0
+            for cache in (path_cache._cosplays, path_cache._cosers):
+                cache.maxsize = size
+                cache.invalidate()
+            full = _run(client, urls, conditional=False)
+            not_modified = _run(client, urls, conditional=True)
+            print(
+                f"{'on' if enabled else 'off':>6} {full:>10.0f} {not_modified:>10.0f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""以图搜图的查询延迟：百万级 pHash 下的 similar_images（不含上传图片的解码）。
+
+    python -m backend.benchmarks.image_search --hashes 2000000 --queries 200
+
+随机生成 --hashes 行 image_hashes，每次查询取库内某个哈希翻转几位，统计 p50/p99；
+再模拟哈希任务边查询边写入新哈希，每次查询前都提交一行新哈希，由索引增量载入。
+"""
+
+import argparse
+import random
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+from sqlalchemy import insert
+from sqlalchemy.orm import sessionmaker
+
+from ..database import Base, create_db_engine
+from ..models import Coser, Cosplay, ImageHash
+from ..services.phash_index import get_phash_index, phash_to_int
+from ..services.search import similar_images
+
+_PER_COSPLAY = 50
+
+
+def _seed(engine, count: int, rng: random.Random) -> list[int]:
+    hashes = [rng.getrandbits(64) for _ in range(count)]
+    cosplays = (count + _PER_COSPLAY - 1) // _PER_COSPLAY
+    start = datetime(2024, 1, 1)
+    with engine.begin() as conn:
+        conn.execute(insert(Coser), [{"name": "bench", "created_at": start}])
+        conn.execute(
+            insert(Cosplay),
+            [
+                {
+                    "title": f"set{i}",
+                    "coser_id": 1,
+                    "dir_path": f"/library/set{i}",
+                    "photo_count": _PER_COSPLAY,
+                    "video_count": 0,
+                    "total_size": 0,
+                    "created_at": start,
+                }
+                for i in range(cosplays)
+            ],
+        )
+        for offset in range(0, count, 100000):
+            conn.execute(
+                insert(ImageHash),
+                [
+                    {
+                        "cosplay_id": 1 + n // _PER_COSPLAY,
+                        "filename": f"{n % _PER_COSPLAY:04d}.jpg",
+                        "phash": f"{h:016x}",
+                        "phash_int": phash_to_int(f"{h:016x}"),
+                    }
+                    for n, h in enumerate(hashes[offset : offset + 100000], offset)
+                ],
+            )
+    return hashes
+
+
+def _measure(
+    Session, hashes: list[int], args, rng: random.Random, writes: bool
+) -> list[float]:
+    latencies = []
+    with Session() as db:
+        for n in range(args.queries):
+            if writes:
+                # 哈希任务每处理完一张图就提交一行新哈希
+                phash = f"{rng.getrandbits(64):016x}"
+                db.add(
+                    ImageHash(
+                        cosplay_id=1,
+                        filename=f"new{n}.jpg",
+                        phash=phash,
+                        phash_int=phash_to_int(phash),
+                    )
+                )
+                db.commit()
+            h = rng.choice(hashes)
+            for bit in rng.sample(range(64), rng.randint(0, args.threshold)):
+                h ^= 1 << bit
+            start = time.perf_counter()
+            images, _ = similar_images(db, f"{h:016x}", args.threshold, 20)
+            latencies.append(time.perf_counter() - start)
+            assert images
+    return sorted(latencies)
+
+
+def _report(label: str, latencies: list[float]) -> None:
+    p50 = latencies[len(latencies) // 2] * 1000
+    p99 = latencies[int(len(latencies) * 0.99)] * 1000
+    print(f"{label:>14} {p50:>8.2f}ms {p99:>8.2f}ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--hashes", type=int, default=1000000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--threshold", type=int, default=10)
+    args = parser.parse_args()
+    rng = random.Random(0)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_db_engine(f"sqlite:///{Path(tmp) / 'db.sqlite'}")
+        Base.metadata.create_all(engine)
+        Session = sessionmaker(bind=engine)
+        hashes = _seed(engine, args.hashes, rng)
+
+        start = time.perf_counter()
+        with Session() as db:
+            get_phash_index(db)
+        print(
+            f"index of {args.hashes} hashes built in {time.perf_counter() - start:.1f}s"
+        )
+        print(f"{'':>14} {'p50':>10} {'p99':>10}")
+        _report("read only", _measure(Session, hashes, args, rng, writes=False))
+        _report("with writes", _measure(Session, hashes, args, rng, writes=True))
+
+
+if __name__ == "__main__":
+    main()
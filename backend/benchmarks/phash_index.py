@@ -0,0 +1,97 @@
+"""对比 pHash 去重：原两两比较循环 vs 多索引哈希，以及单张图对全库的查询耗时。
+
+    python -m backend.benchmarks.phash_index --sizes 10000 100000 1000000
+
+两两比较在大规模下不可能跑完，因此按抽样得到的单次比较耗时外推。
+"""
+
+import argparse
+import random
+import time
+
+from ..services.phash_index import PhashIndex
+
+PAIR_SAMPLE = 200_000
+
+
+def hamming_distance(h1: str, h2: str) -> int:
+    """The original per-character comparison used by the dedup loop."""
+    if len(h1) != len(h2):
+        return 64
+    return sum(c1 != c2 for c1, c2 in zip(h1, h2))
+
+
+def _random_hashes(n: int, seed: int = 0) -> list[str]:
+    """Clustered synthetic pHashes: each set has a base hash plus a few bit flips."""
+    rng = random.Random(seed)
+    hashes: list[str] = []
+    while len(hashes) < n:
+        base = rng.getrandbits(64)
+        for _ in range(rng.randint(20, 200)):
+            h = base
+            for _ in range(rng.randint(0, 6)):
+                h ^= 1 << rng.randrange(64)
+            hashes.append(f"{h:016x}")
+    return hashes[:n]
+
+
+def _naive_seconds(hashes: list[str], threshold: int) -> tuple[float, bool]:
+    distinct = list(dict.fromkeys(hashes))
+    total_pairs = len(distinct) * (len(distinct) - 1) // 2
+    if total_pairs <= PAIR_SAMPLE * 10:
+        start = time.perf_counter()
+        for i, h1 in enumerate(distinct):
+            for h2 in distinct[i + 1 :]:
+                hamming_distance(h1, h2) <= threshold
+        return time.perf_counter() - start, False
+
+    rng = random.Random(1)
+    sample = [(rng.choice(distinct), rng.choice(distinct)) for _ in range(PAIR_SAMPLE)]
+    start = time.perf_counter()
+    for h1, h2 in sample:
+        hamming_distance(h1, h2) <= threshold
+    per_pair = (time.perf_counter() - start) / PAIR_SAMPLE
+    return per_pair * total_pairs, True
+
+
+def _index_seconds(
+    hashes: list[str], threshold: int
+) -> tuple[float, float, float, int]:
+    start = time.perf_counter()
+    index = PhashIndex()
+    for i, h in enumerate(hashes):
+        index.add(h, i % 1000)
+    index.packed()
+    built = time.perf_counter()
+    found = sum(1 for _ in index.pairs(threshold))
+    paired = time.perf_counter()
+    for h in hashes[:100]:
+        index.search(h, threshold)
+    single_ms = (time.perf_counter() - paired) * 10
+    return built - start, paired - built, single_ms, found
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--threshold", type=int, default=10)
+    args = parser.parse_args()
+
+    print(
+        f"{'n':>10} {'naive (s)':>14} {'build (s)':>10} {'pairs (s)':>10}"
+        f" {'1 query (ms)':>13} {'pairs':>10}"
+    )
+    for n in args.sizes:
+        hashes = _random_hashes(n)
+        naive, estimated = _naive_seconds(hashes, args.threshold)
+        build, paired, single_ms, found = _index_seconds(hashes, args.threshold)
+        naive_col = f"{naive:.2f}{'*' if estimated else ''}"
+        print(
+            f"{n:>10} {naive_col:>14} {build:>10.2f} {paired:>10.2f}"
+            f" {single_ms:>13.2f} {found:>10}"
+        )
+    print("* estimated from a sample of pair comparisons")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+"""热点查询的执行计划检查：在造好的大库上跑一遍接口与后台流程，任何全表扫描都报错。
+
+    python -m backend.benchmarks.query_plans --cosplays 20000 --images 20
+
+记录每条实际执行的 SQL，逐条 EXPLAIN QUERY PLAN；出现不走索引的 SCAN 时以退出码 1
+结束，可直接放进 CI。
+"""
+
+import argparse
+import re
+import sys
+import tempfile
+from collections.abc import Callable
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from PIL import Image
+from sqlalchemy import create_engine, event, insert
+from sqlalchemy.engine import Engine
+
+from .. import database
+from ..migrations import upgrade
+from ..models import Coser, Cosplay, ImageHash, Job, MediaFile, Parody
+from ..routers import admin, cosers, cosplays, parodies, search
+from ..services import jobs, path_cache, thumbnail
+
+# SCAN 后面没有 USING INDEX / USING COVERING INDEX / USING INTEGER PRIMARY KEY；
+# sqlite_master 等内部表不算
+_FULL_SCAN = re.compile(r"^SCAN (?!sqlite_)(\w+)(?: AS \w+)?$")
+# 不带条件的 count(*) 无论如何都要读完整张表，结果由分页模块缓存
+_WHOLE_TABLE_COUNT = re.compile(r"^SELECT count\(\*\)(?!.* WHERE )", re.S)
+
+
+def _seed(engine: Engine, count: int, images: int) -> None:
+    cosers_count = max(count // 10, 1)
+    parodies_count = max(count // 50, 1)
+    start = datetime(2024, 1, 1)
+    with engine.begin() as conn:
+        conn.execute(
+            insert(Coser),
+            [
+                {"name": f"coser{i:06d}", "created_at": start}
+                for i in range(cosers_count)
+            ],
+        )
+        conn.execute(
+            insert(Parody),
+            [
+                {"name": f"parody{i:05d}", "created_at": start}
+                for i in range(parodies_count)
+            ],
+        )
+        conn.execute(
+            insert(Cosplay),
+            [
+                {
+                    "title": f"set{i}",
+                    "coser_id": 1 + i % cosers_count,
+                    "parody_id": 1 + i % parodies_count if i % 3 else None,
+                    "dir_path": f"/library/set{i}",
+                    "dir_mtime_ns": 1,
+                    "photo_count": images,
+                    "video_count": 0,
+                    "total_size": 0,
+                    "created_at": start + timedelta(minutes=i),
+                }
+                for i in range(count)
+            ],
+        )
+        for first in range(0, count, 1000):
+            ids = range(first + 1, min(first + 1000, count) + 1)
+            conn.execute(
+                insert(MediaFile),
+                [
+                    {
+                        "cosplay_id": cosplay_id,
+                        "filename": f"{n:04d}.jpg",
+                        "kind": "image",
+                        "size": 1,
+                        "mtime_ns": 1,
+                        "inode": 1,
+                        "position": n,
+                    }
+                    for cosplay_id in ids
+                    for n in range(images)
+                ],
+            )
+            conn.execute(
+                insert(ImageHash),
+                [
+                    {
+                        "cosplay_id": cosplay_id,
+                        "filename": f"{n:04d}.jpg",
+                        "phash": f"{cosplay_id * images + n:016x}",
+                        "phash_int": cosplay_id * images + n,
+                    }
+                    for cosplay_id in ids
+                    for n in range(images)
+                ],
+            )
+        conn.execute(
+            insert(Job),
+            [
+                {
+                    "kind": "process_cosplay",
+                    "cosplay_id": 1 + i,
+                    "status": jobs.SUCCEEDED if i % 100 else jobs.QUEUED,
+                    "created_at": start,
+                }
+                for i in range(count)
+            ],
+        )
+
+
+def _operations(client: TestClient, tmp: Path, count: int) -> dict[str, Callable]:
+    """Hot paths by name; the ids point into the middle of the seeded data."""
+    cosplay_id = count // 2
+    coser_id = 1 + cosplay_id % max(count // 10, 1)
+    parody_id = 1 + cosplay_id % max(count // 50, 1)
+
+    def get(url: str, **params) -> dict:
+        response = client.get(url, params=params)
+        assert response.status_code == 200, (url, response.status_code)
+        return response.json()
+
+    def cursor_walk(**params) -> None:
+        first = get("/api/cosplays/", cursor="", **params)
+        get("/api/cosplays/", cursor=first["next_cursor"], **params)
+
+    def process_cosplay() -> None:
+        # 真实目录里放几张图，走一遍清单对比、旧哈希清理和待处理查询
+        dir_path = tmp / "library" / "set"
+        dir_path.mkdir(parents=True)
+        for n in range(3):
+            Image.new("RGB", (40, 30)).save(dir_path / f"{n:04d}.jpg")
+        with database.SessionLocal() as db:
+            cosplay = db.get(Cosplay, cosplay_id)
+            cosplay.dir_path = str(dir_path)
+            thumbnail.process_cosplay_images(cosplay, db, workers=1)
+
+    def enqueue() -> None:
+        with database.SessionLocal() as db:
+            jobs.enqueue_many(db, "process_cosplay", [cosplay_id, cosplay_id + 1])
+
+    def move_cosplay() -> None:
+        response = client.put(
+            f"/api/admin/cosplays/{cosplay_id}", json={"coser_id": coser_id + 1}
+        )
+        assert response.status_code == 200, response.text
+
+    def delete_cosplay() -> None:
+        response = client.delete(f"/api/admin/cosplays/{cosplay_id + 2}")
+        assert response.status_code == 200, response.text
+
+    def delete_busy_coser() -> None:
+        assert client.delete(f"/api/admin/cosers/{coser_id}").status_code == 409
+
+    return {
+        "cosplays page": lambda: get("/api/cosplays/", page=50),
+        "cosplays cursor": cursor_walk,
+        "cosplays by coser": lambda: cursor_walk(coser_id=coser_id, include_total=True),
+        "cosplays by parody": lambda: get("/api/cosplays/", parody_id=parody_id),
+        "cosplay detail": lambda: get(f"/api/cosplays/{cosplay_id}"),
+        "cosplay images": lambda: get(f"/api/cosplays/{cosplay_id}/images"),
+        "cosers page": lambda: get("/api/cosers/", page=5),
+        "cosers search": lambda: get("/api/cosers/", search="coser0001"),
+        "search": lambda: get("/api/search/", q="set123"),
+        "search by kind": lambda: get("/api/search/", q="parody 0", kind="parody"),
+        "coser detail": lambda: get(f"/api/cosers/{coser_id}"),
+        "parodies page": lambda: get("/api/parodies/", page=2),
+        "parody detail": lambda: get(f"/api/parodies/{parody_id}"),
+        "file paths": lambda: (
+            path_cache.get_cosplay_paths(cosplay_id),
+            path_cache.get_coser_paths(coser_id),
+        ),
+        "jobs by cosplay": lambda: get("/api/admin/jobs", cosplay_id=cosplay_id),
+        "jobs by status": lambda: get("/api/admin/jobs", status="queued"),
+        "enqueue jobs": enqueue,
+        "claim job": jobs._claim_next,
+        "process cosplay": process_cosplay,
+        "move cosplay": move_cosplay,
+        "delete cosplay": delete_cosplay,
+        "delete coser with cosplays": delete_busy_coser,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cosplays", type=int, default=20000)
+    parser.add_argument("--images", type=int, default=20)
+    parser.add_argument("-v", "--verbose", action="store_true", help="print all plans")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(
+            f"sqlite:///{Path(tmp) / 'db.sqlite'}",
+            connect_args={"check_same_thread": False},
+        )
+        database.SessionLocal.configure(bind=engine)
+        database.ReadSessionLocal.configure(bind=engine)
+        thumbnail.THUMBNAIL_DIR = Path(tmp) / "thumbnails"
+        upgrade(engine)
+        _seed(engine, args.cosplays, args.images)
+
+        app = FastAPI()
+        app.include_router(cosplays.router, prefix="/api/cosplays")
+        app.include_router(cosers.router, prefix="/api/cosers")
+        app.include_router(parodies.router, prefix="/api/parodies")
+        app.include_router(admin.router, prefix="/api/admin")
+        app.include_router(search.router, prefix="/api/search")
+        client = TestClient(app)
+
+        statements: list[tuple[str, object]] = []
+
+        @event.listens_for(engine, "before_cursor_execute")
+        def record(conn, cursor, statement, parameters, context, executemany):
+            if not executemany and statement.lstrip().startswith(
+                ("SELECT", "UPDATE", "DELETE")
+            ):
+                statements.append((statement, parameters))
+
+        plans = []
+        for name, operation in _operations(client, Path(tmp), args.cosplays).items():
+            statements.clear()
+            operation()
+            plans.append((name, list(statements)))
+        event.remove(engine, "before_cursor_execute", record)
+
+        failures = 0
+        with engine.connect() as conn:
+            for name, recorded in plans:
+                for statement, parameters in recorded:
+                    details = [
+                        row.detail
+                        for row in conn.exec_driver_sql(
+                            "EXPLAIN QUERY PLAN " + statement, parameters
+                        )
+                    ]
+                    scans = [d for d in details if _FULL_SCAN.match(d)]
+                    if _WHOLE_TABLE_COUNT.match(statement):
+                        scans = []
+                    failures += bool(scans)
+                    if scans or args.verbose:
+                        print(f"{'FULL SCAN' if scans else 'ok':>9}  {name}")
+                        print("    " + " ".join(statement.split()))
+                        for detail in details:
+                            print(f"      {detail}")
+                if not args.verbose:
+                    print(f"{'':>9}  {name}: {len(recorded)} statements")
+
+    if failures:
+        print(f"{failures} statement(s) fall back to a full table scan")
+        sys.exit(1)
+    print("no full table scans")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""慢存储下的并发浏览：同步文件接口与 async + 专用线程池对比。
+
+    python -m backend.benchmarks.slow_storage --clients 200 --latency-ms 50
+
+模拟 NFS：每次打开图库文件先等待 --latency-ms。--clients 个并发客户端不停请求原图，
+同时每 20ms 请求一次与文件无关的 /api/cosers/{id}，统计它的延迟。直接调用 ASGI 应用，
+不经过网络。
+"""
+
+import argparse
+import asyncio
+import builtins
+import random
+import tempfile
+import time
+from pathlib import Path
+
+from fastapi import APIRouter, FastAPI, Request
+from PIL import Image
+from sqlalchemy import create_engine
+
+from .. import database
+from ..database import Base
+from ..models import Coser, Cosplay
+from ..routers import cosers, files
+from ..services import file_io
+from ..services.scanner import sync_cosplay_files
+
+
+def _setup(tmp: Path, cosplays: int, images: int) -> None:
+    engine = create_engine(
+        f"sqlite:///{tmp / 'db.sqlite'}", connect_args={"check_same_thread": False}
+    )
+    Base.metadata.create_all(engine)
+    database.SessionLocal.configure(bind=engine)
+    database.ReadSessionLocal.configure(bind=engine)
+
+    sample = tmp / "sample.jpg"
+    Image.new("RGB", (40, 30)).save(sample)
+    with database.SessionLocal() as db:
+        coser = Coser(name="bench")
+        db.add(coser)
+        db.flush()
+        for c in range(cosplays):
+            dir_path = tmp / "library" / f"set{c}"
+            dir_path.mkdir(parents=True)
+            for i in range(images):
+                (dir_path / f"{i:04d}.jpg").hardlink_to(sample)
+            cosplay = Cosplay(
+                title=f"set{c}", coser_id=coser.id, dir_path=str(dir_path)
+            )
+            db.add(cosplay)
+            db.flush()
+            sync_cosplay_files(db, cosplay)
+        db.commit()
+
+
+def _sync_app() -> FastAPI:
+    """The file route as it was before: a plain ``def`` in the default pool."""
+    legacy = APIRouter()
+
+    @legacy.get("/image/{cosplay_id}/{filename}")
+    def serve_image(cosplay_id: int, filename: str, request: Request):
+        return files._serve_original(cosplay_id, filename, request)
+
+    app = FastAPI()
+    app.include_router(legacy, prefix="/api/files")
+    app.include_router(cosers.router, prefix="/api/cosers")
+    return app
+
+
+def _async_app() -> FastAPI:
+    app = FastAPI()
+    app.include_router(files.router, prefix="/api/files")
+    app.include_router(cosers.router, prefix="/api/cosers")
+    return app
+
+
+async def _get(app: FastAPI, path: str) -> int:
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"host", b"bench")],
+        "client": ("127.0.0.1", 1),
+        "server": ("bench", 80),
+    }
+    status = 0
+    requested = False
+    disconnected = asyncio.Event()
+
+    async def receive() -> dict:
+        nonlocal requested
+        if not requested:
+            requested = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        # 客户端不会断开；响应结束时等待它的任务会被取消
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message: dict) -> None:
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    await app(scope, receive, send)
+    return status
+
+
+async def _browse(app: FastAPI, args: argparse.Namespace) -> tuple[float, list[float]]:
+    deadline = time.perf_counter() + args.seconds
+    served = 0
+    probes: list[float] = []
+
+    async def client(seed: int) -> None:
+        nonlocal served
+        rng = random.Random(seed)
+        while time.perf_counter() < deadline:
+            cosplay_id = rng.randint(1, args.cosplays)
+            filename = f"{rng.randrange(args.images):04d}.jpg"
+            status = await _get(app, f"/api/files/image/{cosplay_id}/{filename}")
+            assert status == 200, status
+            served += 1
+
+    async def probe() -> None:
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            assert await _get(app, "/api/cosers/1") == 200
+            probes.append(time.perf_counter() - start)
+            await asyncio.sleep(0.02)
+
+    await asyncio.gather(probe(), *(client(i) for i in range(args.clients)))
+    return served / args.seconds, sorted(probes)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--cosplays", type=int, default=20)
+    parser.add_argument("--images", type=int, default=100)
+    parser.add_argument("--seconds", type=float, default=10)
+    args = parser.parse_args()
+
+    library_open = builtins.open
+
+    def slow_open(file, *a, **kw):
+        if "library" in Path(file).parts:
+            time.sleep(args.latency_ms / 1000)
+        return library_open(file, *a, **kw)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        _setup(Path(tmp), args.cosplays, args.images)
+        # file_io 通过模块全局名查找 open，在这里替换即可只影响文件接口
+        file_io.open = slow_open
+        try:
+            print(f"{'files':>6} {'images/s':>9} {'probe p50':>10} {'probe p99':>10}")
+            for name, app in (("sync", _sync_app()), ("async", _async_app())):
+                rate, probes = asyncio.run(_browse(app, args))
+                p50 = probes[len(probes) // 2] * 1000
+                p99 = probes[int(len(probes) * 0.99)] * 1000
+                print(f"{name:>6} {rate:>9.0f} {p50:>8.1f}ms {p99:>8.1f}ms")
+        finally:
+            del file_io.open
+
+
+if __name__ == "__main__":
+    main()
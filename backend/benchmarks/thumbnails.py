@@ -0,0 +1,74 @@
+"""图片处理（缩略图 + pHash + blurhash）吞吐量（张/秒）随进程池大小的变化。
+
+python -m backend.benchmarks.thumbnails --images 64 --workers 1 2 4 8
+"""
+
+import argparse
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from ..database import Base
+from ..models import Coser, Cosplay, ImageHash
+from ..services import thumbnail
+
+
+def _make_images(dir_path: Path, count: int, size: tuple[int, int]) -> None:
+    rng = np.random.default_rng(0)
+    for i in range(count):
+        # 低频噪声，接近照片的编码代价，又不至于像纯噪声那样难压
+        small = rng.integers(0, 256, (size[1] // 32, size[0] // 32, 3), np.uint8)
+        img = Image.fromarray(small).resize(size, Image.Resampling.BICUBIC)
+        img.save(dir_path / f"{i:04d}.jpg", quality=90)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--images", type=int, default=64)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--width", type=int, default=3000)
+    parser.add_argument("--height", type=int, default=4000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = Path(tmp) / "set"
+        source.mkdir()
+        _make_images(source, args.images, (args.width, args.height))
+        thumbnail.THUMBNAIL_DIR = Path(tmp) / "thumbnails"
+        engine = create_engine("sqlite://")
+        Base.metadata.create_all(engine)
+        with Session(engine) as db:
+            coser = Coser(name="bench")
+            db.add(coser)
+            db.flush()
+            db.add(Cosplay(title="bench", coser_id=coser.id, dir_path=str(source)))
+            db.commit()
+
+        print(f"{'workers':>8} {'seconds':>10} {'images/s':>10}")
+        for workers in args.workers:
+            shutil.rmtree(thumbnail.THUMBNAIL_DIR, ignore_errors=True)
+            db = Session(engine)
+            db.query(ImageHash).delete()
+            db.commit()
+            cosplay = db.query(Cosplay).one()
+            if workers > 1:
+                # 先把子进程拉起来，不把启动时间计入
+                pool = thumbnail._get_pool(workers)
+                list(pool.map(abs, range(workers * 4)))
+            start = time.perf_counter()
+            count, _ = thumbnail.process_cosplay_images(cosplay, db, workers=workers)
+            elapsed = time.perf_counter() - start
+            db.close()
+            assert count == args.images
+            print(f"{workers:>8} {elapsed:>10.2f} {count / elapsed:>10.2f}")
+        thumbnail.shutdown_pool()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""命令行维护工具：python -m backend.cli <command> ...。"""
+
+import argparse
+import json
+
+from .database import SessionLocal, engine
+from .migrations import upgrade
+from .services.cosplay_counts import repair_cosplay_counts
+from .services.importer import import_library
+from .services.scanner import rescan_library
+
+
+def _print_progress(done: int, total: int) -> None:
+    print(f"\r{done}/{total}", end="", flush=True)
+
+
+def _cmd_import(args: argparse.Namespace) -> None:
+    with SessionLocal() as db:
+        stats = import_library(
+            db, args.root, batch_size=args.batch_size, progress=_print_progress
+        )
+    print()
+    print(json.dumps(stats, ensure_ascii=False))
+
+
+def _cmd_rescan(args: argparse.Namespace) -> None:
+    with SessionLocal() as db:
+        stats = rescan_library(db, full=args.full, progress=_print_progress)
+    print()
+    print(json.dumps(stats, ensure_ascii=False))
+
+
+def _cmd_repair_counts(args: argparse.Namespace) -> None:
+    with SessionLocal() as db:
+        fixed = repair_cosplay_counts(db)
+        db.commit()
+    print(json.dumps(fixed, ensure_ascii=False))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m backend.cli")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    cmd = commands.add_parser(
+        "import", help="import every <coser>/<set> directory under ROOT"
+    )
+    cmd.add_argument("root")
+    cmd.add_argument("--batch-size", type=int, default=500)
+    cmd.set_defaults(func=_cmd_import)
+
+    cmd = commands.add_parser(
+        "rescan", help="incrementally rescan every cosplay directory"
+    )
+    cmd.add_argument(
+        "--full", action="store_true", help="compare every file, ignoring dir mtime"
+    )
+    cmd.set_defaults(func=_cmd_rescan)
+
+    cmd = commands.add_parser(
+        "repair-counts", help="recompute cosplay counts of cosers and parodies"
+    )
+    cmd.set_defaults(func=_cmd_repair_counts)
+
+    args = parser.parse_args()
+    upgrade(engine)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,77 @@
-"""数据库连接与会话管理。"""
+"""数据库连接与会话管理。
+
+默认使用本地 SQLite 文件；COSEPIC_DATABASE_URL 可指向 PostgreSQL，多个 API 实例共用
+一个库。读写分两个连接池：GET 接口走只读会话，不会与写连接争用同一个池。
+
+SQLite 下写操作由单写锁串行化，busy_timeout 让后来的写者排队等待而不是立即报错；开启
+WAL 后，长时间的缩略图/哈希写事务不再阻塞图库浏览的读请求。
+"""
 
 from pathlib import Path
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, make_url
 from sqlalchemy.orm import DeclarativeBase, sessionmaker
 
+from . import config
+
 DATA_DIR = Path(__file__).resolve().parent.parent / "data"
 DATA_DIR.mkdir(parents=True, exist_ok=True)
 
-DATABASE_URL = f"sqlite:///{DATA_DIR / 'db.sqlite'}"
+DATABASE_URL = config.DATABASE_URL or f"sqlite:///{DATA_DIR / 'db.sqlite'}"
+
+SQLITE_PRAGMAS = {
+    "journal_mode": config.SQLITE_JOURNAL_MODE,
+    "synchronous": config.SQLITE_SYNCHRONOUS,
+    "mmap_size": config.SQLITE_MMAP_MB * 1024 * 1024,
+    # 负数表示以 KiB 为单位
+    "cache_size": -config.SQLITE_CACHE_MB * 1024,
+    "busy_timeout": config.SQLITE_BUSY_TIMEOUT_MS,
+}
+
+
+def create_db_engine(
+    url: str,
+    read_only: bool = False,
+    pragmas: dict[str, str | int] = SQLITE_PRAGMAS,
+) -> Engine:
+    """Pooled engine for ``url``, configured per backend on every new connection.
+
+    SQLite connections get ``pragmas``. ``read_only`` connections refuse writes
+    (``query_only`` on SQLite, ``default_transaction_read_only`` elsewhere), so a
+    stray write from a read session fails instead of taking a write lock.
+    """
+    sqlite = make_url(url).get_backend_name() == "sqlite"
+    engine = create_engine(
+        url,
+        connect_args={"check_same_thread": False} if sqlite else {},
+        pool_size=config.DB_POOL_SIZE,
+        max_overflow=config.DB_MAX_OVERFLOW,
+        pool_recycle=config.DB_POOL_RECYCLE_SECONDS,
+        # 服务端数据库的连接可能被中间的代理或服务端重启断开
+        pool_pre_ping=not sqlite,
+    )
+
+    @event.listens_for(engine, "connect")
+    def _configure(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        if sqlite:
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name} = {value}")
+            if read_only:
+                cursor.execute("PRAGMA query_only = ON")
+        elif read_only:
+            cursor.execute("SET default_transaction_read_only = on")
+            dbapi_connection.commit()
+        cursor.close()
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+    return engine
+
+
+engine = create_db_engine(DATABASE_URL)
+read_engine = create_db_engine(DATABASE_URL, read_only=True)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
 
 
 class Base(DeclarativeBase):
@@ -25,3 +85,12 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+def get_read_db():
+    """FastAPI 依赖注入：获取只读数据库会话，供不修改数据的 GET 接口使用。"""
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
@@ -1,12 +1,33 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
-from .database import Base, engine
-from .routers import admin, cosers, cosplays, files, parodies
+from .database import engine
+from .migrations import upgrade
+from .routers import admin, cosers, cosplays, files, parodies, search
+from .services import file_io, jobs, phash_index, watcher
+
+upgrade(engine)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 先开始构建 pHash 索引：构建期间任务提交的哈希会在构建完成后补进索引
+    phash_index.warm_phash_index()
+    jobs.start_workers()
+    watcher.start_watcher()
+    yield
+    watcher.stop_watcher()
+    jobs.stop_workers()
+
+    from .services.thumbnail import shutdown_pool
+
+    shutdown_pool()
+    file_io.shutdown()
 
-Base.metadata.create_all(bind=engine)
 
-app = FastAPI(title="Cosepic", version="0.1.0")
+app = FastAPI(title="Cosepic", version="0.1.0", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -21,6 +42,7 @@ app.include_router(cosers.router, prefix="/api/cosers", tags=["cosers"])
 app.include_router(parodies.router, prefix="/api/parodies", tags=["parodies"])
 app.include_router(admin.router, prefix="/api/admin", tags=["admin"])
 app.include_router(files.router, prefix="/api/files", tags=["files"])
+app.include_router(search.router, prefix="/api/search", tags=["search"])
 
 
 @app.get("/api/health")
@@ -0,0 +1,290 @@
+"""轻量 schema 迁移：在已有数据库上补齐新增的列和索引，并回填派生数据。
+
+新增列必须可为空或带 server_default，否则无法在已有表上 ADD COLUMN。新增列和索引由
+模型自动推导；需要先处理数据的变更写成编号迁移（_MIGRATIONS）。
+"""
+
+import os
+import shutil
+from collections import Counter
+from pathlib import Path
+
+from sqlalchemy import bindparam, inspect, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.schema import CreateColumn
+
+from . import models  # noqa: F401 — 注册全部模型
+from .database import Base
+from .services import thumbnail, thumbnail_cache
+from .services.cosplay_counts import repair_cosplay_counts
+from .services.phash_index import phash_to_int
+from .services.search import create_search_index
+from .services.scanner import (
+    media_kind,
+    media_version,
+    natural_sort_key,
+    normalize_dir_path,
+)
+
+_BATCH_SIZE = 10000
+
+
+def _add_missing_columns(conn: Connection) -> set[str]:
+    """Returns the added columns as ``table.column``."""
+    inspector = inspect(conn)
+    added = set()
+    for table in Base.metadata.sorted_tables:
+        existing_columns = {c["name"] for c in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing_columns:
+                ddl = CreateColumn(column).compile(dialect=conn.dialect)
+                conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {ddl}"))
+                added.add(f"{table.name}.{column.name}")
+    return added
+
+
+def _add_missing_indexes(conn: Connection) -> None:
+    inspector = inspect(conn)
+    for table in Base.metadata.sorted_tables:
+        existing_indexes = {i["name"] for i in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing_indexes:
+                index.create(conn)
+
+
+def _dedupe_image_hashes(conn: Connection) -> None:
+    # 旧版本可能对同一张图重复计算过哈希；建唯一索引前只保留最新的一行
+    conn.execute(
+        text(
+            "DELETE FROM image_hashes WHERE id NOT IN"
+            " (SELECT MAX(id) FROM image_hashes GROUP BY cosplay_id, filename)"
+        )
+    )
+
+
+def _drop_shared_thumbnails(conn: Connection) -> None:
+    # 旧版本按主文件名命名预生成的缩略图，同一图集的 a.jpg 和 a.png 在清单里指向同一个
+    # 文件且无法判断归属：删掉这些行和文件，按完整文件名重新生成
+    shared = "SELECT path FROM thumbnails GROUP BY path HAVING COUNT(*) > 1"
+    paths = conn.scalars(text(shared)).all()
+    if paths:
+        conn.execute(text(f"DELETE FROM thumbnails WHERE path IN ({shared})"))
+        for path in paths:
+            (thumbnail.THUMBNAIL_DIR / path).unlink(missing_ok=True)
+
+
+def _adopt_legacy_thumbnails(conn: Connection) -> None:
+    # 缩略图清单出现前生成的 400px AVIF 只在这里一次性记入清单，之后处理任务只认清单。
+    # cosplay id 会被复用，先删掉已删除图集留下的目录，免得新图集接管旧图
+    root = thumbnail.THUMBNAIL_DIR
+    cosplays = dict(conn.execute(text("SELECT id, dir_path FROM cosplays")).all())
+    for parent in (root, root / "cache"):
+        if parent.is_dir():
+            for entry in parent.iterdir():
+                if entry.name.isdigit() and int(entry.name) not in cosplays:
+                    shutil.rmtree(entry, ignore_errors=True)
+
+    recorded = set(
+        conn.execute(
+            text(
+                "SELECT cosplay_id, filename FROM thumbnails"
+                " WHERE max_width = :width AND format = 'avif'"
+            ),
+            {"width": thumbnail.THUMBNAIL_WIDTH},
+        ).all()
+    )
+    rows = []
+    for cosplay_id, dir_path in cosplays.items():
+        if not (root / str(cosplay_id)).is_dir():
+            continue
+        try:
+            with os.scandir(dir_path) as entries:
+                images = [
+                    (entry.name, entry.stat())
+                    for entry in entries
+                    if media_kind(entry.name) == "image" and entry.is_file()
+                ]
+        except OSError:
+            continue
+        # 按主文件名命名的旧缩略图，只有主文件名在图集内唯一时才能确定归属
+        stems = Counter(Path(filename).stem for filename, _ in images)
+        for filename, st in images:
+            if (cosplay_id, filename) in recorded:
+                continue
+            path = thumbnail.default_thumbnail_path(cosplay_id, filename)
+            if not path.exists() and stems[Path(filename).stem] == 1:
+                path = thumbnail.legacy_thumbnail_path(cosplay_id, filename)
+            if not path.exists():
+                continue
+            version = media_version(st.st_mtime_ns, st.st_size)
+            try:
+                rows.append(
+                    thumbnail.manifest_row(
+                        cosplay_id,
+                        filename,
+                        thumbnail.THUMBNAIL_WIDTH,
+                        "avif",
+                        path,
+                        version,
+                    )
+                )
+            except OSError:
+                # 写了一半的文件：留给处理任务重新生成
+                continue
+    if rows:
+        conn.execute(
+            text(
+                "INSERT INTO thumbnails (cosplay_id, filename, max_width, format,"
+                " path, width, height, size, version) VALUES (:cosplay_id,"
+                " :filename, :max_width, :format, :path, :width, :height, :size,"
+                " :version)"
+            ),
+            rows,
+        )
+
+
+def _unique_cosplay_dirs(conn: Connection) -> None:
+    # 旧版本原样保存 dir_path，同一目录可能以不同写法（相对路径、结尾斜杠、符号链接）
+    # 建过多个图集。建唯一索引前统一成规范路径，重复的只保留最早建的一个
+    kept: set[str] = set()
+    renamed, duplicates = [], []
+    for row in conn.execute(text("SELECT id, dir_path FROM cosplays ORDER BY id")):
+        dir_path = normalize_dir_path(row.dir_path)
+        if dir_path in kept:
+            duplicates.append(row.id)
+            continue
+        kept.add(dir_path)
+        if dir_path != row.dir_path:
+            renamed.append({"id": row.id, "dir_path": dir_path})
+    if duplicates:
+        in_ids = bindparam("ids", duplicates, expanding=True)
+        for table in ("image_hashes", "media_files", "thumbnails"):
+            conn.execute(
+                text(f"DELETE FROM {table} WHERE cosplay_id IN :ids").bindparams(in_ids)
+            )
+        conn.execute(text("DELETE FROM cosplays WHERE id IN :ids").bindparams(in_ids))
+        repair_cosplay_counts(conn)
+        for cosplay_id in duplicates:
+            thumbnail_cache.remove_cosplay(cosplay_id)
+    if renamed:
+        conn.execute(
+            text("UPDATE cosplays SET dir_path = :dir_path WHERE id = :id"), renamed
+        )
+
+
+def _retired(conn: Connection) -> None:
+    # 已移出编号迁移的步骤：保留位置，后面的编号不变
+    pass
+
+
+# 按顺序编号的一次性迁移，处理补列补索引推导不出的变更（如建唯一索引前先清理数据）。
+# 已执行到第几步记录在 schema_version 表；只能在末尾追加，不能改动或删除已有条目。
+# 第 2 步原为建全文索引：FTS5 trigram 不可用时它什么也不做却被记为已执行，升级 SQLite
+# 后也不会再建，现改为 upgrade() 每次启动检查
+_MIGRATIONS = [
+    _dedupe_image_hashes,
+    _retired,
+    _drop_shared_thumbnails,
+    _adopt_legacy_thumbnails,
+    _unique_cosplay_dirs,
+]
+
+
+def _run_migrations(conn: Connection) -> None:
+    conn.execute(
+        text("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)")
+    )
+    version = conn.scalar(text("SELECT version FROM schema_version"))
+    if version is None:
+        version = 0
+        conn.execute(text("INSERT INTO schema_version (version) VALUES (0)"))
+    for migration in _MIGRATIONS[version:]:
+        migration(conn)
+    conn.execute(
+        text("UPDATE schema_version SET version = :v"), {"v": len(_MIGRATIONS)}
+    )
+
+
+def _backfill_phash_int(conn: Connection) -> None:
+    while True:
+        rows = conn.execute(
+            text("SELECT id, phash FROM image_hashes WHERE phash_int IS NULL LIMIT :n"),
+            {"n": _BATCH_SIZE},
+        ).all()
+        if not rows:
+            return
+        conn.execute(
+            text("UPDATE image_hashes SET phash_int = :value WHERE id = :id"),
+            [{"id": row.id, "value": phash_to_int(row.phash)} for row in rows],
+        )
+
+
+def _backfill_media_positions(conn: Connection) -> None:
+    cosplay_ids = conn.scalars(
+        text("SELECT DISTINCT cosplay_id FROM media_files WHERE position IS NULL")
+    ).all()
+    for cosplay_id in cosplay_ids:
+        rows = conn.execute(
+            text("SELECT id, filename, kind FROM media_files WHERE cosplay_id = :id"),
+            {"id": cosplay_id},
+        ).all()
+        params = []
+        for kind in ("image", "video"):
+            same_kind = sorted(
+                (row for row in rows if row.kind == kind),
+                key=lambda row: natural_sort_key(row.filename),
+            )
+            params += [
+                {"id": row.id, "position": position}
+                for position, row in enumerate(same_kind)
+            ]
+        conn.execute(
+            text("UPDATE media_files SET position = :position WHERE id = :id"), params
+        )
+
+
+def _backfill_cover_version(conn: Connection) -> None:
+    rows = conn.execute(
+        text(
+            "SELECT c.id, m.mtime_ns, m.size FROM cosplays c JOIN media_files m"
+            " ON m.cosplay_id = c.id AND m.filename = c.cover_path"
+            " WHERE c.cover_version IS NULL"
+        )
+    ).all()
+    if rows:
+        conn.execute(
+            text("UPDATE cosplays SET cover_version = :version WHERE id = :id"),
+            [
+                {"id": row.id, "version": media_version(row.mtime_ns, row.size)}
+                for row in rows
+            ],
+        )
+
+
+def _backfill_cosplay_counts(conn: Connection) -> None:
+    repair_cosplay_counts(conn)
+
+
+_BACKFILLS = [_backfill_phash_int, _backfill_media_positions, _backfill_cover_version]
+
+# 只在列刚被添加时执行一次的回填：这些列有默认值，无法靠 IS NULL 判断是否已回填
+_NEW_COLUMN_BACKFILLS = {
+    "cosers.cosplay_count": _backfill_cosplay_counts,
+    "parodies.cosplay_count": _backfill_cosplay_counts,
+}
+
+
+def upgrade(engine: Engine) -> None:
+    """建表、补列、执行编号迁移、补索引、建全文索引、回填；可重复执行。"""
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        added = _add_missing_columns(conn)
+        _run_migrations(conn)
+        _add_missing_indexes(conn)
+        create_search_index(conn)
+        for backfill in _BACKFILLS:
+            backfill(conn)
+        for backfill in {
+            _NEW_COLUMN_BACKFILLS[c] for c in added & _NEW_COLUMN_BACKFILLS.keys()
+        }:
+            backfill(conn)
@@ -2,7 +2,17 @@
 
 from datetime import datetime, timezone
 
-from sqlalchemy import DateTime, ForeignKey, Integer, String, Text
+from sqlalchemy import (
+    BigInteger,
+    Boolean,
+    DateTime,
+    ForeignKey,
+    Index,
+    Integer,
+    String,
+    Text,
+    UniqueConstraint,
+)
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from .database import Base
@@ -18,6 +28,10 @@ class Coser(Base):
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     name: Mapped[str] = mapped_column(String(255), nullable=False, unique=True)
     avatar_path: Mapped[str | None] = mapped_column(String(512), nullable=True)
+    # 冗余计数，由写路径维护；见 services/cosplay_counts.py
+    cosplay_count: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=0, server_default="0"
+    )
     created_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True), default=_utcnow
     )
@@ -30,6 +44,10 @@ class Parody(Base):
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     name: Mapped[str] = mapped_column(String(255), nullable=False, unique=True)
+    # 冗余计数，由写路径维护；见 services/cosplay_counts.py
+    cosplay_count: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=0, server_default="0"
+    )
     created_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True), default=_utcnow
     )
@@ -39,6 +57,14 @@ class Parody(Base):
 
 class Cosplay(Base):
     __tablename__ = "cosplays"
+    # 与列表排序 (created_at DESC, id DESC) 一致的复合索引，供游标分页使用
+    __table_args__ = (
+        Index("ix_cosplays_created_at_id", "created_at", "id"),
+        Index("ix_cosplays_coser_created_at_id", "coser_id", "created_at", "id"),
+        Index("ix_cosplays_parody_created_at_id", "parody_id", "created_at", "id"),
+        # 一个目录只对应一个图集；dir_path 存规范化后的绝对路径
+        Index("uq_cosplays_dir_path", "dir_path", unique=True),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     title: Mapped[str] = mapped_column(String(512), nullable=False)
@@ -49,10 +75,14 @@ class Cosplay(Base):
         Integer, ForeignKey("parodies.id"), nullable=True
     )
     cover_path: Mapped[str | None] = mapped_column(String(512), nullable=True)
+    # 封面文件的版本号（mtime + 大小），用于生成可长期缓存的封面 URL
+    cover_version: Mapped[str | None] = mapped_column(String(32), nullable=True)
     photo_count: Mapped[int] = mapped_column(Integer, default=0)
     video_count: Mapped[int] = mapped_column(Integer, default=0)
-    total_size: Mapped[int] = mapped_column(Integer, default=0)
+    total_size: Mapped[int] = mapped_column(BigInteger, default=0)
     dir_path: Mapped[str] = mapped_column(Text, nullable=False)
+    # 上次扫描时目录的 mtime；未变化时增量扫描直接跳过
+    dir_mtime_ns: Mapped[int | None] = mapped_column(BigInteger, nullable=True)
     created_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True), default=_utcnow
     )
@@ -62,10 +92,20 @@ class Cosplay(Base):
     image_hashes: Mapped[list["ImageHash"]] = relationship(
         back_populates="cosplay", cascade="all, delete-orphan"
     )
+    media_files: Mapped[list["MediaFile"]] = relationship(
+        back_populates="cosplay", cascade="all, delete-orphan"
+    )
+    thumbnails: Mapped[list["Thumbnail"]] = relationship(
+        back_populates="cosplay", cascade="all, delete-orphan"
+    )
 
 
 class ImageHash(Base):
     __tablename__ = "image_hashes"
+    # 每张图片一行；也是按图集查哈希、与 media_files 关联时走的索引
+    __table_args__ = (
+        Index("uq_image_hashes_cosplay_file", "cosplay_id", "filename", unique=True),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     cosplay_id: Mapped[int] = mapped_column(
@@ -73,6 +113,124 @@ class ImageHash(Base):
     )
     filename: Mapped[str] = mapped_column(String(512), nullable=False)
     phash: Mapped[str] = mapped_column(String(64), nullable=False, index=True)
+    # 同一 pHash 的有符号 64 位整数形式，供按位汉明距离批量计算
+    phash_int: Mapped[int | None] = mapped_column(BigInteger, nullable=True)
     blurhash: Mapped[str | None] = mapped_column(String(64), nullable=True)
 
     cosplay: Mapped["Cosplay"] = relationship(back_populates="image_hashes")
+
+
+class MediaFile(Base):
+    """图集目录的文件清单，用于增量扫描。"""
+
+    __tablename__ = "media_files"
+    __table_args__ = (
+        UniqueConstraint("cosplay_id", "filename", name="uq_media_files_cosplay_file"),
+        # 图片列表、封面回退按位置顺序读取，无需排序
+        Index("ix_media_files_cosplay_kind_position", "cosplay_id", "kind", "position"),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    cosplay_id: Mapped[int] = mapped_column(
+        Integer, ForeignKey("cosplays.id", ondelete="CASCADE"), nullable=False
+    )
+    filename: Mapped[str] = mapped_column(String(512), nullable=False)
+    kind: Mapped[str] = mapped_column(String(8), nullable=False)
+    size: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    mtime_ns: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    inode: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    # 同类文件（图片/视频）在图集内按文件名自然排序后的位置
+    position: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    # 以下为图片元数据，由处理任务解码时写入；文件变化后清空等待重新处理。
+    # width/height 是原图存储的像素尺寸，orientation 为 5-8 时显示时宽高互换；
+    # 视频只有 width/height，取自截取的封面帧
+    width: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    height: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    # EXIF Orientation（1-8），没有 EXIF 时为空
+    orientation: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    # Pillow 识别出的格式，如 JPEG、PNG、WEBP
+    format: Mapped[str | None] = mapped_column(String(16), nullable=True)
+    # 主色调，#rrggbb
+    dominant_color: Mapped[str | None] = mapped_column(String(7), nullable=True)
+    # 文件内容的 CRC-32，写入打包下载的 ZIP 头；图片在处理任务读文件时顺带计算，
+    # 视频由处理任务单独读一遍
+    crc32: Mapped[int | None] = mapped_column(BigInteger, nullable=True)
+    # 读不出来（例如没有读权限）的文件在当时的版本号；打包下载不含该文件，
+    # 文件变化前不再重试
+    crc32_failed_version: Mapped[str | None] = mapped_column(String(64), nullable=True)
+    # ffmpeg 截不出封面帧的视频在当时的版本号；文件变化前处理任务不再重试
+    poster_failed_version: Mapped[str | None] = mapped_column(String(64), nullable=True)
+
+    cosplay: Mapped["Cosplay"] = relationship(back_populates="media_files")
+
+
+class Thumbnail(Base):
+    """缩略图清单：原图每个已生成的尺寸档位/格式一行，文件接口据此直接定位缩略图。"""
+
+    __tablename__ = "thumbnails"
+    __table_args__ = (
+        UniqueConstraint(
+            "cosplay_id",
+            "filename",
+            "max_width",
+            "format",
+            name="uq_thumbnails_variant",
+        ),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    cosplay_id: Mapped[int] = mapped_column(
+        Integer, ForeignKey("cosplays.id", ondelete="CASCADE"), nullable=False
+    )
+    # 原图文件名
+    filename: Mapped[str] = mapped_column(String(512), nullable=False)
+    # 请求的宽度档位；原图更窄时不放大，实际宽度见 width
+    max_width: Mapped[int] = mapped_column(Integer, nullable=False)
+    format: Mapped[str] = mapped_column(String(8), nullable=False)
+    # 相对 THUMBNAIL_DIR 的路径；LRU 淘汰磁盘缓存时按它删行
+    path: Mapped[str] = mapped_column(String(1024), nullable=False, index=True)
+    width: Mapped[int] = mapped_column(Integer, nullable=False)
+    height: Mapped[int] = mapped_column(Integer, nullable=False)
+    size: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    # 生成时原图的版本号，与文件清单不一致说明原图已变
+    version: Mapped[str] = mapped_column(String(64), nullable=False)
+
+    cosplay: Mapped["Cosplay"] = relationship(back_populates="thumbnails")
+
+
+class Job(Base):
+    """后台任务：缩略图、哈希等耗时处理由 worker 异步执行。"""
+
+    __tablename__ = "jobs"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    kind: Mapped[str] = mapped_column(String(64), nullable=False)
+    cosplay_id: Mapped[int | None] = mapped_column(Integer, nullable=True, index=True)
+    payload: Mapped[str | None] = mapped_column(Text, nullable=True)
+    status: Mapped[str] = mapped_column(
+        String(16), nullable=False, default="queued", index=True
+    )
+    progress: Mapped[int] = mapped_column(Integer, default=0)
+    total: Mapped[int] = mapped_column(Integer, default=0)
+    attempts: Mapped[int] = mapped_column(Integer, default=0)
+    max_attempts: Mapped[int] = mapped_column(Integer, default=3)
+    cancel_requested: Mapped[bool] = mapped_column(Boolean, default=False)
+    result: Mapped[str | None] = mapped_column(Text, nullable=True)
+    error: Mapped[str | None] = mapped_column(Text, nullable=True)
+    not_before: Mapped[datetime | None] = mapped_column(
+        DateTime(timezone=True), nullable=True
+    )
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), default=_utcnow
+    )
+    started_at: Mapped[datetime | None] = mapped_column(
+        DateTime(timezone=True), nullable=True
+    )
+    # 领取任务的进程与它最近一次续租的时间；租约过期的 running 任务才会被放回队列
+    owner: Mapped[str | None] = mapped_column(String(128), nullable=True)
+    heartbeat_at: Mapped[datetime | None] = mapped_column(
+        DateTime(timezone=True), nullable=True
+    )
+    finished_at: Mapped[datetime | None] = mapped_column(
+        DateTime(timezone=True), nullable=True
+    )
@@ -0,0 +1,130 @@
+"""列表分页：OFFSET 分页之外提供游标（keyset）分页，总数走短期缓存。
+
+游标记住上一页最后一行的排序键，下一页直接沿复合索引定位，深翻页不再扫描并丢弃前面
+的所有行。
+"""
+
+import base64
+import binascii
+import json
+import math
+from datetime import datetime
+
+from fastapi import HTTPException
+from sqlalchemy import ColumnElement, literal, tuple_
+from sqlalchemy.orm import Query
+
+from .services.cache import TTLCache
+
+_COUNT_TTL_SECONDS = 60
+_counts: TTLCache[str, int] = TTLCache(maxsize=1024, ttl=_COUNT_TTL_SECONDS)
+
+
+def encode_cursor(*values) -> str:
+    payload = json.dumps(
+        [v.isoformat() if isinstance(v, datetime) else v for v in values]
+    )
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, columns: list[ColumnElement]) -> list:
+    """Decode ``cursor`` into one value per column, typed like the column."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+        if not isinstance(values, list) or len(values) != len(columns):
+            raise ValueError(cursor)
+        return [
+            (
+                datetime.fromisoformat(value)
+                if column.type.python_type is datetime
+                else column.type.python_type(value)
+            )
+            for column, value in zip(columns, values)
+        ]
+    except (ValueError, TypeError, binascii.Error):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def keyset_page(
+    query: Query,
+    columns: list[ColumnElement],
+    cursor: str,
+    limit: int,
+    descending: bool = False,
+) -> tuple[list, str | None]:
+    """One page of ``query`` ordered by ``columns``, starting after ``cursor``.
+
+    ``columns`` must end with a unique column (the id) so the order is total.
+    An empty ``cursor`` means the first page. Returns the rows and the cursor of
+    the next page, or ``None`` on the last one.
+    """
+    if cursor:
+        values = decode_cursor(cursor, columns)
+        key = tuple_(*columns)
+        bound = tuple_(*(literal(v, c.type) for v, c in zip(values, columns)))
+        query = query.filter(key < bound if descending else key > bound)
+    order = [c.desc() if descending else c.asc() for c in columns]
+    rows = query.order_by(*order).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(*(getattr(rows[-1], c.key) for c in columns))
+    return rows, next_cursor
+
+
+def paginate(
+    query: Query,
+    columns: list[ColumnElement],
+    *,
+    page: int,
+    page_size: int,
+    cursor: str | None,
+    include_total: bool,
+    count_key: str,
+    descending: bool = False,
+) -> tuple[list, dict]:
+    """Page through ``query`` by OFFSET, or by keyset when ``cursor`` is given.
+
+    Returns the rows and the remaining ``PaginatedResponse`` fields. In cursor
+    mode the total is only counted when ``include_total`` is set.
+    """
+    if cursor is not None:
+        items, next_cursor = keyset_page(
+            query, columns, cursor, page_size, descending=descending
+        )
+        total = cached_count(count_key, query) if include_total else None
+        page = None
+    else:
+        total = cached_count(count_key, query)
+        order = [c.desc() if descending else c.asc() for c in columns]
+        items = (
+            query.order_by(*order).offset((page - 1) * page_size).limit(page_size).all()
+        )
+        next_cursor = None
+        if items and page * page_size < total:
+            next_cursor = encode_cursor(*(getattr(items[-1], c.key) for c in columns))
+    total_pages = None
+    if total is not None:
+        total_pages = math.ceil(total / page_size) if total > 0 else 1
+    return items, {
+        "total": total,
+        "page": page,
+        "page_size": page_size,
+        "total_pages": total_pages,
+        "next_cursor": next_cursor,
+    }
+
+
+def cached_count(key: str, query: Query) -> int:
+    """``query.count()``, remembered for up to a minute under ``key``."""
+    total = _counts.get(key)
+    if total is None:
+        total = query.count()
+        _counts.put(key, total)
+    return total
+
+
+def invalidate_counts() -> None:
+    """Forget cached totals; called after anything is created or deleted."""
+    _counts.invalidate()
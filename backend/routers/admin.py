@@ -1,51 +1,30 @@
 from pathlib import Path
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 
 from ..database import get_db
-from ..models import Coser, Cosplay, ImageHash, Parody
+from ..models import Coser, Cosplay, ImageHash, Job, Parody
+from ..pagination import invalidate_counts
 from ..schemas import (
     CoserCreate,
     CoserOut,
     CosplayCreate,
+    CosplayCreatedOut,
     CosplayOut,
     CosplayUpdate,
+    JobOut,
+    LibraryImport,
     ParodyCreate,
     ParodyOut,
 )
+from ..services import importer  # noqa: F401 — 注册 import_library 任务
+from ..services import jobs, path_cache, scanner, thumbnail_cache
+from ..services.cosplay_counts import adjust_cosplay_counts, repair_cosplay_counts
+from ..services.phash_index import get_phash_index, unindex_phashes
 
 router = APIRouter()
 
-IMAGE_EXTENSIONS = {".avif", ".jpg", ".jpeg", ".png", ".webp", ".gif", ".bmp"}
-VIDEO_EXTENSIONS = {".mp4", ".mkv", ".avi", ".mov", ".webm"}
-
-
-def _scan_dir_stats(dir_path: str) -> tuple[int, int, int, str | None]:
-    p = Path(dir_path)
-    if not p.is_dir():
-        return 0, 0, 0, None
-
-    photo_count = 0
-    video_count = 0
-    total_size = 0
-    first_image: str | None = None
-
-    for f in sorted(p.iterdir(), key=lambda x: x.name):
-        if not f.is_file():
-            continue
-        suffix = f.suffix.lower()
-        if suffix in IMAGE_EXTENSIONS:
-            photo_count += 1
-            total_size += f.stat().st_size
-            if first_image is None:
-                first_image = f.name
-        elif suffix in VIDEO_EXTENSIONS:
-            video_count += 1
-            total_size += f.stat().st_size
-
-    return photo_count, video_count, total_size, first_image
-
 
 @router.post("/cosers", response_model=CoserOut)
 def create_coser(data: CoserCreate, db: Session = Depends(get_db)):
@@ -55,10 +34,9 @@ def create_coser(data: CoserCreate, db: Session = Depends(get_db)):
     coser = Coser(name=data.name, avatar_path=data.avatar_path)
     db.add(coser)
     db.commit()
+    invalidate_counts()
     db.refresh(coser)
-    data_dict = CoserOut.model_validate(coser).model_dump()
-    data_dict["cosplay_count"] = 0
-    return CoserOut(**data_dict)
+    return CoserOut.model_validate(coser)
 
 
 @router.put("/cosers/{coser_id}", response_model=CoserOut)
@@ -69,6 +47,8 @@ def update_coser(coser_id: int, data: CoserCreate, db: Session = Depends(get_db)
     coser.name = data.name
     coser.avatar_path = data.avatar_path
     db.commit()
+    invalidate_counts()
+    path_cache.invalidate_coser(coser_id)
     db.refresh(coser)
     return CoserOut.model_validate(coser)
 
@@ -86,6 +66,8 @@ def delete_coser(coser_id: int, db: Session = Depends(get_db)):
         )
     db.delete(coser)
     db.commit()
+    invalidate_counts()
+    path_cache.invalidate_coser(coser_id)
     return {"ok": True}
 
 
@@ -97,10 +79,9 @@ def create_parody(data: ParodyCreate, db: Session = Depends(get_db)):
     parody = Parody(name=data.name)
     db.add(parody)
     db.commit()
+    invalidate_counts()
     db.refresh(parody)
-    data_dict = ParodyOut.model_validate(parody).model_dump()
-    data_dict["cosplay_count"] = 0
-    return ParodyOut(**data_dict)
+    return ParodyOut.model_validate(parody)
 
 
 @router.put("/parodies/{parody_id}", response_model=ParodyOut)
@@ -110,6 +91,7 @@ def update_parody(parody_id: int, data: ParodyCreate, db: Session = Depends(get_
         raise HTTPException(status_code=404, detail="Parody not found")
     parody.name = data.name
     db.commit()
+    invalidate_counts()
     db.refresh(parody)
     return ParodyOut.model_validate(parody)
 
@@ -122,10 +104,11 @@ def delete_parody(parody_id: int, db: Session = Depends(get_db)):
     db.query(Cosplay).filter(Cosplay.parody_id == parody_id).update({"parody_id": None})
     db.delete(parody)
     db.commit()
+    invalidate_counts()
     return {"ok": True}
 
 
-@router.post("/cosplays", response_model=CosplayOut)
+@router.post("/cosplays", response_model=CosplayCreatedOut)
 def create_cosplay(data: CosplayCreate, db: Session = Depends(get_db)):
     coser = db.query(Coser).filter(Coser.id == data.coser_id).first()
     if not coser:
@@ -134,32 +117,31 @@ def create_cosplay(data: CosplayCreate, db: Session = Depends(get_db)):
         parody = db.query(Parody).filter(Parody.id == data.parody_id).first()
         if not parody:
             raise HTTPException(status_code=404, detail="Parody not found")
-
-    photo_count, video_count, total_size, first_image = _scan_dir_stats(data.dir_path)
+    dir_path = scanner.normalize_dir_path(data.dir_path)
+    if db.query(Cosplay.id).filter(Cosplay.dir_path == dir_path).first():
+        raise HTTPException(
+            status_code=409, detail="A cosplay for this directory already exists"
+        )
 
     cosplay = Cosplay(
         title=data.title,
         coser_id=data.coser_id,
         parody_id=data.parody_id,
-        dir_path=data.dir_path,
-        photo_count=photo_count,
-        video_count=video_count,
-        total_size=total_size,
-        cover_path=first_image,
+        dir_path=dir_path,
     )
     db.add(cosplay)
+    db.flush()
+    adjust_cosplay_counts(db, cosplay.coser_id, cosplay.parody_id, 1)
+    scanner.sync_cosplay_files(db, cosplay)
     db.commit()
+    invalidate_counts()
     db.refresh(cosplay)
 
-    from ..services.thumbnail import (
-        generate_thumbnails_for_cosplay,
-        compute_phashes_for_cosplay,
-    )
-
-    generate_thumbnails_for_cosplay(cosplay)
-    compute_phashes_for_cosplay(cosplay, db)
+    job = jobs.enqueue(db, "process_cosplay", cosplay_id=cosplay.id)
 
-    return CosplayOut.model_validate(cosplay)
+    data = CosplayOut.model_validate(cosplay).model_dump()
+    data["job_id"] = job.id
+    return CosplayCreatedOut(**data)
 
 
 @router.put("/cosplays/{cosplay_id}", response_model=CosplayOut)
@@ -174,54 +156,63 @@ def update_cosplay(cosplay_id: int, data: CosplayUpdate, db: Session = Depends(g
         coser = db.query(Coser).filter(Coser.id == data.coser_id).first()
         if not coser:
             raise HTTPException(status_code=404, detail="Coser not found")
+        if data.coser_id != cosplay.coser_id:
+            adjust_cosplay_counts(db, cosplay.coser_id, None, -1)
+            adjust_cosplay_counts(db, data.coser_id, None, 1)
         cosplay.coser_id = data.coser_id
     if data.parody_id is not None:
         parody = db.query(Parody).filter(Parody.id == data.parody_id).first()
         if not parody:
             raise HTTPException(status_code=404, detail="Parody not found")
+        if data.parody_id != cosplay.parody_id:
+            adjust_cosplay_counts(db, None, cosplay.parody_id, -1)
+            adjust_cosplay_counts(db, None, data.parody_id, 1)
         cosplay.parody_id = data.parody_id
 
     db.commit()
+    invalidate_counts()
+    path_cache.invalidate_cosplay(cosplay_id)
     db.refresh(cosplay)
     return CosplayOut.model_validate(cosplay)
 
 
 @router.post("/cosplays/{cosplay_id}/rescan")
-def rescan_cosplay(cosplay_id: int, db: Session = Depends(get_db)):
+def rescan_cosplay(cosplay_id: int, full: bool = False, db: Session = Depends(get_db)):
+    """Sync the file manifest; only new or changed files get queued for processing."""
     cosplay = db.query(Cosplay).filter(Cosplay.id == cosplay_id).first()
     if not cosplay:
         raise HTTPException(status_code=404, detail="Cosplay not found")
 
-    photo_count, video_count, total_size, first_image = _scan_dir_stats(
-        cosplay.dir_path
-    )
-    cosplay.photo_count = photo_count
-    cosplay.video_count = video_count
-    cosplay.total_size = total_size
-    if first_image:
-        cosplay.cover_path = first_image
-    db.commit()
-    return {"ok": True, "photo_count": photo_count, "video_count": video_count}
+    result = scanner.rescan_cosplay(db, cosplay, full=full)
+    job_id = None
+    if result.added or result.changed:
+        job_id = jobs.enqueue(db, "process_cosplay", cosplay_id=cosplay.id).id
+    return {
+        "ok": True,
+        "photo_count": cosplay.photo_count,
+        "video_count": cosplay.video_count,
+        "added": len(result.added),
+        "changed": len(result.changed),
+        "removed": len(result.removed),
+        "job_id": job_id,
+    }
+
 
+@router.post("/rescan", response_model=JobOut, status_code=202)
+def rescan_library(full: bool = False, db: Session = Depends(get_db)):
+    """Queue an incremental rescan of every cosplay."""
+    job = jobs.enqueue(db, "rescan_library", payload={"full": full})
+    return JobOut.model_validate(job)
 
-@router.post("/cosplays/{cosplay_id}/generate-thumbnails")
+
+@router.post("/cosplays/{cosplay_id}/generate-thumbnails", status_code=202)
 def generate_thumbnails(cosplay_id: int, db: Session = Depends(get_db)):
     cosplay = db.query(Cosplay).filter(Cosplay.id == cosplay_id).first()
     if not cosplay:
         raise HTTPException(status_code=404, detail="Cosplay not found")
 
-    from ..services.thumbnail import (
-        compute_phashes_for_cosplay,
-        generate_thumbnails_for_cosplay,
-    )
-
-    thumb_count = generate_thumbnails_for_cosplay(cosplay)
-    hash_count = compute_phashes_for_cosplay(cosplay, db)
-    return {
-        "ok": True,
-        "thumbnails_generated": thumb_count,
-        "hashes_computed": hash_count,
-    }
+    job = jobs.enqueue(db, "process_cosplay", cosplay_id=cosplay.id)
+    return {"ok": True, "job_id": job.id}
 
 
 @router.delete("/cosplays/{cosplay_id}")
@@ -229,98 +220,138 @@ def delete_cosplay(cosplay_id: int, db: Session = Depends(get_db)):
     cosplay = db.query(Cosplay).filter(Cosplay.id == cosplay_id).first()
     if not cosplay:
         raise HTTPException(status_code=404, detail="Cosplay not found")
+    phashes = [
+        row.phash
+        for row in db.query(ImageHash.phash)
+        .filter(ImageHash.cosplay_id == cosplay_id)
+        .all()
+    ]
     db.query(ImageHash).filter(ImageHash.cosplay_id == cosplay_id).delete()
+    adjust_cosplay_counts(db, cosplay.coser_id, cosplay.parody_id, -1)
     db.delete(cosplay)
     db.commit()
+    invalidate_counts()
+    unindex_phashes(cosplay_id, phashes)
+    path_cache.invalidate_cosplay(cosplay_id)
+    thumbnail_cache.remove_cosplay(cosplay_id)
     return {"ok": True}
 
 
-def _hamming_distance(h1: str, h2: str) -> int:
-    """Calculate Hamming distance between two hex pHashes."""
-    if len(h1) != len(h2):
-        return 64
-    return sum(c1 != c2 for c1, c2 in zip(h1, h2))
+@router.post("/repair-counts")
+def repair_counts(db: Session = Depends(get_db)):
+    """Recompute the denormalized cosplay counts of every coser and parody."""
+    fixed = repair_cosplay_counts(db)
+    db.commit()
+    return {"ok": True, "fixed": fixed}
+
+
+@router.post("/import", response_model=JobOut, status_code=202)
+def import_library(data: LibraryImport, db: Session = Depends(get_db)):
+    """Queue an import of every <coser>/<set> directory under ``root``."""
+    if not Path(data.root).is_dir():
+        raise HTTPException(status_code=400, detail="Import root is not a directory")
+    job = jobs.enqueue(
+        db,
+        "import_library",
+        payload={"root": data.root, "batch_size": data.batch_size},
+    )
+    return JobOut.model_validate(job)
+
+
+@router.get("/jobs", response_model=list[JobOut])
+def list_jobs(
+    status: str | None = None,
+    cosplay_id: int | None = None,
+    limit: int = Query(50, ge=1, le=500),
+    db: Session = Depends(get_db),
+):
+    query = db.query(Job)
+    if status is not None:
+        query = query.filter(Job.status == status)
+    if cosplay_id is not None:
+        query = query.filter(Job.cosplay_id == cosplay_id)
+    items = query.order_by(Job.id.desc()).limit(limit).all()
+    return [JobOut.model_validate(job) for job in items]
+
+
+@router.get("/jobs/{job_id}", response_model=JobOut)
+def get_job(job_id: int, db: Session = Depends(get_db)):
+    job = db.query(Job).filter(Job.id == job_id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return JobOut.model_validate(job)
+
+
+@router.post("/jobs/{job_id}/cancel", response_model=JobOut)
+def cancel_job(job_id: int, db: Session = Depends(get_db)):
+    job = db.query(Job).filter(Job.id == job_id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return JobOut.model_validate(jobs.cancel(db, job))
+
+
+def _dedup_images(db: Session, phashes: set[str]) -> dict[str, list[dict]]:
+    """Load the image rows behind the reported hashes, grouped by pHash."""
+    images: dict[str, list[dict]] = {phash: [] for phash in phashes}
+    if not phashes:
+        return images
+    rows = (
+        db.query(ImageHash, Cosplay.title)
+        .outerjoin(Cosplay, Cosplay.id == ImageHash.cosplay_id)
+        .filter(ImageHash.phash.in_(phashes))
+        .order_by(ImageHash.id)
+        .all()
+    )
+    for item, title in rows:
+        images[item.phash].append(
+            {
+                "id": item.id,
+                "cosplay_id": item.cosplay_id,
+                "cosplay_title": title,
+                "filename": item.filename,
+            }
+        )
+    return images
 
 
 @router.get("/dedup/find")
 def find_duplicates(threshold: int = 10, db: Session = Depends(get_db)):
     """Find potential duplicate images across cosplays based on pHash."""
-    from ..models import ImageHash, Cosplay
-
-    hashes = db.query(ImageHash).all()
-
-    # Group hashes by value
-    hash_map: dict[str, list[ImageHash]] = {}
-    for h in hashes:
-        if h.phash not in hash_map:
-            hash_map[h.phash] = []
-        hash_map[h.phash].append(h)
-
-    # Find exact duplicates (same pHash)
-    duplicates = []
-    for phash, items in hash_map.items():
-        if len(items) > 1:
-            # Get cosplay info for each
-            cosplay_ids = list(set([item.cosplay_id for item in items]))
-            if len(cosplay_ids) > 1:
-                cosplays = db.query(Cosplay).filter(Cosplay.id.in_(cosplay_ids)).all()
-                cosplay_map = {c.id: c for c in cosplays}
-                duplicates.append(
-                    {
-                        "type": "exact",
-                        "phash": phash,
-                        "images": [
-                            {
-                                "id": item.id,
-                                "cosplay_id": item.cosplay_id,
-                                "cosplay_title": cosplay_map[item.cosplay_id].title
-                                if item.cosplay_id in cosplay_map
-                                else None,
-                                "filename": item.filename,
-                            }
-                            for item in items
-                        ],
-                    }
-                )
-
-    # Find similar hashes (within threshold)
-    similar_pairs = []
-    hash_list = list(hash_map.keys())
-    for i, h1 in enumerate(hash_list):
-        for h2 in hash_list[i + 1 :]:
-            dist = _hamming_distance(h1, h2)
-            if dist <= threshold:
-                items1 = hash_map[h1]
-                items2 = hash_map[h2]
-                cosplay_ids = list(set([item.cosplay_id for item in items1 + items2]))
-                if len(cosplay_ids) > 1:
-                    cosplays = (
-                        db.query(Cosplay).filter(Cosplay.id.in_(cosplay_ids)).all()
-                    )
-                    cosplay_map = {c.id: c for c in cosplays}
-                    similar_pairs.append(
-                        {
-                            "type": "similar",
-                            "distance": dist,
-                            "phash1": h1,
-                            "phash2": h2,
-                            "images": [
-                                {
-                                    "id": item.id,
-                                    "cosplay_id": item.cosplay_id,
-                                    "cosplay_title": cosplay_map[item.cosplay_id].title
-                                    if item.cosplay_id in cosplay_map
-                                    else None,
-                                    "filename": item.filename,
-                                }
-                                for item in items1 + items2
-                            ],
-                        }
-                    )
+    index = get_phash_index(db)
+
+    # Exact duplicates: one pHash referenced by more than one cosplay
+    exact = list(index.exact_duplicates())
+
+    # Similar hashes: multi-index hashing pairs up only hashes that share a nearby
+    # 16-bit segment bucket, instead of comparing every pair
+    similar = [
+        (h1, h2, dist)
+        for h1, h2, dist in index.pairs(threshold)
+        if len(index.cosplay_ids(h1) | index.cosplay_ids(h2)) > 1
+    ]
+
+    shown_exact = exact[:20]
+    shown_similar = similar[:20]
+    images = _dedup_images(
+        db,
+        set(shown_exact) | {h for h1, h2, _ in shown_similar for h in (h1, h2)},
+    )
 
     return {
-        "exact_duplicates": duplicates[:20],
-        "similar_pairs": similar_pairs[:20],
-        "exact_count": len(duplicates),
-        "similar_count": len(similar_pairs),
+        "exact_duplicates": [
+            {"type": "exact", "phash": phash, "images": images[phash]}
+            for phash in shown_exact
+        ],
+        "similar_pairs": [
+            {
+                "type": "similar",
+                "distance": dist,
+                "phash1": h1,
+                "phash2": h2,
+                "images": images[h1] + images[h2],
+            }
+            for h1, h2, dist in shown_similar
+        ],
+        "exact_count": len(exact),
+        "similar_count": len(similar),
     }
@@ -1,38 +1,18 @@
-import math
-import re
-from pathlib import Path
-
 from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy import func
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import and_
 from sqlalchemy.orm import Session, joinedload
 
-from ..database import get_db
-from ..models import Cosplay, ImageHash, Coser, Parody
-from ..schemas import CoserOut, CosplayOut, PaginatedResponse, ParodyOut
+from ..database import ReadSessionLocal, SessionLocal, get_read_db
+from ..models import Cosplay, ImageHash, MediaFile, Thumbnail
+from ..pagination import paginate
+from ..schemas import CosplayOut, PaginatedResponse
+from ..services import file_io
+from ..services.scanner import ensure_manifest, media_version
+from ..services.thumbnail import PLACEHOLDER_TILE, THUMBNAIL_WIDTH, placeholder_sprite
 
 router = APIRouter()
 
-IMAGE_EXTENSIONS = {".avif", ".jpg", ".jpeg", ".png", ".webp", ".gif", ".bmp"}
-VIDEO_EXTENSIONS = {".mp4", ".mkv", ".avi", ".mov", ".webm"}
-
-
-def _natural_sort_key(s: str) -> list:
-    return [
-        int(part) if part.isdigit() else part.lower() for part in re.split(r"(\d+)", s)
-    ]
-
-
-def _coser_out_with_count(coser: Coser, count: int) -> CoserOut:
-    data = CoserOut.model_validate(coser).model_dump()
-    data["cosplay_count"] = count
-    return CoserOut(**data)
-
-
-def _parody_out_with_count(parody: Parody, count: int) -> ParodyOut:
-    data = ParodyOut.model_validate(parody).model_dump()
-    data["cosplay_count"] = count
-    return ParodyOut(**data)
-
 
 @router.get("/", response_model=PaginatedResponse)
 def list_cosplays(
@@ -40,7 +20,13 @@ def list_cosplays(
     page_size: int = Query(20, ge=1, le=100),
     coser_id: int | None = None,
     parody_id: int | None = None,
-    db: Session = Depends(get_db),
+    cursor: str | None = Query(
+        None, description="Keyset pagination; pass an empty value for the first page"
+    ),
+    include_total: bool = Query(
+        False, description="In cursor mode, also return the (cached) total"
+    ),
+    db: Session = Depends(get_read_db),
 ):
     query = db.query(Cosplay).options(
         joinedload(Cosplay.coser), joinedload(Cosplay.parody)
@@ -50,57 +36,25 @@ def list_cosplays(
     if parody_id is not None:
         query = query.filter(Cosplay.parody_id == parody_id)
 
-    total = query.count()
-    total_pages = math.ceil(total / page_size) if total > 0 else 1
-    items = (
-        query.order_by(Cosplay.created_at.desc())
-        .offset((page - 1) * page_size)
-        .limit(page_size)
-        .all()
-    )
-
-    coser_counts: dict[int, int] = {}
-    for row in (
-        db.query(Coser.id, func.count(Cosplay.id))
-        .outerjoin(Cosplay)
-        .group_by(Coser.id)
-        .all()
-    ):
-        coser_counts[row[0]] = row[1]
-
-    parody_counts: dict[int, int] = {}
-    for row in (
-        db.query(Parody.id, func.count(Cosplay.id))
-        .outerjoin(Cosplay)
-        .group_by(Parody.id)
-        .all()
-    ):
-        parody_counts[row[0]] = row[1]
-
-    result_items = []
-    for item in items:
-        data = CosplayOut.model_validate(item).model_dump()
-        if item.coser:
-            data["coser"] = _coser_out_with_count(
-                item.coser, coser_counts.get(item.coser_id, 0)
-            )
-        if item.parody and item.parody_id is not None:
-            data["parody"] = _parody_out_with_count(
-                item.parody, parody_counts.get(item.parody_id, 0)
-            )
-        result_items.append(CosplayOut(**data))
-
-    return PaginatedResponse(
-        items=result_items,
-        total=total,
+    items, meta = paginate(
+        query,
+        [Cosplay.created_at, Cosplay.id],
         page=page,
         page_size=page_size,
-        total_pages=total_pages,
+        cursor=cursor,
+        include_total=include_total,
+        count_key=f"cosplays:{coser_id}:{parody_id}",
+        descending=True,
     )
 
+    # 嵌套的 coser/parody 自带冗余的 cosplay_count，无需再做全表聚合
+    result_items = [CosplayOut.model_validate(item) for item in items]
+
+    return PaginatedResponse(items=result_items, **meta)
+
 
 @router.get("/{cosplay_id}", response_model=CosplayOut)
-def get_cosplay(cosplay_id: int, db: Session = Depends(get_db)):
+def get_cosplay(cosplay_id: int, db: Session = Depends(get_read_db)):
     cosplay = (
         db.query(Cosplay)
         .options(joinedload(Cosplay.coser), joinedload(Cosplay.parody))
@@ -118,31 +72,181 @@ from pydantic import BaseModel
 class ImageWithBlurhash(BaseModel):
     filename: str
     blurhash: str | None
+    # 文件版本号；作为 ?v= 拼进图片 URL 后可被浏览器永久缓存
+    version: str | None = None
+    # 默认缩略图的像素尺寸（宽高比与原图相同），来自缩略图清单；尚未生成时为空
+    width: int | None = None
+    height: int | None = None
+    # 以下来自文件清单；除 size 外都要等处理任务解码过才有值
+    size: int
+    original_width: int | None = None
+    original_height: int | None = None
+    orientation: int | None = None
+    format: str | None = None
+    dominant_color: str | None = None
+
+
+class ImagePlaceholders(BaseModel):
+    # 拼图版本号；拼进 /api/files/placeholders/{id}?v= 后可被浏览器永久缓存。还没有任何
+    # 图片算出 blurhash 时为空
+    version: str | None
+    tile_size: int
+    width: int
+    height: int
+    # 文件名 -> 该图片的占位小块在拼图中的左上角像素坐标 [x, y]
+    offsets: dict[str, tuple[int, int]]
 
 
 @router.get("/{cosplay_id}/images", response_model=list[ImageWithBlurhash])
-def list_cosplay_images(cosplay_id: int, db: Session = Depends(get_db)):
+async def list_cosplay_images(cosplay_id: int):
+    # 查询在默认线程池执行；从未扫描过的旧数据要先列目录建清单，这一步可能很慢
+    # （NFS 等），放到文件 I/O 线程池
+    images = await run_in_threadpool(_read_images, cosplay_id)
+    if images is None:
+        await file_io.run(_build_manifest, cosplay_id)
+        images = await run_in_threadpool(_read_images, cosplay_id, False)
+    return images
+
+
+def _read_images(
+    cosplay_id: int, scanned_only: bool = True
+) -> list[ImageWithBlurhash] | None:
+    with ReadSessionLocal() as db:
+        return _image_list(db, cosplay_id, scanned_only)
+
+
+def _build_manifest(cosplay_id: int) -> None:
+    with SessionLocal() as db:
+        ensure_manifest(db, db.get(Cosplay, cosplay_id))
+
+
+def _image_list(
+    db: Session, cosplay_id: int, scanned_only: bool = True
+) -> list[ImageWithBlurhash] | None:
+    """Images of a cosplay from its manifest, in natural order.
+
+    Returns ``None`` when ``scanned_only`` is set and the cosplay has never
+    been scanned, so there is no manifest to read yet.
+    """
     cosplay = db.query(Cosplay).filter(Cosplay.id == cosplay_id).first()
     if not cosplay:
         raise HTTPException(status_code=404, detail="Cosplay not found")
+    if scanned_only and cosplay.dir_mtime_ns is None:
+        return None
+
+    rows = (
+        db.query(
+            MediaFile.filename,
+            MediaFile.mtime_ns,
+            MediaFile.size,
+            MediaFile.width.label("original_width"),
+            MediaFile.height.label("original_height"),
+            MediaFile.orientation,
+            MediaFile.format,
+            MediaFile.dominant_color,
+            ImageHash.blurhash,
+            Thumbnail.width,
+            Thumbnail.height,
+        )
+        .outerjoin(
+            ImageHash,
+            and_(
+                ImageHash.cosplay_id == MediaFile.cosplay_id,
+                ImageHash.filename == MediaFile.filename,
+            ),
+        )
+        .outerjoin(
+            Thumbnail,
+            and_(
+                Thumbnail.cosplay_id == MediaFile.cosplay_id,
+                Thumbnail.filename == MediaFile.filename,
+                Thumbnail.max_width == THUMBNAIL_WIDTH,
+                Thumbnail.format == "avif",
+            ),
+        )
+        .filter(MediaFile.cosplay_id == cosplay_id, MediaFile.kind == "image")
+        .order_by(MediaFile.position)
+        .all()
+    )
+    return [
+        ImageWithBlurhash(
+            filename=row.filename,
+            blurhash=row.blurhash,
+            version=media_version(row.mtime_ns, row.size),
+            width=row.width,
+            height=row.height,
+            size=row.size,
+            original_width=row.original_width,
+            original_height=row.original_height,
+            orientation=row.orientation,
+            format=row.format,
+            dominant_color=row.dominant_color,
+        )
+        for row in rows
+    ]
 
-    dir_path = Path(cosplay.dir_path)
-    if not dir_path.is_dir():
-        return []
 
-    blurhash_map = {
-        row.filename: row.blurhash
-        for row in db.query(ImageHash.filename, ImageHash.blurhash)
-        .filter(ImageHash.cosplay_id == cosplay_id)
-        .all()
-    }
+@router.get("/{cosplay_id}/placeholders", response_model=ImagePlaceholders)
+async def get_image_placeholders(cosplay_id: int):
+    """Where each image's placeholder sits in the cosplay's placeholder sprite.
+
+    The sprite is rendered on first request if the processing job has not
+    produced it yet, so this runs in the file I/O pool.
+    """
+    return await file_io.run(_image_placeholders, cosplay_id)
+
+
+def _image_placeholders(cosplay_id: int) -> ImagePlaceholders:
+    with ReadSessionLocal() as db:
+        if db.get(Cosplay, cosplay_id) is None:
+            raise HTTPException(status_code=404, detail="Cosplay not found")
+        sprite = placeholder_sprite(db, cosplay_id)
+    if sprite is None:
+        return ImagePlaceholders(
+            version=None, tile_size=PLACEHOLDER_TILE, width=0, height=0, offsets={}
+        )
+    return ImagePlaceholders(
+        version=sprite.version,
+        tile_size=PLACEHOLDER_TILE,
+        width=sprite.width,
+        height=sprite.height,
+        offsets=sprite.offsets,
+    )
+
 
-    files = []
-    for f in dir_path.iterdir():
-        if f.is_file() and f.suffix.lower() in IMAGE_EXTENSIONS:
-            files.append(
-                ImageWithBlurhash(filename=f.name, blurhash=blurhash_map.get(f.name))
-            )
+class VideoItem(BaseModel):
+    filename: str
+    version: str
+    size: int
+    # 封面帧的像素尺寸，即视频的显示尺寸；处理任务截取封面帧之前为空
+    width: int | None = None
+    height: int | None = None
 
-    files.sort(key=lambda x: _natural_sort_key(x.filename))
-    return files
+
+@router.get("/{cosplay_id}/videos", response_model=list[VideoItem])
+def list_cosplay_videos(cosplay_id: int, db: Session = Depends(get_read_db)):
+    """Videos of a cosplay from its manifest, in natural order."""
+    if db.get(Cosplay, cosplay_id) is None:
+        raise HTTPException(status_code=404, detail="Cosplay not found")
+    rows = (
+        db.query(
+            MediaFile.filename,
+            MediaFile.mtime_ns,
+            MediaFile.size,
+            MediaFile.width,
+            MediaFile.height,
+        )
+        .filter(MediaFile.cosplay_id == cosplay_id, MediaFile.kind == "video")
+        .order_by(MediaFile.position)
+        .all()
+    )
+    return [
+        VideoItem(
+            filename=row.filename,
+            version=media_version(row.mtime_ns, row.size),
+            size=row.size,
+            width=row.width,
+            height=row.height,
+        )
+        for row in rows
+    ]
@@ -1,97 +1,386 @@
 import re
 from pathlib import Path
+from urllib.parse import quote
 
-from fastapi import APIRouter, Depends, HTTPException
-from fastapi.responses import FileResponse
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import Response, StreamingResponse
 
-from ..database import get_db
+from .. import config
+from ..database import ReadSessionLocal, SessionLocal
 from ..models import Cosplay
+from ..services import archive, file_io, jobs, video
+from ..services import thumbnail_cache
+from ..services.path_cache import (
+    CosplayPaths,
+    ThumbnailVariant,
+    get_coser_paths,
+    get_cosplay_paths,
+)
+from ..services.scanner import (
+    ensure_manifest,
+    first_image_filename,
+    manifest_is_current,
+    media_kind,
+    media_version,
+    rescan_cosplay,
+)
+from ..services.thumbnail import THUMBNAIL_WIDTH, placeholder_path, placeholder_sprite
+from ..services.thumbnail_cache import FORMATS, get_thumbnail, negotiate_format
 
+# 接口是 async 的：stat、读文件、生成缩略图和路径缓存未命中时的查询都放到专用的文件
+# I/O 线程池（services/file_io.py），慢存储不会占满其他接口共用的默认线程池
 router = APIRouter()
 
-IMAGE_EXTENSIONS = {".avif", ".jpg", ".jpeg", ".png", ".webp", ".gif", ".bmp"}
-THUMBNAIL_DIR = Path(__file__).resolve().parent.parent.parent / "data" / "thumbnails"
+# URL 带当前版本号（?v=）时内容永不变化，可永久缓存；否则每次向服务器验证
+CACHE_IMMUTABLE = "public, max-age=31536000, immutable"
+CACHE_REVALIDATE = "no-cache"
 
+# 打包下载所需的 CRC 还在计算时，建议客户端多久后重试
+ARCHIVE_RETRY_SECONDS = 30
 
-def _natural_sort_key(s: str) -> list:
-    return [
-        int(part) if part.isdigit() else part.lower() for part in re.split(r"(\d+)", s)
-    ]
+# 只支持单个区间；多区间请求按规范可以忽略，发送完整内容
+_BYTE_RANGE = re.compile(r"\s*bytes\s*=\s*(\d*)-(\d*)\s*", re.IGNORECASE)
 
 
-@router.get("/image/{cosplay_id}/{filename}")
-def serve_image(cosplay_id: int, filename: str, db: Session = Depends(get_db)):
-    cosplay = db.query(Cosplay).filter(Cosplay.id == cosplay_id).first()
-    if not cosplay:
-        raise HTTPException(status_code=404, detail="Cosplay not found")
+def _etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    tags = (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+    return etag in tags
+
+
+def _parse_range(header: str | None, size: int) -> tuple[int, int] | None:
+    """The byte range of a ``Range`` header as inclusive ``(start, end)``.
+
+    Returns ``None`` when there is no header, or it is not a single valid byte
+    range, so the whole body is sent; raises 416 if it starts past the end.
+    """
+    match = _BYTE_RANGE.fullmatch(header or "")
+    if match is None:
+        return None
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        if last and int(last) < start:
+            return None
+        end = min(int(last), size - 1) if last else size - 1
+    elif last:
+        # 后缀形式 bytes=-N：最后 N 个字节
+        start, end = size - min(int(last), size), size - 1
+    else:
+        return None
+    if start >= size:
+        raise HTTPException(
+            status_code=416,
+            detail="Range not satisfiable",
+            headers={"Content-Range": f"bytes */{size}"},
+        )
+    return start, end
+
+
+def _requested_range(request: Request, etag: str, size: int) -> tuple[int, int] | None:
+    """The range to send for ``Range``/``If-Range``, or ``None`` for everything."""
+    if_range = request.headers.get("if-range")
+    # 只接受强 ETag；日期形式无法精确判断，按不匹配处理（发送完整内容）
+    if if_range is not None and if_range.strip() != etag:
+        return None
+    return _parse_range(request.headers.get("range"), size)
+
+
+def _stat_version(path: Path) -> str | None:
+    try:
+        st = path.stat()
+    except OSError:
+        return None
+    return media_version(st.st_mtime_ns, st.st_size)
+
+
+def _cache_headers(request: Request, etag: str, version: str) -> dict[str, str]:
+    immutable = request.query_params.get("v") == version
+    return {
+        "ETag": etag,
+        "Cache-Control": CACHE_IMMUTABLE if immutable else CACHE_REVALIDATE,
+    }
+
 
-    file_path = Path(cosplay.dir_path) / filename
-    if not file_path.is_file():
+def _send_file(request: Request, path: Path, version: str | None) -> Response:
+    """Serve ``path`` with a strong ETag derived from ``version``.
+
+    ``version`` normally comes from the file manifest, so a matching
+    ``If-None-Match`` is answered with 304 without touching the file. The
+    response is marked immutable when the URL carries the current version.
+    ``Range`` requests get a 206 with the requested bytes, which is how video
+    players seek.
+    """
+    if version is None:
+        version = _stat_version(path)
+        if version is None:
+            raise HTTPException(status_code=404, detail="File not found")
+    etag = f'"{version}"'
+    headers = _cache_headers(request, etag, version)
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    try:
+        return file_io.file_response(
+            path,
+            _media_type(path),
+            headers,
+            lambda size: _requested_range(request, etag, size),
+        )
+    except OSError:
         raise HTTPException(status_code=404, detail="File not found")
 
-    return FileResponse(file_path, media_type=_media_type(file_path))
 
+def _send_thumbnail(
+    request: Request,
+    cosplay_id: int,
+    paths: CosplayPaths,
+    filename: str,
+    width: int,
+    version: str | None = None,
+) -> Response | None:
+    """Thumbnail of ``filename`` at ``width`` in the best format the client accepts.
 
-@router.get("/thumbnail/{cosplay_id}/{filename}")
-def serve_thumbnail(cosplay_id: int, filename: str, db: Session = Depends(get_db)):
-    cosplay = db.query(Cosplay).filter(Cosplay.id == cosplay_id).first()
-    if not cosplay:
+    The file is looked up in the thumbnail manifest; variants missing from it,
+    or generated from an older version of the source, are rendered on the spot.
+    The original is never sent in their place. Returns ``None`` if the source is
+    missing or undecodable.
+    """
+    fmt = negotiate_format(request.headers.get("accept"))
+    src = paths.dir_path / filename
+    if media_kind(filename) == "video":
+        # 视频的缩略图从处理任务截取的封面帧生成
+        src = video.poster_path(cosplay_id, filename)
+    version = version or paths.versions.get(filename)
+    if version is None:
+        version = _stat_version(src)
+        if version is None:
+            return None
+    etag = f'"t{width}{fmt}-{version}"'
+    headers = _cache_headers(request, etag, version)
+    headers["Vary"] = "Accept"
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    key = (filename, width, fmt)
+    variant = paths.thumbnails.get(key)
+    if variant is not None and variant.version == version:
+        try:
+            response = file_io.file_response(variant.path, FORMATS[fmt][0], headers)
+        except OSError:
+            # 文件已被 LRU 淘汰或手动删除，重新生成
+            pass
+        else:
+            thumbnail_cache.touch(variant.path)
+            return response
+    stale = variant is not None and variant.version != version
+    path = get_thumbnail(
+        cosplay_id, src, version, width, fmt, rerender=stale, filename=filename
+    )
+    if path is None:
+        return None
+    paths.thumbnails[key] = ThumbnailVariant(path, version)
+    try:
+        return file_io.file_response(path, FORMATS[fmt][0], headers)
+    except OSError:
+        # 刚生成的文件被 LRU 淘汰了
+        return None
+
+
+def _check_width(width: int) -> None:
+    # 默认宽度是处理任务预生成的档位，配置里漏掉它时也必须可用
+    widths = sorted({THUMBNAIL_WIDTH, *config.THUMBNAIL_WIDTHS})
+    if width not in widths:
+        allowed = ", ".join(str(w) for w in widths)
+        raise HTTPException(
+            status_code=400, detail=f"Unsupported width, use one of {allowed}"
+        )
+
+
+def _get_paths(cosplay_id: int) -> CosplayPaths:
+    # 走路径缓存，命中时不打开数据库会话
+    paths = get_cosplay_paths(cosplay_id)
+    if paths is None:
         raise HTTPException(status_code=404, detail="Cosplay not found")
+    return paths
+
+
+@router.get("/image/{cosplay_id}/{filename}")
+async def serve_image(cosplay_id: int, filename: str, request: Request):
+    return await file_io.run(_serve_original, cosplay_id, filename, request)
+
 
-    thumb_path = THUMBNAIL_DIR / str(cosplay_id) / filename
-    if thumb_path.is_file():
-        return FileResponse(thumb_path, media_type=_media_type(thumb_path))
+def _serve_original(cosplay_id: int, filename: str, request: Request) -> Response:
+    paths = _get_paths(cosplay_id)
+    version = paths.versions.get(filename)
+    return _send_file(request, paths.dir_path / filename, version)
 
-    file_path = Path(cosplay.dir_path) / filename
-    if not file_path.is_file():
+
+@router.get("/video/{cosplay_id}/{filename}")
+async def serve_video(cosplay_id: int, filename: str, request: Request):
+    """A set video, with byte ranges for seeking.
+
+    Its poster frame is served by the thumbnail route under the same filename.
+    """
+    if media_kind(filename) != "video":
+        raise HTTPException(status_code=404, detail="File not found")
+    return await file_io.run(_serve_original, cosplay_id, filename, request)
+
+
+@router.get("/thumbnail/{cosplay_id}/{filename}")
+async def serve_thumbnail(
+    cosplay_id: int,
+    filename: str,
+    request: Request,
+    w: int = Query(THUMBNAIL_WIDTH, description="Width in pixels"),
+):
+    _check_width(w)
+    return await file_io.run(_serve_thumbnail, cosplay_id, filename, request, w)
+
+
+def _serve_thumbnail(
+    cosplay_id: int, filename: str, request: Request, w: int
+) -> Response:
+    paths = _get_paths(cosplay_id)
+    response = _send_thumbnail(request, cosplay_id, paths, filename, w)
+    if response is None:
         raise HTTPException(status_code=404, detail="File not found")
-    return FileResponse(file_path, media_type=_media_type(file_path))
+    return response
 
 
 @router.get("/cover/{cosplay_id}")
-def serve_cover(cosplay_id: int, db: Session = Depends(get_db)):
-    cosplay = db.query(Cosplay).filter(Cosplay.id == cosplay_id).first()
-    if not cosplay:
-        raise HTTPException(status_code=404, detail="Cosplay not found")
+async def serve_cover(
+    cosplay_id: int,
+    request: Request,
+    w: int = Query(THUMBNAIL_WIDTH, description="Width in pixels"),
+):
+    _check_width(w)
+    return await file_io.run(_serve_cover, cosplay_id, request, w)
+
+
+def _serve_cover(cosplay_id: int, request: Request, w: int) -> Response:
+    paths = _get_paths(cosplay_id)
 
-    if cosplay.cover_path:
-        thumb_path = THUMBNAIL_DIR / str(cosplay_id) / cosplay.cover_path
-        if thumb_path.is_file():
-            return FileResponse(thumb_path, media_type=_media_type(thumb_path))
-
-        file_path = Path(cosplay.dir_path) / cosplay.cover_path
-        if file_path.is_file():
-            return FileResponse(file_path, media_type=_media_type(file_path))
-
-    dir_path = Path(cosplay.dir_path)
-    if dir_path.is_dir():
-        images = sorted(
-            [
-                f
-                for f in dir_path.iterdir()
-                if f.is_file() and f.suffix.lower() in IMAGE_EXTENSIONS
-            ],
-            key=lambda f: _natural_sort_key(f.name),
+    if paths.cover_path:
+        response = _send_thumbnail(
+            request, cosplay_id, paths, paths.cover_path, w, paths.cover_version
         )
-        if images:
-            return FileResponse(images[0], media_type=_media_type(images[0]))
+        if response is not None:
+            return response
+
+    # 封面缺失时从文件清单取第一张图片，而不是重新列目录
+    with SessionLocal() as db:
+        cosplay = db.get(Cosplay, cosplay_id)
+        if cosplay is None:
+            raise HTTPException(status_code=404, detail="Cosplay not found")
+        ensure_manifest(db, cosplay)
+        first_image = first_image_filename(db, cosplay_id, exclude=paths.cover_path)
+    if first_image:
+        response = _send_thumbnail(request, cosplay_id, paths, first_image, w)
+        if response is not None:
+            return response
 
     raise HTTPException(status_code=404, detail="No cover image found")
 
 
+_PLACEHOLDER_VERSION = re.compile(r"[0-9a-f]{16}")
+
+
+@router.get("/placeholders/{cosplay_id}")
+async def serve_placeholders(cosplay_id: int, request: Request):
+    return await file_io.run(_serve_placeholders, cosplay_id, request)
+
+
+def _serve_placeholders(cosplay_id: int, request: Request) -> Response:
+    # 拼图文件名带版本号，URL 里的版本对应的文件还在时直接发送，不打开数据库会话
+    version = request.query_params.get("v")
+    if version and _PLACEHOLDER_VERSION.fullmatch(version):
+        path = placeholder_path(cosplay_id, version)
+        if path.is_file():
+            return _send_file(request, path, version)
+
+    with ReadSessionLocal() as db:
+        sprite = placeholder_sprite(db, cosplay_id)
+    if sprite is None:
+        raise HTTPException(status_code=404, detail="No placeholders found")
+    return _send_file(request, sprite.path, sprite.version)
+
+
+@router.get("/archive/{cosplay_id}")
+async def serve_archive(cosplay_id: int, request: Request):
+    """The whole set as an uncompressed ZIP, streamed straight from its directory.
+
+    The archive layout is fixed by the file manifest, so the response has a
+    ``Content-Length`` and any byte range can be resumed with ``Range``. While
+    the processing job is still computing checksums the answer is 503 with
+    ``Retry-After``; files it could not read are left out of the archive.
+    """
+    title, zip_archive = await file_io.run(_load_archive, cosplay_id)
+    etag = f'"a-{zip_archive.version}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": CACHE_REVALIDATE,
+        "Accept-Ranges": "bytes",
+        "Content-Disposition": (
+            f'attachment; filename="cosplay-{cosplay_id}.zip";'
+            f" filename*=UTF-8''{quote(title + '.zip', safe='')}"
+        ),
+    }
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    byte_range = _requested_range(request, etag, zip_archive.size)
+    status = 200
+    start, end = 0, zip_archive.size - 1
+    if byte_range is not None:
+        status = 206
+        start, end = byte_range
+        headers["Content-Range"] = f"bytes {start}-{end}/{zip_archive.size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(
+        archive.iter_range(zip_archive, start, end),
+        status_code=status,
+        media_type="application/zip",
+        headers=headers,
+    )
+
+
+def _load_archive(cosplay_id: int) -> tuple[str, archive.Archive]:
+    with SessionLocal() as db:
+        cosplay = db.get(Cosplay, cosplay_id)
+        if cosplay is None:
+            raise HTTPException(status_code=404, detail="Cosplay not found")
+        # 布局和 CRC 都取自清单：先只读地逐个 stat 比对，有出入时才重新扫描（清掉
+        # 改动过的文件的 CRC 并让路径缓存失效），不会带着旧 CRC 打包
+        if not manifest_is_current(db, cosplay):
+            rescan_cosplay(db, cosplay, full=True)
+        files = archive.archive_files(db, cosplay_id)
+        if files is None:
+            # 缺的 CRC 要完整读一遍文件，交给处理任务，不占用请求
+            jobs.enqueue_many(db, "process_cosplay", [cosplay_id])
+            raise HTTPException(
+                status_code=503,
+                detail="Archive is being prepared",
+                headers={"Retry-After": str(ARCHIVE_RETRY_SECONDS)},
+            )
+        return cosplay.title, archive.build_archive(Path(cosplay.dir_path), files)
+
+
 @router.get("/coser-avatar/{coser_id}")
-def serve_coser_avatar(coser_id: int, db: Session = Depends(get_db)):
-    from ..models import Coser
+async def serve_coser_avatar(coser_id: int, request: Request):
+    return await file_io.run(_serve_coser_avatar, coser_id, request)
+
 
-    coser = db.query(Coser).filter(Coser.id == coser_id).first()
-    if not coser:
+def _serve_coser_avatar(coser_id: int, request: Request) -> Response:
+    paths = get_coser_paths(coser_id)
+    if paths is None:
         raise HTTPException(status_code=404, detail="Coser not found")
 
-    if coser.avatar_path:
-        avatar = Path(coser.avatar_path)
-        if avatar.is_file():
-            return FileResponse(avatar, media_type=_media_type(avatar))
+    if paths.avatar_path and paths.avatar_path.is_file():
+        # 头像不在文件清单里，版本号取自 stat（不打开文件）
+        return _send_file(request, paths.avatar_path, None)
 
     raise HTTPException(status_code=404, detail="No avatar found")
 
@@ -105,5 +394,10 @@ def _media_type(path: Path) -> str:
         ".png": "image/png",
         ".webp": "image/webp",
         ".gif": "image/gif",
+        ".mp4": "video/mp4",
+        ".mkv": "video/x-matroska",
+        ".avi": "video/x-msvideo",
+        ".mov": "video/quicktime",
+        ".webm": "video/webm",
     }
     return types.get(suffix, "application/octet-stream")
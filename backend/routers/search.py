@@ -0,0 +1,59 @@
+import io
+import math
+from typing import Literal
+
+from fastapi import APIRouter, Depends, HTTPException, Query, UploadFile
+from sqlalchemy.orm import Session
+
+from .. import config
+from ..database import get_read_db
+from ..schemas import ImageSearchResult, PaginatedResponse, SearchHit
+from ..services import search
+from ..services.thumbnail import compute_phash
+
+router = APIRouter()
+
+
+@router.get("/", response_model=PaginatedResponse)
+def search_library(
+    q: str = Query(..., min_length=1, max_length=200),
+    kind: Literal["cosplay", "coser", "parody"] | None = None,
+    page: int = Query(1, ge=1),
+    page_size: int = Query(20, ge=1, le=100),
+    db: Session = Depends(get_read_db),
+):
+    """Cosplays, cosers and parodies whose name contains every term of ``q``.
+
+    Results are ranked by relevance; ``kind`` restricts them to one type.
+    """
+    hits, total = search.search(
+        db, q, kind, limit=page_size, offset=(page - 1) * page_size
+    )
+    return PaginatedResponse(
+        items=[SearchHit(**hit) for hit in hits],
+        total=total,
+        page=page,
+        page_size=page_size,
+        total_pages=math.ceil(total / page_size) if total > 0 else 1,
+    )
+
+
+@router.post("/image", response_model=ImageSearchResult)
+def search_by_image(
+    file: UploadFile,
+    threshold: int = Query(10, ge=0, le=32),
+    limit: int = Query(20, ge=1, le=100),
+    db: Session = Depends(get_read_db),
+):
+    """Library images that look like the uploaded one, nearest pHash first."""
+    max_bytes = config.IMAGE_SEARCH_MAX_MB * 1024 * 1024
+    data = file.file.read(max_bytes + 1)
+    if len(data) > max_bytes:
+        raise HTTPException(status_code=413, detail="Image too large")
+    try:
+        phash = compute_phash(io.BytesIO(data))
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid image")
+
+    images, cosplays = search.similar_images(db, phash, threshold, limit)
+    return ImageSearchResult(phash=phash, images=images, cosplays=cosplays)
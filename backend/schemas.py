@@ -1,6 +1,7 @@
+import json
 from datetime import datetime
 
-from pydantic import BaseModel
+from pydantic import BaseModel, field_validator
 
 
 class CoserBase(BaseModel):
@@ -56,6 +57,7 @@ class CosplayUpdate(BaseModel):
 class CosplayOut(CosplayBase):
     id: int
     cover_path: str | None = None
+    cover_version: str | None = None
     photo_count: int = 0
     video_count: int = 0
     total_size: int = 0
@@ -66,9 +68,75 @@ class CosplayOut(CosplayBase):
     model_config = {"from_attributes": True}
 
 
+class CosplayCreatedOut(CosplayOut):
+    job_id: int | None = None
+
+
+class LibraryImport(BaseModel):
+    root: str
+    batch_size: int = 500
+
+
+class JobOut(BaseModel):
+    id: int
+    kind: str
+    cosplay_id: int | None = None
+    status: str
+    progress: int = 0
+    total: int = 0
+    attempts: int = 0
+    max_attempts: int = 0
+    cancel_requested: bool = False
+    result: dict | None = None
+    error: str | None = None
+    created_at: datetime
+    started_at: datetime | None = None
+    finished_at: datetime | None = None
+
+    model_config = {"from_attributes": True}
+
+    @field_validator("result", mode="before")
+    @classmethod
+    def _decode_result(cls, value):
+        return json.loads(value) if isinstance(value, str) else value
+
+
+class SearchHit(BaseModel):
+    # cosplay / coser / parody
+    kind: str
+    id: int
+    name: str
+
+
+class SimilarImage(BaseModel):
+    cosplay_id: int
+    cosplay_title: str
+    filename: str
+    # 与上传图片 pHash 的汉明距离（位数）
+    distance: int
+
+
+class SimilarCosplay(BaseModel):
+    id: int
+    title: str
+    cover_version: str | None = None
+    # 该图集内最接近的一张图的距离，以及命中的图片数
+    distance: int
+    matches: int
+
+
+class ImageSearchResult(BaseModel):
+    phash: str
+    images: list[SimilarImage]
+    cosplays: list[SimilarCosplay]
+
+
 class PaginatedResponse(BaseModel):
     items: list
-    total: int
-    page: int
+    # 游标分页时 page 为空，total/total_pages 仅在 include_total 时返回
+    total: int | None = None
+    page: int | None = None
     page_size: int
-    total_pages: int
+    total_pages: int | None = None
+    # 下一页的游标；最后一页为空
+    next_cursor: str | None = None
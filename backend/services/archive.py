@@ -0,0 +1,329 @@
+"""图集打包下载：STORE 模式（不压缩）的 ZIP，直接从图集目录流式读出。
+
+每个文件的 CRC-32 预先存在文件清单里（处理任务计算），本地文件头和中央目录在发送前
+就能全部算好，整个压缩包的字节布局和大小由清单唯一确定。任意字节区间都能直接定位到
+对应的文件和偏移，断点续传不必从头生成；内存占用只有头部和一个读缓冲区，与图集大小
+无关。单个文件、偏移或压缩包超过 4 GiB 时使用 ZIP64 扩展。
+"""
+
+import bisect
+import hashlib
+import logging
+import os
+import struct
+import time
+import zlib
+from collections.abc import AsyncIterator
+from pathlib import Path
+from typing import NamedTuple
+
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from ..models import MediaFile
+from . import file_io
+from .scanner import media_version
+
+logger = logging.getLogger(__name__)
+
+# 普通 ZIP 头里的 32/16 位字段取这两个值时，真实值在 ZIP64 扩展里
+_MAX32 = 0xFFFFFFFF
+_MAX16 = 0xFFFF
+# 达到即改用 ZIP64 的上限
+ZIP64_LIMIT = _MAX32
+ZIP64_COUNT_LIMIT = _MAX16
+
+_LOCAL_HEADER = struct.Struct("<IHHHHHIIIHH")
+_CENTRAL_HEADER = struct.Struct("<IHHHHHHIIIHHHHHII")
+_ZIP64_END = struct.Struct("<IQHHIIQQQQ")
+_ZIP64_LOCATOR = struct.Struct("<IIQI")
+_END = struct.Struct("<IHHHHIIH")
+
+# 文件名按 UTF-8 编码（通用标志第 11 位）
+_FLAG_UTF8 = 0x800
+_VERSION = 20
+_VERSION_ZIP64 = 45
+# 由 Unix 系统创建，普通文件，权限 0644
+_MADE_BY_UNIX = 3 << 8
+_EXTERNAL_ATTR = 0o100644 << 16
+
+
+class ArchiveFile(NamedTuple):
+    filename: str
+    size: int
+    mtime_ns: int
+    crc32: int
+
+
+class _Segment(NamedTuple):
+    # 在压缩包中的起始偏移
+    start: int
+    length: int
+    # 头部字节；文件内容段为 None，内容从 path 读取
+    data: bytes | None
+    path: Path | None
+    # 文件内容段对应的清单 mtime，读取前用来确认文件未被改写
+    mtime_ns: int | None
+
+
+class Archive(NamedTuple):
+    size: int
+    # 文件名、版本号与 CRC 的摘要，作为强 ETag
+    version: str
+    segments: list[_Segment]
+
+
+def _dos_datetime(mtime_ns: int) -> tuple[int, int]:
+    # 按 UTC 写入，压缩包的字节不随服务器时区变化
+    t = time.gmtime(mtime_ns / 1e9)
+    if t.tm_year < 1980:
+        return 0, (1 << 5) | 1
+    dos_time = (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2)
+    dos_date = ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+    return dos_time, dos_date
+
+
+def _zip64_extra(*values: int) -> bytes:
+    if not values:
+        return b""
+    return struct.pack(f"<HH{len(values)}Q", 0x0001, 8 * len(values), *values)
+
+
+def build_archive(dir_path: Path, files: list[ArchiveFile]) -> Archive:
+    """Byte layout of a STORE-mode ZIP holding ``files`` from ``dir_path``.
+
+    Every header is built here; only file contents are read while streaming.
+    """
+    segments: list[_Segment] = []
+    central: list[bytes] = []
+    digest = hashlib.sha1()
+    offset = 0
+
+    def add(
+        data: bytes | None,
+        length: int,
+        path: Path | None = None,
+        mtime_ns: int | None = None,
+    ) -> None:
+        nonlocal offset
+        segments.append(_Segment(offset, length, data, path, mtime_ns))
+        offset += length
+
+    for f in files:
+        name = f.filename.encode()
+        digest.update(f"{f.filename}\0{media_version(f.mtime_ns, f.size)}".encode())
+        digest.update(f"\0{f.crc32:08x}\n".encode())
+        dos_time, dos_date = _dos_datetime(f.mtime_ns)
+        large = f.size >= ZIP64_LIMIT
+        size32 = _MAX32 if large else f.size
+        local_extra = _zip64_extra(f.size, f.size) if large else b""
+        header_offset = offset
+        local = _LOCAL_HEADER.pack(
+            0x04034B50,
+            _VERSION_ZIP64 if large else _VERSION,
+            _FLAG_UTF8,
+            0,
+            dos_time,
+            dos_date,
+            f.crc32,
+            size32,
+            size32,
+            len(name),
+            len(local_extra),
+        )
+        add(local + name + local_extra, len(local) + len(name) + len(local_extra))
+        add(None, f.size, dir_path / f.filename, f.mtime_ns)
+
+        # 中央目录的 ZIP64 扩展只包含取值溢出的字段，顺序固定
+        far = header_offset >= ZIP64_LIMIT
+        central_extra = _zip64_extra(
+            *((f.size, f.size) if large else ()), *((header_offset,) if far else ())
+        )
+        version = _VERSION_ZIP64 if central_extra else _VERSION
+        central.append(
+            _CENTRAL_HEADER.pack(
+                0x02014B50,
+                _MADE_BY_UNIX | version,
+                version,
+                _FLAG_UTF8,
+                0,
+                dos_time,
+                dos_date,
+                f.crc32,
+                size32,
+                size32,
+                len(name),
+                len(central_extra),
+                0,
+                0,
+                0,
+                _EXTERNAL_ATTR,
+                _MAX32 if far else header_offset,
+            )
+            + name
+            + central_extra
+        )
+
+    directory = b"".join(central)
+    directory_offset = offset
+    trailer = b""
+    count = len(files)
+    if (
+        count >= ZIP64_COUNT_LIMIT
+        or len(directory) >= ZIP64_LIMIT
+        or directory_offset >= ZIP64_LIMIT
+    ):
+        zip64_end_offset = directory_offset + len(directory)
+        trailer += _ZIP64_END.pack(
+            0x06064B50,
+            _ZIP64_END.size - 12,
+            _MADE_BY_UNIX | _VERSION_ZIP64,
+            _VERSION_ZIP64,
+            0,
+            0,
+            count,
+            count,
+            len(directory),
+            directory_offset,
+        )
+        trailer += _ZIP64_LOCATOR.pack(0x07064B50, 0, zip64_end_offset, 1)
+    trailer += _END.pack(
+        0x06054B50,
+        0,
+        0,
+        min(count, _MAX16),
+        min(count, _MAX16),
+        min(len(directory), _MAX32),
+        min(directory_offset, _MAX32),
+        0,
+    )
+    add(directory + trailer, len(directory) + len(trailer))
+    return Archive(offset, digest.hexdigest()[:16], segments)
+
+
+def _open_at(path: Path, position: int, size: int, mtime_ns: int):
+    f = open(path, "rb")
+    try:
+        # 大小不变的原地改写也会让清单里的 CRC 失效
+        st = os.fstat(f.fileno())
+        if (st.st_size, st.st_mtime_ns) != (size, mtime_ns):
+            raise OSError(f"{path} changed since it was scanned")
+        f.seek(position)
+    except BaseException:
+        f.close()
+        raise
+    return f
+
+
+async def iter_range(archive: Archive, start: int, end: int) -> AsyncIterator[bytes]:
+    """Bytes ``start`` to ``end`` (inclusive) of the archive.
+
+    File reads run on the file I/O pool. A file whose size or mtime no longer
+    matches the manifest raises ``OSError``, cutting the response short rather
+    than sending a corrupt archive.
+    """
+    starts = [segment.start for segment in archive.segments]
+    index = bisect.bisect_right(starts, start) - 1
+    position = start
+    for segment in archive.segments[index:]:
+        if position > end:
+            break
+        skip = position - segment.start
+        length = min(segment.length - skip, end - position + 1)
+        if segment.data is not None:
+            yield segment.data[skip : skip + length]
+        elif length > 0:
+            f = await file_io.run(
+                _open_at, segment.path, skip, segment.length, segment.mtime_ns
+            )
+            try:
+                remaining = length
+                while remaining:
+                    chunk = await file_io.run(
+                        f.read, min(file_io.CHUNK_SIZE, remaining)
+                    )
+                    if not chunk:
+                        raise OSError(f"{segment.path} was truncated")
+                    remaining -= len(chunk)
+                    yield chunk
+            finally:
+                await file_io.run(f.close)
+        position += length
+
+
+def _file_crc32(path: Path) -> int:
+    crc = 0
+    with open(path, "rb") as f:
+        while chunk := f.read(file_io.CHUNK_SIZE):
+            crc = zlib.crc32(chunk, crc)
+    return crc
+
+
+def fill_checksums(db: Session, cosplay_id: int, dir_path: Path) -> int:
+    """Compute and store the CRC-32 of manifest files that lack one.
+
+    Images get theirs during the processing pass; this covers videos and files
+    processed before checksums were recorded. A file that cannot be read has its
+    version recorded in ``crc32_failed_version`` and is left out of the archive
+    until it changes. Commits; returns how many were computed.
+    """
+    rows = (
+        db.query(
+            MediaFile.id,
+            MediaFile.filename,
+            MediaFile.mtime_ns,
+            MediaFile.size,
+            MediaFile.crc32_failed_version,
+        )
+        .filter(MediaFile.cosplay_id == cosplay_id, MediaFile.crc32.is_(None))
+        .all()
+    )
+    values = []
+    computed = 0
+    for row in rows:
+        version = media_version(row.mtime_ns, row.size)
+        if row.crc32_failed_version == version:
+            continue
+        try:
+            crc = _file_crc32(dir_path / row.filename)
+        except OSError:
+            logger.warning("could not read %s for its checksum", row.filename)
+            crc, failed_version = None, version
+        else:
+            failed_version = None
+            computed += 1
+        values.append(
+            {"id": row.id, "crc32": crc, "crc32_failed_version": failed_version}
+        )
+    if values:
+        db.execute(update(MediaFile), values)
+        db.commit()
+    return computed
+
+
+def archive_files(db: Session, cosplay_id: int) -> list[ArchiveFile] | None:
+    """Manifest files in archive order (images, then videos), from the database.
+
+    Files whose checksum could not be computed at their current version are
+    left out. Returns ``None`` if any other file still lacks a checksum.
+    """
+    rows = (
+        db.query(
+            MediaFile.filename,
+            MediaFile.size,
+            MediaFile.mtime_ns,
+            MediaFile.crc32,
+            MediaFile.crc32_failed_version,
+        )
+        .filter(MediaFile.cosplay_id == cosplay_id)
+        .order_by(MediaFile.kind, MediaFile.position)
+        .all()
+    )
+    files = []
+    for filename, size, mtime_ns, crc32, failed_version in rows:
+        if crc32 is None:
+            if failed_version != media_version(mtime_ns, size):
+                return None
+            continue
+        files.append(ArchiveFile(filename, size, mtime_ns, crc32))
+    return files
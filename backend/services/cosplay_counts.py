@@ -0,0 +1,51 @@
+"""cosers/parodies 上冗余存储的 cosplay_count。
+
+创建、修改、删除图集时在同一事务里增减计数，列表接口直接读列，不再每次 GROUP BY
+全表。计数若因外部改库而漂移，可用 repair_cosplay_counts 重新统计。
+"""
+
+from sqlalchemy import func, select, update
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from ..models import Coser, Cosplay, Parody
+
+
+def adjust_cosplay_counts(
+    db: Session, coser_id: int | None, parody_id: int | None, delta: int
+) -> None:
+    """Add ``delta`` to the counts of one coser and parody. Does not commit."""
+    if coser_id is not None:
+        db.execute(
+            update(Coser)
+            .where(Coser.id == coser_id)
+            .values(cosplay_count=Coser.cosplay_count + delta)
+        )
+    if parody_id is not None:
+        db.execute(
+            update(Parody)
+            .where(Parody.id == parody_id)
+            .values(cosplay_count=Parody.cosplay_count + delta)
+        )
+
+
+def repair_cosplay_counts(db: Session | Connection) -> dict[str, int]:
+    """Recompute every count from ``cosplays``; returns how many rows were off.
+
+    Does not commit.
+    """
+    fixed = {}
+    for name, model, column in (
+        ("cosers", Coser, Cosplay.coser_id),
+        ("parodies", Parody, Cosplay.parody_id),
+    ):
+        actual = (
+            select(func.count(Cosplay.id)).where(column == model.id).scalar_subquery()
+        )
+        fixed[name] = db.execute(
+            update(model)
+            .where(model.cosplay_count != actual)
+            .values(cosplay_count=actual)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+    return fixed
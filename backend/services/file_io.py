@@ -0,0 +1,86 @@
+"""文件系统操作专用的有界线程池。
+
+图库存放在 NFS 等慢存储上时，一次 stat 或读文件就可能阻塞很久。/api/files 的这类操作
+都在这里执行，最多占用 FILE_IO_WORKERS 个线程；FastAPI 默认线程池（同步接口、数据库
+查询共用）不会被慢存储占满，其他接口照常响应。
+"""
+
+import asyncio
+import os
+from collections.abc import AsyncIterator, Callable
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import formatdate
+from functools import partial
+from pathlib import Path
+from typing import BinaryIO, TypeVar
+
+from fastapi.responses import StreamingResponse
+
+from .. import config
+
+T = TypeVar("T")
+
+CHUNK_SIZE = 256 * 1024
+
+_executor = ThreadPoolExecutor(
+    max_workers=config.FILE_IO_WORKERS, thread_name_prefix="file-io"
+)
+
+
+async def run(fn: Callable[..., T], *args) -> T:
+    """Run ``fn(*args)`` on the file I/O pool and await the result."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, partial(fn, *args))
+
+
+async def _read_chunks(f: BinaryIO, count: int) -> AsyncIterator[bytes]:
+    try:
+        while count > 0 and (chunk := await run(f.read, min(CHUNK_SIZE, count))):
+            count -= len(chunk)
+            yield chunk
+    finally:
+        await run(f.close)
+
+
+def file_response(
+    path: Path,
+    media_type: str,
+    headers: dict[str, str],
+    byte_range: Callable[[int], tuple[int, int] | None] | None = None,
+) -> StreamingResponse:
+    """Stream ``path``, or the part of it that ``byte_range`` picks.
+
+    ``byte_range`` maps the file size to an inclusive ``(start, end)`` to send
+    with status 206, or ``None`` for the whole file; it may raise to reject
+    the request. Call this from the pool: it opens the file, so a missing or
+    unreadable file raises ``OSError`` here rather than after the headers are
+    sent.
+    """
+    f = open(path, "rb")
+    try:
+        st = os.fstat(f.fileno())
+        selected = byte_range(st.st_size) if byte_range else None
+        start, end = selected or (0, st.st_size - 1)
+        f.seek(start)
+    except BaseException:
+        f.close()
+        raise
+    headers = {
+        **headers,
+        "Content-Length": str(end - start + 1),
+        "Last-Modified": formatdate(st.st_mtime, usegmt=True),
+    }
+    if byte_range is not None:
+        headers["Accept-Ranges"] = "bytes"
+    if selected is not None:
+        headers["Content-Range"] = f"bytes {start}-{end}/{st.st_size}"
+    return StreamingResponse(
+        _read_chunks(f, end - start + 1),
+        status_code=206 if selected is not None else 200,
+        media_type=media_type,
+        headers=headers,
+    )
+
+
+def shutdown() -> None:
+    _executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,126 @@
+"""批量导入：遍历 <root>/<coser>/<set> 目录树，批量建档并排队媒体处理任务。
+
+以规范化后的 dir_path 判重（数据库里有唯一索引），已导入的图集直接跳过；
+每批在一个事务里提交，因此中断后重新执行即可从断点继续。
+"""
+
+import re
+from collections import Counter
+from collections.abc import Callable
+from pathlib import Path
+
+from sqlalchemy.orm import Session
+
+from ..models import Coser, Cosplay, Parody
+from ..pagination import invalidate_counts
+from . import jobs
+from .cosplay_counts import adjust_cosplay_counts
+from .scanner import normalize_dir_path, sync_cosplay_files
+
+# 图集目录名中的作品名：「标题 (作品)」「标题 [作品]」「标题（作品）」「【作品】标题」
+_TRAILING_PARODY = re.compile(
+    r"^(?P<title>.+?)\s*[\(\[（【](?P<parody>[^\)\]）】]+)[\)\]）】]$"
+)
+_LEADING_PARODY = re.compile(r"^[\[【](?P<parody>[^\]】]+)[\]】]\s*(?P<title>.+)$")
+
+
+def parse_set_name(name: str) -> tuple[str, str | None]:
+    """Split a set directory name into (title, parody)."""
+    name = name.strip()
+    for pattern in (_TRAILING_PARODY, _LEADING_PARODY):
+        match = pattern.match(name)
+        if match:
+            return match["title"].strip(), match["parody"].strip()
+    return name, None
+
+
+def _subdirs(path: Path) -> list[Path]:
+    return sorted(
+        (p for p in path.iterdir() if p.is_dir() and not p.name.startswith(".")),
+        key=lambda p: p.name,
+    )
+
+
+def import_library(
+    db: Session,
+    root: str,
+    batch_size: int = 500,
+    progress: Callable[[int, int], None] | None = None,
+) -> dict:
+    """Import every ``<coser>/<set>`` directory under ``root``.
+
+    Returns counts of created cosers, parodies and cosplays, plus skipped sets.
+    """
+    root_path = Path(root).resolve()
+    if not root_path.is_dir():
+        raise NotADirectoryError(root)
+
+    known_dirs = {row.dir_path for row in db.query(Cosplay.dir_path)}
+    cosers = {c.name: c for c in db.query(Coser)}
+    parodies = {p.name: p for p in db.query(Parody)}
+    stats = {"cosers": 0, "parodies": 0, "cosplays": 0, "skipped": 0}
+    pending: list[Cosplay] = []
+
+    def flush() -> None:
+        if not pending:
+            return
+        db.flush()
+        for coser_id, n in Counter(c.coser_id for c in pending).items():
+            adjust_cosplay_counts(db, coser_id, None, n)
+        for parody_id, n in Counter(c.parody_id for c in pending).items():
+            adjust_cosplay_counts(db, None, parody_id, n)
+        for cosplay in pending:
+            sync_cosplay_files(db, cosplay)
+        jobs.enqueue_many(db, "process_cosplay", [c.id for c in pending])
+        invalidate_counts()
+        pending.clear()
+
+    coser_dirs = _subdirs(root_path)
+    for i, coser_dir in enumerate(coser_dirs):
+        if progress:
+            progress(i, len(coser_dirs))
+        for set_dir in _subdirs(coser_dir):
+            dir_path = normalize_dir_path(set_dir)
+            if dir_path in known_dirs:
+                stats["skipped"] += 1
+                continue
+
+            coser = cosers.get(coser_dir.name)
+            if coser is None:
+                coser = cosers[coser_dir.name] = Coser(name=coser_dir.name)
+                db.add(coser)
+                stats["cosers"] += 1
+
+            title, parody_name = parse_set_name(set_dir.name)
+            parody = None
+            if parody_name:
+                parody = parodies.get(parody_name)
+                if parody is None:
+                    parody = parodies[parody_name] = Parody(name=parody_name)
+                    db.add(parody)
+                    stats["parodies"] += 1
+
+            cosplay = Cosplay(
+                title=title, coser=coser, parody=parody, dir_path=dir_path
+            )
+            db.add(cosplay)
+            pending.append(cosplay)
+            known_dirs.add(dir_path)
+            stats["cosplays"] += 1
+            if len(pending) >= batch_size:
+                flush()
+
+    flush()
+    if progress:
+        progress(len(coser_dirs), len(coser_dirs))
+    return stats
+
+
+@jobs.handler("import_library")
+def _import_library_job(ctx: jobs.JobContext) -> dict:
+    return import_library(
+        ctx.db,
+        ctx.payload["root"],
+        batch_size=ctx.payload.get("batch_size", 500),
+        progress=ctx.progress,
+    )
@@ -0,0 +1,361 @@
+"""后台任务队列：任务持久化在 jobs 表，由进程内 worker 线程领取执行。
+
+领取通过带状态条件的 UPDATE 完成，多个进程共用同一数据库也不会重复执行。领取的
+进程记为任务的 owner，并在运行期间定期续租（heartbeat_at）；租约过期的 running 任务
+说明所在进程已异常退出，由任一进程放回队列。其他进程仍在运行的任务不受影响。
+"""
+
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import traceback
+import uuid
+from collections.abc import Callable
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any
+
+from sqlalchemy import and_, or_, select, update
+from sqlalchemy.orm import Session
+
+from .. import config
+from ..database import SessionLocal
+from ..models import Cosplay, Job
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+# 进度写库的最小间隔，避免每张图片都提交一次
+_PROGRESS_INTERVAL = 1.0
+
+# 本进程领取的任务记在这个名字下；pid 会被复用，再加一段随机数
+_OWNER = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+# 进度回调：(已处理数, 总数)
+Progress = Callable[[int, int], None]
+
+
+class JobCancelled(Exception):
+    """Raised inside a handler once cancellation of its job has been requested."""
+
+
+class JobContext:
+    """Handed to job handlers: a session, the decoded payload and progress reporting."""
+
+    def __init__(self, db: Session, job: Job) -> None:
+        self.db = db
+        self.job = job
+        self.payload: dict[str, Any] = json.loads(job.payload) if job.payload else {}
+        self._last_report = 0.0
+
+    def progress(self, done: int, total: int) -> None:
+        """Record progress and raise ``JobCancelled`` if the job was cancelled.
+
+        Written through a separate session so the handler's own transaction is
+        left alone.
+        """
+        now = time.monotonic()
+        if done < total and now - self._last_report < _PROGRESS_INTERVAL:
+            return
+        self._last_report = now
+        with SessionLocal() as db:
+            db.execute(
+                update(Job)
+                .where(Job.id == self.job.id)
+                .values(progress=done, total=total)
+            )
+            cancelled = db.scalar(
+                select(Job.cancel_requested).where(Job.id == self.job.id)
+            )
+            db.commit()
+        if cancelled:
+            raise JobCancelled()
+
+
+Handler = Callable[[JobContext], dict | None]
+_HANDLERS: dict[str, Handler] = {}
+
+
+def handler(kind: str) -> Callable[[Handler], Handler]:
+    """Register the function that runs jobs of ``kind``."""
+
+    def register(fn: Handler) -> Handler:
+        _HANDLERS[kind] = fn
+        return fn
+
+    return register
+
+
+_wakeup = threading.Event()
+
+
+def enqueue(
+    db: Session,
+    kind: str,
+    cosplay_id: int | None = None,
+    payload: dict | None = None,
+) -> Job:
+    job = Job(
+        kind=kind,
+        cosplay_id=cosplay_id,
+        payload=json.dumps(payload) if payload is not None else None,
+        status=QUEUED,
+        max_attempts=config.JOB_MAX_ATTEMPTS,
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    _wakeup.set()
+    return job
+
+
+def enqueue_many(db: Session, kind: str, cosplay_ids: list[int]) -> None:
+    """Queue one job per cosplay in the same commit as anything pending in ``db``.
+
+    Cosplays that already have a queued job of this kind are skipped: that job
+    has not looked at the directory yet and will pick up the new files anyway.
+    """
+    already_queued = set(
+        db.scalars(
+            select(Job.cosplay_id).where(
+                Job.kind == kind,
+                Job.status == QUEUED,
+                Job.cosplay_id.in_(cosplay_ids),
+            )
+        )
+    )
+    cosplay_ids = [i for i in cosplay_ids if i not in already_queued]
+    db.add_all(
+        Job(
+            kind=kind,
+            cosplay_id=cosplay_id,
+            status=QUEUED,
+            max_attempts=config.JOB_MAX_ATTEMPTS,
+        )
+        for cosplay_id in cosplay_ids
+    )
+    db.commit()
+    _wakeup.set()
+
+
+def cancel(db: Session, job: Job) -> Job:
+    """Cancel a queued job outright; ask a running one to stop at its next step."""
+    if job.status == QUEUED:
+        job.status = CANCELLED
+        job.finished_at = _utcnow()
+    elif job.status == RUNNING:
+        job.cancel_requested = True
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+def _claim_next() -> int | None:
+    now = _utcnow()
+    with SessionLocal() as db:
+        candidates = db.scalars(
+            select(Job.id)
+            .where(
+                Job.status == QUEUED,
+                or_(Job.not_before.is_(None), Job.not_before <= now),
+            )
+            .order_by(Job.id)
+            .limit(5)
+        ).all()
+        for job_id in candidates:
+            claimed = db.execute(
+                update(Job)
+                .where(Job.id == job_id, Job.status == QUEUED)
+                .values(
+                    status=RUNNING,
+                    started_at=now,
+                    owner=_OWNER,
+                    heartbeat_at=now,
+                    attempts=Job.attempts + 1,
+                )
+            ).rowcount
+            db.commit()
+            if claimed:
+                return job_id
+    return None
+
+
+def _renew_leases() -> None:
+    with SessionLocal() as db:
+        db.execute(
+            update(Job)
+            .where(Job.status == RUNNING, Job.owner == _OWNER)
+            .values(heartbeat_at=_utcnow())
+        )
+        db.commit()
+
+
+def requeue_expired() -> int:
+    """Put running jobs whose lease has expired back in the queue.
+
+    Their process stopped renewing the lease, i.e. it exited mid-job. Jobs that
+    predate leases fall back to their start time. Returns how many were requeued.
+    """
+    cutoff = _utcnow() - timedelta(seconds=config.JOB_LEASE_SECONDS)
+    with SessionLocal() as db:
+        count = db.execute(
+            update(Job)
+            .where(
+                Job.status == RUNNING,
+                or_(
+                    Job.heartbeat_at < cutoff,
+                    and_(
+                        Job.heartbeat_at.is_(None),
+                        or_(Job.started_at.is_(None), Job.started_at < cutoff),
+                    ),
+                ),
+            )
+            .values(status=QUEUED, owner=None, heartbeat_at=None)
+        ).rowcount
+        db.commit()
+    if count:
+        logger.warning("Requeued %d job(s) whose worker stopped responding", count)
+        _wakeup.set()
+    return count
+
+
+def _run(job_id: int) -> None:
+    with SessionLocal() as db:
+        job = db.get(Job, job_id)
+        fn = _HANDLERS.get(job.kind)
+        try:
+            if fn is None:
+                raise LookupError(f"No handler for job kind {job.kind!r}")
+            result = fn(JobContext(db, job))
+        except JobCancelled:
+            db.rollback()
+            job.status = CANCELLED
+            job.finished_at = _utcnow()
+        except Exception:
+            db.rollback()
+            logger.exception("Job %s (%s) failed", job.id, job.kind)
+            job.error = traceback.format_exc()
+            if fn is not None and job.attempts < job.max_attempts:
+                job.status = QUEUED
+                job.not_before = _utcnow() + timedelta(seconds=2**job.attempts)
+            else:
+                job.status = FAILED
+                job.finished_at = _utcnow()
+        else:
+            job.status = SUCCEEDED
+            job.result = json.dumps(result) if result is not None else None
+            job.error = None
+            job.finished_at = _utcnow()
+        db.commit()
+
+
+class JobWorkerPool:
+    """A fixed number of daemon threads that claim and run queued jobs.
+
+    One more thread renews the leases of this process's running jobs and
+    requeues those of processes that stopped renewing theirs.
+    """
+
+    def __init__(self, workers: int) -> None:
+        self.workers = workers
+        self._stop = threading.Event()
+        self._threads: list[threading.Thread] = []
+
+    def start(self) -> None:
+        requeue_expired()
+        for i in range(self.workers):
+            thread = threading.Thread(
+                target=self._loop, name=f"cosepic-job-{i}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+        thread = threading.Thread(
+            target=self._lease_loop, name="cosepic-job-lease", daemon=True
+        )
+        thread.start()
+        self._threads.append(thread)
+
+    def stop(self, timeout: float = 10.0) -> None:
+        self._stop.set()
+        _wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads.clear()
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                job_id = _claim_next()
+            except Exception:
+                logger.exception("Failed to claim job")
+                job_id = None
+            if job_id is None:
+                _wakeup.wait(config.JOB_POLL_SECONDS)
+                _wakeup.clear()
+                continue
+            _run(job_id)
+
+    def _lease_loop(self) -> None:
+        # 续租间隔取租约的三分之一，偶尔一次写库失败也不会让租约过期
+        while not self._stop.wait(config.JOB_LEASE_SECONDS / 3):
+            try:
+                _renew_leases()
+                requeue_expired()
+            except Exception:
+                logger.exception("Failed to renew job leases")
+
+
+_pool: JobWorkerPool | None = None
+
+
+def start_workers() -> None:
+    global _pool
+    if _pool is None and config.JOB_WORKERS > 0:
+        _pool = JobWorkerPool(config.JOB_WORKERS)
+        _pool.start()
+
+
+def stop_workers() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.stop()
+        _pool = None
+
+
+@handler("process_cosplay")
+def _process_cosplay(ctx: JobContext) -> dict:
+    """生成缩略图并计算 pHash/blurhash，截取视频封面帧，补齐打包下载所需的 CRC。"""
+    from .archive import fill_checksums
+    from .thumbnail import process_cosplay_images
+    from .video import process_cosplay_videos
+
+    cosplay = ctx.db.get(Cosplay, ctx.job.cosplay_id)
+    if cosplay is None:
+        return {"thumbnails_generated": 0, "hashes_computed": 0}
+    thumb_count, hash_count = process_cosplay_images(
+        cosplay, ctx.db, progress=ctx.progress
+    )
+    # 后两步不细分进度，只在步骤之间检查是否已取消
+    total = cosplay.photo_count
+    ctx.progress(total, total)
+    poster_count = process_cosplay_videos(cosplay, ctx.db)
+    ctx.progress(total, total)
+    fill_checksums(ctx.db, cosplay.id, Path(cosplay.dir_path))
+    return {
+        "thumbnails_generated": thumb_count,
+        "hashes_computed": hash_count,
+        "posters_extracted": poster_count,
+    }
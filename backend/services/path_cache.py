@@ -0,0 +1,110 @@
+"""静态文件请求的路径缓存：cosplay id -> 目录、封面、文件版本号与缩略图清单，
+coser id -> 头像。
+
+图库页面一次会发出上百个文件请求，命中缓存时完全不访问数据库。条目在管理端修改、
+重新扫描后立即失效；其他进程（CLI 等）的修改最迟在 TTL 到期后生效。
+"""
+
+from dataclasses import dataclass
+from pathlib import Path
+from typing import NamedTuple
+
+from .. import config
+from ..database import ReadSessionLocal
+from ..models import Coser, Cosplay, MediaFile, Thumbnail
+from .cache import TTLCache
+from .scanner import media_version
+
+
+class ThumbnailVariant(NamedTuple):
+    path: Path
+    # 生成时原图的版本号
+    version: str
+
+
+@dataclass(frozen=True)
+class CosplayPaths:
+    dir_path: Path
+    cover_path: str | None
+    cover_version: str | None
+    # 文件名 -> 版本号（来自文件清单）
+    versions: dict[str, str]
+    # (文件名, 宽度档位, 格式) -> 缩略图（来自缩略图清单）；新生成的缩略图由文件接口
+    # 直接补进来，不必让整个条目失效
+    thumbnails: dict[tuple[str, int, str], ThumbnailVariant]
+
+
+@dataclass(frozen=True)
+class CoserPaths:
+    avatar_path: Path | None
+
+
+_cosplays: TTLCache[int, CosplayPaths] = TTLCache(
+    config.PATH_CACHE_SIZE, config.PATH_CACHE_TTL_SECONDS
+)
+_cosers: TTLCache[int, CoserPaths] = TTLCache(
+    config.PATH_CACHE_SIZE, config.PATH_CACHE_TTL_SECONDS
+)
+
+
+def get_cosplay_paths(cosplay_id: int) -> CosplayPaths | None:
+    """Paths, file versions and thumbnails of a cosplay; ``None`` if it is gone."""
+    from .thumbnail import THUMBNAIL_DIR
+
+    paths = _cosplays.get(cosplay_id)
+    if paths is not None:
+        return paths
+    with ReadSessionLocal() as db:
+        row = (
+            db.query(Cosplay.dir_path, Cosplay.cover_path, Cosplay.cover_version)
+            .filter(Cosplay.id == cosplay_id)
+            .first()
+        )
+        if row is None:
+            # 不缓存不存在的 id：它可能马上就会被创建
+            return None
+        versions = {
+            f.filename: media_version(f.mtime_ns, f.size)
+            for f in db.query(
+                MediaFile.filename, MediaFile.mtime_ns, MediaFile.size
+            ).filter(MediaFile.cosplay_id == cosplay_id)
+        }
+        thumbnails = {
+            (t.filename, t.max_width, t.format): ThumbnailVariant(
+                THUMBNAIL_DIR / t.path, t.version
+            )
+            for t in db.query(
+                Thumbnail.filename,
+                Thumbnail.max_width,
+                Thumbnail.format,
+                Thumbnail.path,
+                Thumbnail.version,
+            ).filter(Thumbnail.cosplay_id == cosplay_id)
+        }
+    paths = CosplayPaths(
+        Path(row.dir_path), row.cover_path, row.cover_version, versions, thumbnails
+    )
+    _cosplays.put(cosplay_id, paths)
+    return paths
+
+
+def get_coser_paths(coser_id: int) -> CoserPaths | None:
+    """Avatar path of a coser; ``None`` if the coser does not exist."""
+    paths = _cosers.get(coser_id)
+    if paths is not None:
+        return paths
+    with ReadSessionLocal() as db:
+        row = db.query(Coser.avatar_path).filter(Coser.id == coser_id).first()
+    if row is None:
+        return None
+    paths = CoserPaths(Path(row.avatar_path) if row.avatar_path else None)
+    _cosers.put(coser_id, paths)
+    return paths
+
+
+def invalidate_cosplay(cosplay_id: int | None = None) -> None:
+    _cosplays.invalidate(cosplay_id)
+
+
+def invalidate_coser(coser_id: int | None = None) -> None:
+    _cosers.invalidate(coser_id)
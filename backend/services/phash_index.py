@@ -0,0 +1,314 @@
+"""pHash 近邻索引：按 16 位分段做多索引哈希（multi-index hashing），距离用 NumPy 批量计算。"""
+
+import threading
+from collections.abc import Iterable, Iterator
+from functools import lru_cache
+
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from ..database import ReadSessionLocal
+from ..models import ImageHash
+
+SEGMENTS = 4
+SEGMENT_BITS = 16
+SEGMENT_MASK = (1 << SEGMENT_BITS) - 1
+_UINT64_MASK = (1 << 64) - 1
+# 单次向量化比较的元素上限，避免大桶两两比较时内存暴涨
+_CHUNK_ELEMENTS = 1 << 20
+
+
+def phash_to_int(phash: str) -> int:
+    """Hex pHash -> signed 64-bit integer, as stored in ``ImageHash.phash_int``."""
+    value = int(phash, 16)
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def hamming_distance(h1: int, h2: int) -> int:
+    """Number of differing bits between two pHashes."""
+    return (h1 ^ h2).bit_count()
+
+
+def _segment(h: int, s: int) -> int:
+    return (h >> (SEGMENT_BITS * s)) & SEGMENT_MASK
+
+
+@lru_cache(maxsize=None)
+def _segment_masks(radius: int) -> tuple[int, ...]:
+    """XOR masks that move a segment key by at most ``radius`` bits."""
+    return tuple(m for m in range(1 << SEGMENT_BITS) if m.bit_count() <= radius)
+
+
+def _nearby_buckets(
+    table: dict, key: int, radius: int, upper: bool = True
+) -> Iterator[tuple[int, Iterable[int]]]:
+    """Buckets whose key is within ``radius`` of ``key``.
+
+    With ``upper`` set, only keys not below ``key`` are returned, so that a
+    self-join visits each pair of buckets once.
+    """
+    masks = _segment_masks(radius)
+    if len(masks) < len(table):
+        for mask in masks:
+            other_key = key ^ mask
+            if (other_key >= key or not upper) and other_key in table:
+                yield other_key, table[other_key]
+    else:
+        for other_key, other in table.items():
+            if (other_key >= key or not upper) and hamming_distance(
+                key, other_key
+            ) <= radius:
+                yield other_key, other
+
+
+class PhashIndex:
+    """Multi-index hash table over distinct pHash values.
+
+    Each 64-bit hash is split into four 16-bit segments with one table per
+    segment. Two hashes within distance ``t`` must agree to within ``t // 4``
+    bits on at least one segment, so only nearby buckets are ever compared.
+    Each hash also remembers which cosplays reference it (with a row count),
+    so the dedup report can tell cross-cosplay matches apart without loading
+    rows. All distinct hashes are additionally packed into a ``uint64`` array
+    for single-query scans; new hashes are appended to it, removals rebuild it.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.RLock()
+        self._refs: dict[int, dict[int, int]] = {}
+        self._tables: list[dict[int, set[int]]] = [{} for _ in range(SEGMENTS)]
+        self._packed: np.ndarray | None = None
+        # 上次打包之后新增的哈希；查询时拼接到数组末尾，免得每次新增都全量重建
+        self._pending: list[int] = []
+
+    def __len__(self) -> int:
+        return len(self._refs)
+
+    def add(self, phash: str, cosplay_id: int) -> None:
+        self.add_int(int(phash, 16), cosplay_id)
+
+    def add_int(self, h: int, cosplay_id: int) -> None:
+        h &= _UINT64_MASK
+        with self._lock:
+            refs = self._refs.get(h)
+            if refs is None:
+                refs = self._refs[h] = {}
+                for s, table in enumerate(self._tables):
+                    table.setdefault(_segment(h, s), set()).add(h)
+                self._pending.append(h)
+            refs[cosplay_id] = refs.get(cosplay_id, 0) + 1
+
+    def remove(self, phash: str, cosplay_id: int) -> None:
+        h = int(phash, 16)
+        with self._lock:
+            refs = self._refs.get(h)
+            if refs is None or cosplay_id not in refs:
+                return
+            refs[cosplay_id] -= 1
+            if refs[cosplay_id] <= 0:
+                del refs[cosplay_id]
+            if refs:
+                return
+            del self._refs[h]
+            for s, table in enumerate(self._tables):
+                bucket = table[_segment(h, s)]
+                bucket.discard(h)
+                if not bucket:
+                    del table[_segment(h, s)]
+            self._packed = None
+
+    def cosplay_ids(self, phash: str) -> set[int]:
+        with self._lock:
+            return set(self._refs.get(int(phash, 16), ()))
+
+    def packed(self) -> np.ndarray:
+        """All distinct hashes as a ``uint64`` array."""
+        with self._lock:
+            if self._packed is None:
+                self._packed = np.fromiter(
+                    self._refs.keys(), dtype=np.uint64, count=len(self._refs)
+                )
+            elif self._pending:
+                pending = np.array(self._pending, dtype=np.uint64)
+                self._packed = np.concatenate([self._packed, pending])
+            self._pending.clear()
+            return self._packed
+
+    def search(
+        self, phash: str, threshold: int, limit: int | None = None
+    ) -> list[tuple[str, int]]:
+        """Return hashes within ``threshold`` of ``phash``, nearest first.
+
+        This is a single XOR + popcount pass over the packed array.
+        """
+        values = self.packed()
+        dist = np.bitwise_count(values ^ np.uint64(int(phash, 16)))
+        hits = np.flatnonzero(dist <= threshold)
+        hits = hits[np.argsort(dist[hits], kind="stable")]
+        if limit is not None:
+            hits = hits[:limit]
+        return [(f"{int(values[i]):016x}", int(dist[i])) for i in hits]
+
+    def pairs(self, threshold: int) -> Iterator[tuple[str, str, int]]:
+        """Yield each unordered pair of distinct indexed hashes within ``threshold``.
+
+        Pairs are enumerated bucket-against-bucket; a pair is reported only by
+        the first segment that brings it into range, so nothing is emitted twice.
+        """
+        radius = threshold // SEGMENTS
+        with self._lock:
+            tables = [
+                {
+                    key: np.fromiter(bucket, dtype=np.uint64, count=len(bucket))
+                    for key, bucket in table.items()
+                }
+                for table in self._tables
+            ]
+        for s, table in enumerate(tables):
+            for key, bucket in table.items():
+                # 桶内两两比较：按行分块遍历上三角，每块最多约 _CHUNK_ELEMENTS 对
+                start = 0
+                while start < len(bucket) - 1:
+                    width = len(bucket) - start - 1
+                    step = max(1, _CHUNK_ELEMENTS // width)
+                    stop = min(start + step, len(bucket) - 1)
+                    i = np.repeat(np.arange(start, stop), width)
+                    j = np.tile(np.arange(start + 1, len(bucket)), stop - start)
+                    keep = j > i
+                    yield from _matches(
+                        bucket[i[keep]], bucket[j[keep]], s, radius, threshold
+                    )
+                    start = stop
+                nearby = [
+                    other
+                    for other_key, other in _nearby_buckets(table, key, radius)
+                    if other_key != key
+                ]
+                if not nearby:
+                    continue
+                candidates = np.concatenate(nearby)
+                step = max(1, _CHUNK_ELEMENTS // len(candidates))
+                for start in range(0, len(bucket), step):
+                    rows = bucket[start : start + step]
+                    yield from _matches(
+                        np.repeat(rows, len(candidates)),
+                        np.tile(candidates, len(rows)),
+                        s,
+                        radius,
+                        threshold,
+                    )
+
+    def exact_duplicates(self) -> Iterator[str]:
+        """Yield hashes shared by more than one cosplay."""
+        with self._lock:
+            shared = [h for h, refs in self._refs.items() if len(refs) > 1]
+        for h in shared:
+            yield f"{h:016x}"
+
+
+def _matches(
+    a: np.ndarray, b: np.ndarray, segment: int, radius: int, threshold: int
+) -> Iterator[tuple[str, str, int]]:
+    """Vectorized XOR + popcount over candidate pairs ``(a[i], b[i])``.
+
+    Pairs that an earlier segment already brings within ``radius`` are dropped,
+    since that segment reports them.
+    """
+    x = a ^ b
+    dist = np.bitwise_count(x)
+    keep = dist <= threshold
+    for p in range(segment):
+        part = (x >> np.uint64(SEGMENT_BITS * p)) & np.uint64(SEGMENT_MASK)
+        keep &= np.bitwise_count(part) > radius
+    for h1, h2, d in zip(a[keep].tolist(), b[keep].tolist(), dist[keep].tolist()):
+        if h1 > h2:
+            h1, h2 = h2, h1
+        yield f"{h1:016x}", f"{h2:016x}", d
+
+
+_index: PhashIndex | None = None
+# 索引已载入的 image_hashes 最大行 id 和行数。每次取索引都与表比对，其他进程（别的
+# API worker、命令行跑的任务）提交的增删也能看到：只多了新行就按 id 增量载入，其余
+# 差异（别处删了行）重建
+_max_id = 0
+_row_count = 0
+# 保护 _index 与上面两个计数，只短暂持有；_build_lock 保证同一时间只有一次载入
+_index_lock = threading.Lock()
+_build_lock = threading.Lock()
+
+
+def _table_state(db: Session) -> tuple[int, int]:
+    return db.query(
+        func.coalesce(func.max(ImageHash.id), 0), func.count(ImageHash.id)
+    ).one()
+
+
+def _load_rows(db: Session, index: PhashIndex, after_id: int) -> tuple[int, int]:
+    """Add rows with ``id > after_id``; returns the highest id seen and the count."""
+    max_id, count = after_id, 0
+    for row_id, phash_int, cosplay_id in (
+        db.query(ImageHash.id, ImageHash.phash_int, ImageHash.cosplay_id)
+        .filter(ImageHash.id > after_id)
+        .yield_per(10000)
+    ):
+        index.add_int(phash_int, cosplay_id)
+        max_id = max(max_id, row_id)
+        count += 1
+    return max_id, count
+
+
+def get_phash_index(db: Session) -> PhashIndex:
+    """Return the process-wide index, in step with ``image_hashes``.
+
+    Built on first use. Each call compares the table's highest id and row count
+    with what the index has loaded: rows committed since (by any process) are
+    added incrementally, and any other difference rebuilds the index.
+    """
+    global _index, _max_id, _row_count
+    state = _table_state(db)
+    with _index_lock:
+        if _index is not None and state == (_max_id, _row_count):
+            return _index
+    with _build_lock:
+        state = _table_state(db)
+        with _index_lock:
+            index, max_id, row_count = _index, _max_id, _row_count
+        if index is not None:
+            if state == (max_id, row_count):
+                return index
+            if state[0] > max_id:
+                new_max_id, added = _load_rows(db, index, max_id)
+                with _index_lock:
+                    _max_id = new_max_id
+                    _row_count += added
+                    if (_max_id, _row_count) == state:
+                        return index
+        index = PhashIndex()
+        max_id, row_count = _load_rows(db, index, 0)
+        with _index_lock:
+            _index, _max_id, _row_count = index, max_id, row_count
+        return index
+
+
+def warm_phash_index() -> None:
+    """Build the index on a background thread, so the first search need not wait."""
+
+    def build() -> None:
+        with ReadSessionLocal() as db:
+            get_phash_index(db)
+
+    threading.Thread(target=build, name="phash-index", daemon=True).start()
+
+
+def unindex_phashes(cosplay_id: int, phashes: Iterable[str]) -> None:
+    """Drop the hashes of just-deleted rows from the index.
+
+    Saves the next lookup a rebuild; anything missed here is caught there.
+    """
+    global _row_count
+    with _index_lock:
+        if _index is not None:
+            for phash in phashes:
+                _index.remove(phash, cosplay_id)
+                _row_count -= 1
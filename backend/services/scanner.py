@@ -0,0 +1,294 @@
+"""图集目录扫描：维护每个文件的清单（大小、mtime、inode），只处理变化的文件。
+
+目录 mtime 未变时直接跳过整个目录。注意：原地改写文件内容不会改变目录 mtime，
+这种情况需要 full=True 逐个比对。
+"""
+
+import os
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from sqlalchemy import case, func
+from sqlalchemy.orm import Session
+
+from ..models import Cosplay, ImageHash, MediaFile, Thumbnail
+from . import jobs
+from .phash_index import unindex_phashes
+
+IMAGE_EXTENSIONS = {".avif", ".jpg", ".jpeg", ".png", ".webp", ".gif", ".bmp"}
+VIDEO_EXTENSIONS = {".mp4", ".mkv", ".avi", ".mov", ".webm"}
+
+
+def natural_sort_key(s: str) -> list:
+    return [
+        int(part) if part.isdigit() else part.lower() for part in re.split(r"(\d+)", s)
+    ]
+
+
+def media_version(mtime_ns: int, size: int) -> str:
+    """Short token that changes whenever the file is replaced or rewritten."""
+    return f"{mtime_ns:x}-{size:x}"
+
+
+def normalize_dir_path(path: str | Path) -> str:
+    """Canonical form of a set directory, as stored in ``Cosplay.dir_path``.
+
+    Absolute, with symlinks, ``..`` and trailing slashes resolved, so one
+    directory cannot be stored under two spellings.
+    """
+    return str(Path(path).resolve())
+
+
+def media_kind(filename: str) -> str | None:
+    suffix = os.path.splitext(filename)[1].lower()
+    if suffix in IMAGE_EXTENSIONS:
+        return "image"
+    if suffix in VIDEO_EXTENSIONS:
+        return "video"
+    return None
+
+
+@dataclass
+class ScanResult:
+    skipped: bool = False
+    added: list[str] = field(default_factory=list)
+    changed: list[str] = field(default_factory=list)
+    removed: list[str] = field(default_factory=list)
+    # 被清理的 ImageHash 的 pHash；调用方提交后需从近邻索引中移除
+    removed_phashes: list[str] = field(default_factory=list)
+
+
+def _remove_thumbnail(cosplay_id: int, filename: str, unique_stem: bool) -> None:
+    from .thumbnail import default_thumbnail_path, legacy_thumbnail_path
+    from .video import poster_path
+
+    if media_kind(filename) == "video":
+        # 视频的缩略图从封面帧生成
+        poster_path(cosplay_id, filename).unlink(missing_ok=True)
+    elif unique_stem:
+        # 旧版本按主文件名命名的缩略图；主文件名有重复时无法确定归属，留着不动
+        legacy_thumbnail_path(cosplay_id, filename).unlink(missing_ok=True)
+    default_thumbnail_path(cosplay_id, filename).unlink(missing_ok=True)
+
+
+def sync_cosplay_files(db: Session, cosplay: Cosplay, full: bool = False) -> ScanResult:
+    """Bring the file manifest of one cosplay up to date with its directory.
+
+    Changed and deleted files lose their thumbnail and ``ImageHash`` row so the
+    processing pass regenerates only those. Does not commit.
+    """
+    try:
+        dir_stat = os.stat(cosplay.dir_path)
+    except OSError:
+        # 目录不可达（例如网络存储未挂载）时不清理任何数据
+        return ScanResult(skipped=True)
+    if not full and cosplay.dir_mtime_ns == dir_stat.st_mtime_ns:
+        return ScanResult(skipped=True)
+
+    manifest = {
+        row.filename: row
+        for row in db.query(MediaFile).filter(MediaFile.cosplay_id == cosplay.id)
+    }
+    result = ScanResult()
+    seen: set[str] = set()
+    with os.scandir(cosplay.dir_path) as entries:
+        for entry in entries:
+            kind = media_kind(entry.name)
+            if kind is None or not entry.is_file():
+                continue
+            st = entry.stat()
+            seen.add(entry.name)
+            row = manifest.get(entry.name)
+            if row is None:
+                db.add(
+                    MediaFile(
+                        cosplay_id=cosplay.id,
+                        filename=entry.name,
+                        kind=kind,
+                        size=st.st_size,
+                        mtime_ns=st.st_mtime_ns,
+                        inode=st.st_ino,
+                    )
+                )
+                result.added.append(entry.name)
+            elif (row.size, row.mtime_ns, row.inode) != (
+                st.st_size,
+                st.st_mtime_ns,
+                st.st_ino,
+            ):
+                row.size = st.st_size
+                row.mtime_ns = st.st_mtime_ns
+                row.inode = st.st_ino
+                # 元数据留待处理任务重新解码
+                row.width = row.height = row.orientation = None
+                row.format = row.dominant_color = row.crc32 = None
+                result.changed.append(entry.name)
+
+    for filename, row in manifest.items():
+        if filename not in seen:
+            db.delete(row)
+            result.removed.append(filename)
+
+    stale = result.changed + result.removed
+    if stale:
+        result.removed_phashes = [
+            row.phash
+            for row in db.query(ImageHash.phash).filter(
+                ImageHash.cosplay_id == cosplay.id, ImageHash.filename.in_(stale)
+            )
+        ]
+        db.query(ImageHash).filter(
+            ImageHash.cosplay_id == cosplay.id, ImageHash.filename.in_(stale)
+        ).delete(synchronize_session=False)
+        # 按需生成的其他尺寸文件名带版本号，不会再被命中，留给 LRU 淘汰
+        db.query(Thumbnail).filter(
+            Thumbnail.cosplay_id == cosplay.id, Thumbnail.filename.in_(stale)
+        ).delete(synchronize_session=False)
+        stems = Counter(
+            Path(filename).stem
+            for filename in manifest.keys() | seen
+            if media_kind(filename) == "image"
+        )
+        for filename in stale:
+            _remove_thumbnail(cosplay.id, filename, stems[Path(filename).stem] == 1)
+
+    cosplay.dir_mtime_ns = dir_stat.st_mtime_ns
+    db.flush()
+    if result.added or result.removed:
+        renumber_media_files(db, cosplay.id)
+    refresh_cosplay_stats(db, cosplay)
+    return result
+
+
+def manifest_is_current(db: Session, cosplay: Cosplay) -> bool:
+    """Whether a full rescan would leave the manifest of ``cosplay`` unchanged.
+
+    Stats the directory and every manifest file; reads and writes nothing else.
+    An unreachable directory counts as current, as ``sync_cosplay_files`` skips it.
+    """
+    try:
+        dir_stat = os.stat(cosplay.dir_path)
+    except OSError:
+        return True
+    # 目录 mtime 变化说明有文件增删或改名
+    if cosplay.dir_mtime_ns != dir_stat.st_mtime_ns:
+        return False
+    rows = db.query(
+        MediaFile.filename, MediaFile.size, MediaFile.mtime_ns, MediaFile.inode
+    ).filter(MediaFile.cosplay_id == cosplay.id)
+    for filename, size, mtime_ns, inode in rows:
+        try:
+            st = os.stat(os.path.join(cosplay.dir_path, filename))
+        except OSError:
+            return False
+        if (st.st_size, st.st_mtime_ns, st.st_ino) != (size, mtime_ns, inode):
+            return False
+    return True
+
+
+def renumber_media_files(db: Session, cosplay_id: int) -> None:
+    """Store the natural-sort position of every file so listings need no sorting."""
+    rows = db.query(MediaFile).filter(MediaFile.cosplay_id == cosplay_id).all()
+    for kind in ("image", "video"):
+        same_kind = [row for row in rows if row.kind == kind]
+        same_kind.sort(key=lambda row: natural_sort_key(row.filename))
+        for position, row in enumerate(same_kind):
+            row.position = position
+    db.flush()
+
+
+def refresh_cosplay_stats(db: Session, cosplay: Cosplay) -> None:
+    """Derive photo/video counts, total size and cover from the manifest."""
+    photo_count, video_count, total_size = (
+        db.query(
+            func.count(case((MediaFile.kind == "image", 1))),
+            func.count(case((MediaFile.kind == "video", 1))),
+            func.coalesce(func.sum(MediaFile.size), 0),
+        )
+        .filter(MediaFile.cosplay_id == cosplay.id)
+        .one()
+    )
+    cosplay.photo_count = photo_count
+    cosplay.video_count = video_count
+    cosplay.total_size = total_size
+    first_image = first_image_filename(db, cosplay.id)
+    if first_image:
+        cosplay.cover_path = first_image
+    cover = (
+        db.query(MediaFile.mtime_ns, MediaFile.size)
+        .filter(
+            MediaFile.cosplay_id == cosplay.id,
+            MediaFile.filename == cosplay.cover_path,
+        )
+        .first()
+    )
+    cosplay.cover_version = media_version(*cover) if cover else None
+
+
+def first_image_filename(
+    db: Session, cosplay_id: int, exclude: str | None = None
+) -> str | None:
+    query = db.query(MediaFile.filename).filter(
+        MediaFile.cosplay_id == cosplay_id, MediaFile.kind == "image"
+    )
+    if exclude is not None:
+        query = query.filter(MediaFile.filename != exclude)
+    return query.order_by(MediaFile.position).limit(1).scalar()
+
+
+def rescan_cosplay(db: Session, cosplay: Cosplay, full: bool = False) -> ScanResult:
+    """``sync_cosplay_files`` + commit, keeping the pHash index in step."""
+    from .path_cache import invalidate_cosplay
+
+    result = sync_cosplay_files(db, cosplay, full=full)
+    db.commit()
+    unindex_phashes(cosplay.id, result.removed_phashes)
+    if not result.skipped:
+        invalidate_cosplay(cosplay.id)
+    return result
+
+
+def ensure_manifest(db: Session, cosplay: Cosplay) -> None:
+    """Build the manifest of a cosplay that has never been scanned (e.g. legacy rows).
+
+    Afterwards listings are served from the database alone; keeping it current
+    is left to rescans and the watcher.
+    """
+    if cosplay.dir_mtime_ns is None:
+        rescan_cosplay(db, cosplay)
+
+
+def rescan_library(
+    db: Session, full: bool = False, progress: jobs.Progress | None = None
+) -> dict:
+    """Rescan every cosplay and queue processing for those with new or changed files."""
+    cosplay_ids = [row.id for row in db.query(Cosplay.id).order_by(Cosplay.id)]
+    stats = {"scanned": 0, "skipped": 0, "added": 0, "changed": 0, "removed": 0}
+    dirty: list[int] = []
+    for i, cosplay_id in enumerate(cosplay_ids):
+        if progress:
+            progress(i, len(cosplay_ids))
+        cosplay = db.get(Cosplay, cosplay_id)
+        if cosplay is None:
+            continue
+        result = rescan_cosplay(db, cosplay, full=full)
+        stats["skipped" if result.skipped else "scanned"] += 1
+        stats["added"] += len(result.added)
+        stats["changed"] += len(result.changed)
+        stats["removed"] += len(result.removed)
+        if result.added or result.changed:
+            dirty.append(cosplay_id)
+    if dirty:
+        jobs.enqueue_many(db, "process_cosplay", dirty)
+    if progress:
+        progress(len(cosplay_ids), len(cosplay_ids))
+    return stats
+
+
+@jobs.handler("rescan_library")
+def _rescan_library_job(ctx: jobs.JobContext) -> dict:
+    return rescan_library(
+        ctx.db, full=ctx.payload.get("full", False), progress=ctx.progress
+    )
@@ -0,0 +1,279 @@
+"""搜索：图集标题、Coser 名、作品名的全文搜索，以及按 pHash 以图搜图。
+
+SQLite 下三类名称存放在同一张 FTS5 虚拟表 search_index，使用 trigram 分词：不依赖空格
+切词，中日文名称按任意子串命中，结果按 bm25 排序。rowid 编码为 ``id * 3 + 类别``，增删改
+由建表时创建的触发器按 rowid 同步，导入、后台编辑、级联删除都不会漏。
+
+trigram 无法索引不足 3 个字符的词（两个字的中文名很常见），这类词对 search_index 的
+正文逐行匹配；索引表只有名称，扫描代价很小。其他数据库或没有 FTS5 的 SQLite 退回到对
+原表的 ILIKE 查询。
+
+以图搜图不查数据库里的哈希，而是在 phash_index 的内存数组上做一次向量化的异或加
+popcount，只为最近的若干个哈希回表取文件名和图集。
+"""
+
+from sqlalchemy import ColumnElement, and_, func, literal, select, text, true, union_all
+from sqlalchemy.engine import Connection
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from ..models import Coser, Cosplay, ImageHash, Parody
+from .phash_index import get_phash_index
+
+# rowid % 3 对应的类别
+KINDS = ("cosplay", "coser", "parody")
+
+_NAME_COLUMNS = {"cosplay": Cosplay.title, "coser": Coser.name, "parody": Parody.name}
+_TABLES = {"cosplay": "cosplays", "coser": "cosers", "parody": "parodies"}
+
+_TRIGRAM = 3
+
+_fts_enabled: dict[str, bool] = {}
+
+
+def create_search_index(conn: Connection) -> None:
+    """Create ``search_index`` with its sync triggers and fill it; SQLite only.
+
+    Does nothing if it already exists, on other backends, or when SQLite lacks
+    the FTS5 trigram tokenizer. Run on every start, so the index appears once
+    SQLite is upgraded.
+    """
+    if conn.dialect.name != "sqlite" or not _fts5_trigram_supported(conn):
+        return
+    exists = conn.scalar(
+        text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'search_index'"
+        )
+    )
+    if exists:
+        return
+    conn.execute(
+        text(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS search_index"
+            " USING fts5(text, tokenize = 'trigram')"
+        )
+    )
+    for code, kind in enumerate(KINDS):
+        table = _TABLES[kind]
+        column = _NAME_COLUMNS[kind].key
+        rowid = f"{{row}}.id * 3 + {code}"
+        conn.execute(
+            text(
+                f"CREATE TRIGGER IF NOT EXISTS search_{table}_insert"
+                f" AFTER INSERT ON {table} BEGIN"
+                f" INSERT INTO search_index (rowid, text)"
+                f" VALUES ({rowid.format(row='new')}, new.{column}); END"
+            )
+        )
+        conn.execute(
+            text(
+                f"CREATE TRIGGER IF NOT EXISTS search_{table}_update"
+                f" AFTER UPDATE OF {column} ON {table} BEGIN"
+                f" UPDATE search_index SET text = new.{column}"
+                f" WHERE rowid = {rowid.format(row='new')}; END"
+            )
+        )
+        conn.execute(
+            text(
+                f"CREATE TRIGGER IF NOT EXISTS search_{table}_delete"
+                f" AFTER DELETE ON {table} BEGIN"
+                f" DELETE FROM search_index WHERE rowid = {rowid.format(row='old')};"
+                f" END"
+            )
+        )
+        conn.execute(
+            text(
+                f"INSERT INTO search_index (rowid, text)"
+                f" SELECT id * 3 + {code}, {column} FROM {table}"
+            )
+        )
+
+
+def _fts5_trigram_supported(conn: Connection) -> bool:
+    try:
+        conn.execute(
+            text(
+                "CREATE VIRTUAL TABLE temp.fts5_probe USING fts5(t, tokenize = trigram)"
+            )
+        )
+    except OperationalError:
+        return False
+    conn.execute(text("DROP TABLE temp.fts5_probe"))
+    return True
+
+
+def _has_search_index(db: Session) -> bool:
+    bind = db.get_bind()
+    url = str(bind.url)
+    if url not in _fts_enabled:
+        _fts_enabled[url] = bind.dialect.name == "sqlite" and (
+            db.scalar(
+                text(
+                    "SELECT 1 FROM sqlite_master"
+                    " WHERE type = 'table' AND name = 'search_index'"
+                )
+            )
+            is not None
+        )
+    return _fts_enabled[url]
+
+
+def _terms(q: str) -> list[str]:
+    return q.split()
+
+
+def _like(term: str) -> str:
+    escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+def _index_where(terms: list[str], kind: str | None) -> tuple[str, dict]:
+    """WHERE clause on ``search_index`` matching every term, and its parameters.
+
+    Terms long enough for trigrams go into one MATCH expression (quoted as
+    phrases, so user input is never parsed as FTS5 syntax); shorter ones are
+    matched against the stored text.
+    """
+    conditions = []
+    params: dict = {}
+    phrases = [
+        '"' + term.replace('"', '""') + '"' for term in terms if len(term) >= _TRIGRAM
+    ]
+    if phrases:
+        params["match"] = " ".join(phrases)
+        conditions.append("search_index MATCH :match")
+    for n, term in enumerate(t for t in terms if len(t) < _TRIGRAM):
+        params[f"like{n}"] = _like(term)
+        # 套上 lower() 让 FTS5 不接管这个 LIKE：trigram 对不足 3 字的模式返回空结果
+        conditions.append(f"lower(text) LIKE lower(:like{n}) ESCAPE '\\'")
+    if kind is not None:
+        params["kind"] = KINDS.index(kind)
+        conditions.append("rowid % 3 = :kind")
+    return " AND ".join(conditions), params
+
+
+def search(
+    db: Session, q: str, kind: str | None, limit: int, offset: int
+) -> tuple[list[dict], int]:
+    """Names matching every whitespace-separated term of ``q``, best first.
+
+    Returns one page of ``{"kind", "id", "name"}`` and the total number of
+    matches, both from a single query.
+    """
+    terms = _terms(q)
+    if not terms:
+        return [], 0
+    if not _has_search_index(db):
+        return _search_fallback(db, terms, kind, limit, offset)
+
+    where, params = _index_where(terms, kind)
+    # bm25 只有 MATCH 时才有；全是短词时按名称长度排，越短越接近精确匹配
+    order = "rank" if "match" in params else "length(text)"
+    rows = db.execute(
+        text(
+            "SELECT rowid % 3 AS kind, rowid / 3 AS id, text AS name,"
+            " count(*) OVER () AS total FROM search_index"
+            f" WHERE {where} ORDER BY {order}, rowid LIMIT :limit OFFSET :offset"
+        ),
+        {**params, "limit": limit, "offset": offset},
+    ).all()
+    hits = [{"kind": KINDS[row.kind], "id": row.id, "name": row.name} for row in rows]
+    if rows:
+        return hits, rows[0].total
+    # 翻过最后一页时窗口函数拿不到总数，只有这时才单独数一次
+    total = 0
+    if offset:
+        total = db.scalar(
+            text(f"SELECT count(*) FROM search_index WHERE {where}"), params
+        )
+    return hits, total
+
+
+def _search_fallback(
+    db: Session, terms: list[str], kind: str | None, limit: int, offset: int
+) -> tuple[list[dict], int]:
+    selects = []
+    for name in KINDS if kind is None else (kind,):
+        column = _NAME_COLUMNS[name]
+        selects.append(
+            select(
+                literal(name).label("kind"),
+                column.class_.id.label("id"),
+                column.label("name"),
+            ).where(*(column.ilike(_like(term), escape="\\") for term in terms))
+        )
+    hits = union_all(*selects).subquery()
+    rows = db.execute(
+        select(hits, func.count().over().label("total"))
+        .order_by(func.length(hits.c.name), hits.c.kind, hits.c.id)
+        .limit(limit)
+        .offset(offset)
+    ).all()
+    total = rows[0].total if rows else 0
+    if not rows and offset:
+        total = db.scalar(select(func.count()).select_from(hits))
+    return [{"kind": r.kind, "id": r.id, "name": r.name} for r in rows], total
+
+
+def name_filter(db: Session, kind: str, q: str) -> ColumnElement[bool]:
+    """Filter for a model query keeping rows of ``kind`` whose name matches ``q``."""
+    column = _NAME_COLUMNS[kind]
+    terms = _terms(q)
+    if not terms:
+        return true()
+    if not _has_search_index(db):
+        return and_(*(column.ilike(_like(term), escape="\\") for term in terms))
+    where, params = _index_where(terms, kind)
+    ids = text(f"SELECT rowid / 3 FROM search_index WHERE {where}").bindparams(**params)
+    return column.class_.id.in_(ids.columns(id=column.class_.id.type))
+
+
+def similar_images(
+    db: Session, phash: str, threshold: int, limit: int
+) -> tuple[list[dict], list[dict]]:
+    """Library images within ``threshold`` bits of ``phash``, and their cosplays.
+
+    Candidates come from a vectorized scan of the in-memory pHash index; only
+    the rows behind the nearest ``limit`` hashes are then loaded. Images are
+    ordered by distance; cosplays by their closest image, then match count.
+    """
+    distances = dict(get_phash_index(db).search(phash, threshold, limit))
+    if not distances:
+        return [], []
+    rows = (
+        db.query(
+            ImageHash.cosplay_id,
+            ImageHash.filename,
+            ImageHash.phash,
+            Cosplay.title,
+            Cosplay.cover_version,
+        )
+        .join(Cosplay, Cosplay.id == ImageHash.cosplay_id)
+        .filter(ImageHash.phash.in_(distances))
+        .all()
+    )
+    rows.sort(key=lambda row: (distances[row.phash], row.cosplay_id, row.filename))
+    images = [
+        {
+            "cosplay_id": row.cosplay_id,
+            "cosplay_title": row.title,
+            "filename": row.filename,
+            "distance": distances[row.phash],
+        }
+        for row in rows[:limit]
+    ]
+    cosplays: dict[int, dict] = {}
+    for row in rows[:limit]:
+        cosplay = cosplays.setdefault(
+            row.cosplay_id,
+            {
+                "id": row.cosplay_id,
+                "title": row.title,
+                "cover_version": row.cover_version,
+                "distance": distances[row.phash],
+                "matches": 0,
+            },
+        )
+        cosplay["matches"] += 1
+    ranked = sorted(cosplays.values(), key=lambda c: (c["distance"], -c["matches"]))
+    return images, ranked
@@ -1,97 +1,543 @@
-import re
+import hashlib
+import io
+import math
+import multiprocessing
+import os
+import threading
+import zlib
+from collections.abc import Iterator
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
 from pathlib import Path
+from typing import BinaryIO, NamedTuple
 
 import blurhash
 import imagehash
 import numpy as np
 import pillow_avif  # noqa: F401 — 注册 AVIF codec
-from PIL import Image
+from blurhash.blurhash import base83_decode, srgb_to_linear
+from PIL import ExifTags, Image
+from sqlalchemy import and_, or_, update
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.orm import Session
 
-from ..models import Cosplay, ImageHash
+from .. import config
+from ..models import Cosplay, ImageHash, MediaFile, Thumbnail
+from .jobs import Progress
+from .phash_index import phash_to_int
+from .scanner import media_version, rescan_cosplay
 
 THUMBNAIL_DIR = Path(__file__).resolve().parent.parent.parent / "data" / "thumbnails"
 THUMBNAIL_WIDTH = 400
-IMAGE_EXTENSIONS = {".avif", ".jpg", ".jpeg", ".png", ".webp", ".gif", ".bmp"}
 
 
-def _natural_sort_key(s: str) -> list:
+class ImageInfo(NamedTuple):
+    """Header properties of an original image, read while decoding it."""
+
+    width: int
+    height: int
+    format: str | None
+    orientation: int | None
+
+
+class ProcessedImage(NamedTuple):
+    thumbnail: bool
+    phash: str | None
+    blurhash: str | None
+    # 缩略图的像素尺寸
+    dimensions: tuple[int, int] | None = None
+    info: ImageInfo | None = None
+    dominant_color: str | None = None
+    crc32: int | None = None
+
+
+def image_hashes(img: Image.Image) -> tuple[str, str]:
+    """pHash and blurhash of an (already downscaled) image."""
+    phash = str(imagehash.phash(img))
+    small = img.convert("RGB")
+    small.thumbnail((100, 100))
+    blurhash_str = blurhash.encode(np.array(small), components_x=4, components_y=3)
+    return phash, blurhash_str
+
+
+def dominant_color(img: Image.Image) -> str:
+    """Most common colour of an (already downscaled) image, as ``#rrggbb``."""
+    small = img.convert("RGB")
+    small.thumbnail((64, 64))
+    quantized = small.quantize(colors=8)
+    _, index = max(quantized.getcolors())
+    r, g, b = quantized.getpalette()[index * 3 : index * 3 + 3]
+    return f"#{r:02x}{g:02x}{b:02x}"
+
+
+# 各输出格式的 Pillow 保存参数
+SAVE_OPTIONS: dict[str, tuple[str, dict]] = {
+    "avif": ("AVIF", {"quality": 60}),
+    "webp": ("WEBP", {"quality": 75}),
+    "jpeg": ("JPEG", {"quality": 82, "progressive": True}),
+}
+
+
+def _decode(src: Path | BinaryIO, width: int) -> tuple[Image.Image, ImageInfo]:
+    """Decode ``src`` scaled down to ``width`` (never up), plus its header info.
+
+    JPEGs are decoded straight at 1/2, 1/4 or 1/8 scale via ``draft`` when that
+    still covers the target width.
+    """
+    with Image.open(src) as img:
+        orientation = img.getexif().get(ExifTags.Base.Orientation)
+        info = ImageInfo(
+            img.width,
+            img.height,
+            img.format,
+            orientation if orientation in range(1, 9) else None,
+        )
+        width = min(width, img.width)
+        target = (width, max(1, round(img.height * width / img.width)))
+        img.draft("RGB", target)
+        if img.mode not in ("RGB", "RGBA", "L"):
+            img = img.convert("RGBA")
+        return img.resize(target, Image.Resampling.LANCZOS), info
+
+
+def _open_resized(src: Path | BinaryIO, width: int) -> Image.Image:
+    return _decode(src, width)[0]
+
+
+def _save_atomic(img: Image.Image, dest: Path, fmt: str) -> None:
+    """Save through a temporary file so readers never see a partial image."""
+    format_name, options = SAVE_OPTIONS[fmt]
+    if fmt == "jpeg" and img.mode != "RGB":
+        img = img.convert("RGB")
+    tmp = dest.with_name(f".{dest.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        img.save(tmp, format=format_name, **options)
+        os.replace(tmp, dest)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+
+def compute_phash(src: Path | BinaryIO) -> str:
+    """pHash of an image, decoded at thumbnail size exactly as the hash job does.
+
+    Raises if ``src`` cannot be decoded.
+    """
+    return str(imagehash.phash(_open_resized(src, THUMBNAIL_WIDTH)))
+
+
+def manifest_row(
+    cosplay_id: int,
+    filename: str,
+    max_width: int,
+    fmt: str,
+    path: Path,
+    version: str,
+    dimensions: tuple[int, int] | None = None,
+) -> dict:
+    """Thumbnail manifest values for a generated file.
+
+    ``dimensions`` are read from the file header when not given.
+    """
+    if dimensions is None:
+        with Image.open(path) as img:
+            dimensions = img.size
+    return {
+        "cosplay_id": cosplay_id,
+        "filename": filename,
+        "max_width": max_width,
+        "format": fmt,
+        "path": path.relative_to(THUMBNAIL_DIR).as_posix(),
+        "width": dimensions[0],
+        "height": dimensions[1],
+        "size": path.stat().st_size,
+        "version": version,
+    }
+
+
+def record_variants(db: Session, rows: list[dict]) -> None:
+    """Insert or replace manifest rows (from ``manifest_row``). Does not commit."""
+    if not rows:
+        return
+    dialect = postgresql if db.get_bind().dialect.name == "postgresql" else sqlite
+    stmt = dialect.insert(Thumbnail)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["cosplay_id", "filename", "max_width", "format"],
+        set_={
+            name: stmt.excluded[name]
+            for name in ("path", "width", "height", "size", "version")
+        },
+    )
+    db.execute(stmt, rows)
+
+
+def render_thumbnail(
+    src: Path, dest: Path, width: int, fmt: str
+) -> tuple[int, int] | None:
+    """Render one thumbnail variant and return its pixel size.
+
+    Returns ``None`` if ``src`` cannot be decoded.
+    """
+    try:
+        resized = _open_resized(src, width)
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        _save_atomic(resized, dest, fmt)
+    except Exception:
+        return None
+    return resized.size
+
+
+# 占位图拼图：每张图片的 blurhash 解码成 PLACEHOLDER_TILE 见方的小块（与前端原先
+# 解码的尺寸相同），按图片顺序排成一张 WebP，图库页面一次请求就拿到全部占位图，浏览器
+# 不必在主线程上逐个解码。文件名带 blurhash 列表的摘要，任何图片的 blurhash 变化后
+# 都会生成新文件
+PLACEHOLDER_TILE = 32
+
+
+class PlaceholderSprite(NamedTuple):
+    path: Path
+    version: str
+    width: int
+    height: int
+    # 文件名 -> 小块左上角在拼图中的像素坐标
+    offsets: dict[str, tuple[int, int]]
+
+
+def decode_blurhash(hash_str: str, width: int, height: int) -> np.ndarray:
+    """``blurhash.decode`` vectorized with numpy, as a ``height x width x 3`` array.
+
+    Raises ``ValueError`` or ``KeyError`` on a malformed hash.
+    """
+    size_x, size_y = blurhash.components(hash_str)
+    if len(hash_str) != 4 + 2 * size_x * size_y:
+        raise ValueError("Invalid BlurHash length.")
+    max_value = (base83_decode(hash_str[1]) + 1) / 166
+    dc = base83_decode(hash_str[2:6])
+    ac = np.array(
+        [
+            base83_decode(hash_str[4 + 2 * n : 6 + 2 * n])
+            for n in range(1, size_x * size_y)
+        ],
+        dtype=np.int64,
+    )
+    colours = np.empty((size_x * size_y, 3))
+    colours[0] = [srgb_to_linear(v) for v in (dc >> 16, (dc >> 8) & 255, dc & 255)]
+    quantized = (np.stack([ac // 361, ac // 19 % 19, ac % 19], axis=1) - 9) / 9
+    colours[1:] = np.sign(quantized) * quantized**2 * max_value
+
+    basis_x = np.cos(np.pi * np.outer(np.arange(width), np.arange(size_x)) / width)
+    basis_y = np.cos(np.pi * np.outer(np.arange(height), np.arange(size_y)) / height)
+    linear = np.einsum(
+        "yj,xi,jic->yxc", basis_y, basis_x, colours.reshape(size_y, size_x, 3)
+    )
+    linear = np.clip(linear, 0, 1)
+    srgb = np.where(
+        linear <= 0.0031308, linear * 12.92, 1.055 * linear ** (1 / 2.4) - 0.055
+    )
+    return (srgb * 255 + 0.5).astype(np.uint8)
+
+
+def _placeholder_hashes(db: Session, cosplay_id: int) -> list[tuple[str, str]]:
     return [
-        int(part) if part.isdigit() else part.lower() for part in re.split(r"(\d+)", s)
+        (row.filename, row.blurhash)
+        for row in db.query(MediaFile.filename, ImageHash.blurhash)
+        .join(
+            ImageHash,
+            and_(
+                ImageHash.cosplay_id == MediaFile.cosplay_id,
+                ImageHash.filename == MediaFile.filename,
+            ),
+        )
+        .filter(
+            MediaFile.cosplay_id == cosplay_id,
+            MediaFile.kind == "image",
+            ImageHash.blurhash.is_not(None),
+        )
+        .order_by(MediaFile.position)
     ]
 
 
-def generate_thumbnails_for_cosplay(cosplay: Cosplay) -> int:
-    dir_path = Path(cosplay.dir_path)
-    if not dir_path.is_dir():
-        return 0
+def default_thumbnail_path(cosplay_id: int, filename: str) -> Path:
+    """Where the pre-generated 400px AVIF of ``filename`` lives.
 
-    thumb_dir = THUMBNAIL_DIR / str(cosplay.id)
-    thumb_dir.mkdir(parents=True, exist_ok=True)
+    Named after the whole filename, so ``a.jpg`` and ``a.png`` in one set do
+    not share a file.
+    """
+    return THUMBNAIL_DIR / str(cosplay_id) / f"{filename}.avif"
+
+
+def legacy_thumbnail_path(cosplay_id: int, filename: str) -> Path:
+    """Pre-generated thumbnail as older versions named it (``<stem>.avif``)."""
+    return THUMBNAIL_DIR / str(cosplay_id) / f"{Path(filename).stem}.avif"
 
-    count = 0
-    for f in sorted(dir_path.iterdir(), key=lambda x: _natural_sort_key(x.name)):
-        if not f.is_file() or f.suffix.lower() not in IMAGE_EXTENSIONS:
-            continue
 
-        thumb_path = thumb_dir / (f.stem + ".avif")
-        if thumb_path.exists():
-            count += 1
-            continue
+def placeholder_path(cosplay_id: int, version: str) -> Path:
+    return THUMBNAIL_DIR / str(cosplay_id) / f"placeholders.{version}.webp"
+
+
+def placeholder_sprite(db: Session, cosplay_id: int) -> PlaceholderSprite | None:
+    """The placeholder sprite of a cosplay, rendered if missing or out of date.
+
+    Tiles follow the image order, filling rows of ``ceil(sqrt(n))`` tiles.
+    Returns ``None`` while no image has a blurhash yet.
+    """
+    hashes = _placeholder_hashes(db, cosplay_id)
+    if not hashes:
+        return None
+    digest = hashlib.sha1()
+    for filename, hash_str in hashes:
+        digest.update(f"{filename}\0{hash_str}\n".encode())
+    version = digest.hexdigest()[:16]
+
+    tile = PLACEHOLDER_TILE
+    columns = math.ceil(math.sqrt(len(hashes)))
+    rows = math.ceil(len(hashes) / columns)
+    offsets = {
+        filename: (n % columns * tile, n // columns * tile)
+        for n, (filename, _) in enumerate(hashes)
+    }
+    path = placeholder_path(cosplay_id, version)
+    sprite = PlaceholderSprite(path, version, columns * tile, rows * tile, offsets)
+    if path.is_file():
+        return sprite
 
+    pixels = np.zeros((sprite.height, sprite.width, 3), dtype=np.uint8)
+    for (filename, hash_str), (x, y) in zip(hashes, offsets.values()):
         try:
-            with Image.open(f) as img:
-                ratio = THUMBNAIL_WIDTH / img.width
-                new_height = int(img.height * ratio)
-                resized = img.resize(
-                    (THUMBNAIL_WIDTH, new_height), Image.Resampling.LANCZOS
-                )
-                resized.save(thumb_path, format="AVIF", quality=60)
-                count += 1
+            pixels[y : y + tile, x : x + tile] = decode_blurhash(hash_str, tile, tile)
+        except (ValueError, KeyError):
+            # 损坏的 blurhash 留成黑块
+            pass
+    path.parent.mkdir(parents=True, exist_ok=True)
+    _save_atomic(Image.fromarray(pixels), path, "webp")
+    for old in path.parent.glob("placeholders.*.webp"):
+        if old != path:
+            old.unlink(missing_ok=True)
+    return sprite
+
+
+def _process_image(
+    src: Path, thumb_path: Path | None, want_hashes: bool
+) -> ProcessedImage | None:
+    """Decode one image once and derive the thumbnail, hashes and metadata from it.
+
+    Runs in pool workers too.
+    """
+    try:
+        # 整个文件读进内存：解码和打包下载用的 CRC 共用这一次读取
+        data = src.read_bytes()
+        resized, info = _decode(io.BytesIO(data), THUMBNAIL_WIDTH)
+        if thumb_path is not None:
+            _save_atomic(resized, thumb_path, "avif")
+    except Exception:
+        return None
+    phash = blurhash_str = None
+    if want_hashes:
+        try:
+            phash, blurhash_str = image_hashes(resized)
         except Exception:
-            continue
+            pass
+    return ProcessedImage(
+        thumb_path is not None,
+        phash,
+        blurhash_str,
+        resized.size,
+        info,
+        dominant_color(resized),
+        zlib.crc32(data),
+    )
+
+
+_pool: ProcessPoolExecutor | None = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+    """Shared process pool, recreated only when the worker count changes.
 
-    return count
+    Uses spawn rather than fork: the API process runs job threads, and forking
+    a multi-threaded process can deadlock the child.
+    """
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            _pool = ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+            )
+            _pool_workers = workers
+        return _pool
 
 
-def compute_phashes_for_cosplay(cosplay: Cosplay, db: Session) -> int:
+def shutdown_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True, cancel_futures=True)
+            _pool = None
+
+
+Task = tuple[Path, Path | None, bool]
+
+
+def _run_tasks(
+    tasks: list[Task], workers: int
+) -> Iterator[tuple[Task, ProcessedImage | None]]:
+    """Run ``_process_image`` over tasks, yielding results as they complete.
+
+    With more than one worker, at most ``COSEPIC_THUMBNAIL_MAX_IN_FLIGHT`` tasks
+    are submitted at once so decoded bitmaps never pile up in memory.
+    """
+    if workers <= 1:
+        for task in tasks:
+            yield task, _process_image(*task)
+        return
+
+    pool = _get_pool(workers)
+    max_in_flight = max(workers, config.THUMBNAIL_MAX_IN_FLIGHT)
+    in_flight: dict[Future, Task] = {}
+    try:
+        for task in tasks:
+            if len(in_flight) >= max_in_flight:
+                finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    yield in_flight.pop(future), future.result()
+            in_flight[pool.submit(_process_image, *task)] = task
+        while in_flight:
+            finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in finished:
+                yield in_flight.pop(future), future.result()
+    finally:
+        for future in in_flight:
+            future.cancel()
+
+
+def process_cosplay_images(
+    cosplay: Cosplay,
+    db: Session,
+    progress: Progress | None = None,
+    workers: int | None = None,
+) -> tuple[int, int]:
+    """Generate missing thumbnails and hashes in a single decode per image.
+
+    Returns ``(thumbnails, hashes)``: how many images now have each. With
+    ``workers`` > 1 (default ``COSEPIC_THUMBNAIL_WORKERS``) images are processed
+    in a process pool.
+    """
     dir_path = Path(cosplay.dir_path)
     if not dir_path.is_dir():
-        return 0
+        return 0, 0
 
-    existing = {
-        row.filename
-        for row in db.query(ImageHash.filename)
-        .filter(ImageHash.cosplay_id == cosplay.id)
-        .all()
-    }
+    rescan_cosplay(db, cosplay)
+    thumb_dir = THUMBNAIL_DIR / str(cosplay.id)
+    thumb_dir.mkdir(parents=True, exist_ok=True)
 
-    count = 0
-    for f in sorted(dir_path.iterdir(), key=lambda x: _natural_sort_key(x.name)):
-        if not f.is_file() or f.suffix.lower() not in IMAGE_EXTENSIONS:
-            continue
-        if f.name in existing:
-            count += 1
-            continue
+    # 待处理 = 清单中还没有 ImageHash、缩略图清单行或元数据的图片；其余图片无需再碰
+    # 文件系统
+    pending = (
+        db.query(
+            MediaFile.id,
+            MediaFile.filename,
+            MediaFile.mtime_ns,
+            MediaFile.size,
+            MediaFile.width,
+            ImageHash.id.label("hash_id"),
+            Thumbnail.id.label("thumbnail_id"),
+        )
+        .outerjoin(
+            ImageHash,
+            and_(
+                ImageHash.cosplay_id == MediaFile.cosplay_id,
+                ImageHash.filename == MediaFile.filename,
+            ),
+        )
+        .outerjoin(
+            Thumbnail,
+            and_(
+                Thumbnail.cosplay_id == MediaFile.cosplay_id,
+                Thumbnail.filename == MediaFile.filename,
+                Thumbnail.max_width == THUMBNAIL_WIDTH,
+                Thumbnail.format == "avif",
+            ),
+        )
+        .filter(
+            MediaFile.cosplay_id == cosplay.id,
+            MediaFile.kind == "image",
+            or_(
+                ImageHash.id.is_(None),
+                Thumbnail.id.is_(None),
+                MediaFile.width.is_(None),
+            ),
+        )
+        .order_by(MediaFile.position)
+        .all()
+    )
+    total = cosplay.photo_count
+    thumb_count = hash_count = total - len(pending)
+    media_ids: dict[str, int] = {}
+    versions: dict[str, str] = {}
+    manifest: list[dict] = []
+    metadata: list[dict] = []
+    tasks: list[Task] = []
+    for row in pending:
+        f = dir_path / row.filename
+        media_ids[row.filename] = row.id
+        versions[row.filename] = media_version(row.mtime_ns, row.size)
+        thumb_path = default_thumbnail_path(cosplay.id, row.filename)
+        # 清单里没有的缩略图一律重新生成；磁盘上的同名文件可能属于同 id 的已删除图集
+        has_thumb = row.thumbnail_id is not None
+        thumb_count += has_thumb
+        hash_count += row.hash_id is not None
+        if row.hash_id is None or not has_thumb or row.width is None:
+            tasks.append((f, None if has_thumb else thumb_path, row.hash_id is None))
 
-        try:
-            with Image.open(f) as img:
-                img_rgb = img.convert("RGB")
-                img_rgb.thumbnail((100, 100))
-                arr = np.array(img_rgb)
-                phash = str(imagehash.phash(img))
-                blurhash_str = blurhash.encode(arr, components_x=4, components_y=3)
+    done = total - len(tasks)
+    workers = config.THUMBNAIL_WORKERS if workers is None else workers
+    for (f, thumb_path, _), result in _run_tasks(tasks, workers):
+        done += 1
+        if result is not None:
+            metadata.append(
+                {
+                    "id": media_ids[f.name],
+                    **result.info._asdict(),
+                    "dominant_color": result.dominant_color,
+                    "crc32": result.crc32,
+                }
+            )
+            thumb_count += result.thumbnail
+            if result.thumbnail:
+                manifest.append(
+                    manifest_row(
+                        cosplay.id,
+                        f.name,
+                        THUMBNAIL_WIDTH,
+                        "avif",
+                        thumb_path,
+                        versions[f.name],
+                        result.dimensions,
+                    )
+                )
+            if result.phash is not None:
                 db.add(
                     ImageHash(
                         cosplay_id=cosplay.id,
                         filename=f.name,
-                        phash=phash,
-                        blurhash=blurhash_str,
+                        phash=result.phash,
+                        phash_int=phash_to_int(result.phash),
+                        blurhash=result.blurhash,
                     )
                 )
-                count += 1
-        except Exception:
-            continue
+                hash_count += 1
+        if progress:
+            progress(done, total)
 
+    record_variants(db, manifest)
+    if metadata:
+        db.execute(update(MediaFile), metadata)
     db.commit()
-    return count
+    placeholder_sprite(db, cosplay.id)
+    if manifest:
+        from .path_cache import invalidate_cosplay
+
+        invalidate_cosplay(cosplay.id)
+    return thumb_count, hash_count
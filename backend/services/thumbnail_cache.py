@@ -0,0 +1,204 @@
+"""按需生成的多尺寸缩略图：宽度限定在固定档位，格式按 Accept 协商，结果缓存在磁盘上。
+
+400px AVIF 就是后台任务预先生成的那份（THUMBNAIL_DIR/<id>/<文件名>.avif），不计入缓存
+容量；其他尺寸和格式写入 THUMBNAIL_DIR/cache，文件名带源文件版本号，源文件变化后旧
+文件不再被命中，随 LRU 淘汰。
+
+每个生成出来的文件都记入缩略图清单（thumbnails 表）：路径、像素尺寸、字节数和生成时的
+原图版本号。文件接口按清单直接定位文件；被淘汰的文件连同清单行一起删除。
+"""
+
+import shutil
+import threading
+from collections import OrderedDict
+from collections.abc import Iterator
+from contextlib import contextmanager
+from pathlib import Path
+
+from sqlalchemy.orm import Session
+
+from .. import config, database
+from ..models import Thumbnail
+from . import thumbnail
+
+# 格式 -> (MIME, 扩展名)，按优先级排列
+FORMATS = {
+    "avif": ("image/avif", ".avif"),
+    "webp": ("image/webp", ".webp"),
+    "jpeg": ("image/jpeg", ".jpg"),
+}
+
+
+def negotiate_format(accept: str | None) -> str:
+    """Best thumbnail format the client accepts; JPEG works everywhere."""
+    accepted = set()
+    for part in (accept or "").split(","):
+        media_type, *params = (p.strip() for p in part.split(";"))
+        try:
+            q = next(
+                (float(p[2:]) for p in params if p.replace(" ", "").startswith("q=")),
+                1.0,
+            )
+        except ValueError:
+            q = 1.0
+        if q > 0:
+            accepted.add(media_type.lower())
+    for fmt, (mime, _) in FORMATS.items():
+        if mime in accepted:
+            return fmt
+    return "jpeg"
+
+
+class DiskCache:
+    """Size-bounded directory of generated files, evicted least recently used first.
+
+    Recency is tracked in memory; after a restart the order is rebuilt from file
+    mtimes.
+    """
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[Path, int] | None = None
+        self._total = 0
+
+    @property
+    def root(self) -> Path:
+        return thumbnail.THUMBNAIL_DIR / "cache"
+
+    def _load(self) -> OrderedDict[Path, int]:
+        if self._entries is None:
+            files = []
+            if self.root.is_dir():
+                for path in self.root.rglob("*"):
+                    if path.name.startswith(".") or not path.is_file():
+                        continue
+                    st = path.stat()
+                    files.append((st.st_mtime, path, st.st_size))
+            files.sort()
+            self._entries = OrderedDict((path, size) for _, path, size in files)
+            self._total = sum(self._entries.values())
+        return self._entries
+
+    def touch(self, path: Path) -> None:
+        with self._lock:
+            entries = self._load()
+            if path in entries:
+                entries.move_to_end(path)
+
+    def add(self, path: Path) -> list[Path]:
+        """Account for a new file; returns the files evicted to make room."""
+        size = path.stat().st_size
+        evicted = []
+        with self._lock:
+            entries = self._load()
+            self._total += size - entries.pop(path, 0)
+            entries[path] = size
+            # 至少保留刚写入的文件
+            while self._total > self.max_bytes and len(entries) > 1:
+                old_path, old_size = entries.popitem(last=False)
+                old_path.unlink(missing_ok=True)
+                self._total -= old_size
+                evicted.append(old_path)
+        return evicted
+
+    def discard_tree(self, directory: Path) -> None:
+        """Delete ``directory`` and stop accounting for the files in it."""
+        with self._lock:
+            if self._entries is not None:
+                for path in [p for p in self._entries if p.is_relative_to(directory)]:
+                    self._total -= self._entries.pop(path)
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+_cache = DiskCache(config.THUMBNAIL_CACHE_MAX_MB * 1024 * 1024)
+_render_slots = threading.BoundedSemaphore(config.THUMBNAIL_RENDER_CONCURRENCY)
+_inflight: dict[Path, threading.Lock] = {}
+_inflight_lock = threading.Lock()
+
+
+@contextmanager
+def _single_flight(key: Path) -> Iterator[None]:
+    """Serialize work on ``key`` so concurrent requests render a variant once."""
+    with _inflight_lock:
+        lock = _inflight.setdefault(key, threading.Lock())
+    with lock:
+        yield
+    with _inflight_lock:
+        if _inflight.get(key) is lock and not lock.locked():
+            del _inflight[key]
+
+
+def _forget_files(db: Session, paths: list[Path]) -> None:
+    if paths:
+        relative = [p.relative_to(thumbnail.THUMBNAIL_DIR).as_posix() for p in paths]
+        db.query(Thumbnail).filter(Thumbnail.path.in_(relative)).delete(
+            synchronize_session=False
+        )
+
+
+def touch(path: Path) -> None:
+    """Mark a served file as recently used (no-op for pre-generated ones)."""
+    _cache.touch(path)
+
+
+def remove_cosplay(cosplay_id: int) -> None:
+    """Delete every generated file of a cosplay: thumbnails, posters and its cache.
+
+    Cosplay ids can be reused after a delete, so nothing may be left behind for
+    a later set to pick up.
+    """
+    shutil.rmtree(thumbnail.THUMBNAIL_DIR / str(cosplay_id), ignore_errors=True)
+    _cache.discard_tree(_cache.root / str(cosplay_id))
+
+
+def thumbnail_path(
+    cosplay_id: int, filename: str, version: str, width: int, fmt: str
+) -> Path:
+    if width == thumbnail.THUMBNAIL_WIDTH and fmt == "avif":
+        return thumbnail.default_thumbnail_path(cosplay_id, filename)
+    ext = FORMATS[fmt][1]
+    return _cache.root / str(cosplay_id) / f"{filename}.{width}.{version}{ext}"
+
+
+def get_thumbnail(
+    cosplay_id: int,
+    src: Path,
+    version: str,
+    width: int,
+    fmt: str,
+    rerender: bool = False,
+    filename: str | None = None,
+) -> Path | None:
+    """Path of the requested variant, rendering it first if it does not exist.
+
+    Called when the thumbnail manifest has no usable entry: an existing file is
+    adopted into the manifest, anything else is rendered and recorded. Set
+    ``rerender`` when the manifest says the file predates the current source.
+    ``filename`` is the manifest name when ``src`` stands in for another file
+    (a video's poster frame). Returns ``None`` when the source image is missing
+    or cannot be decoded.
+    """
+    filename = filename or src.name
+    path = thumbnail_path(cosplay_id, filename, version, width, fmt)
+    cached = path.parent != thumbnail.THUMBNAIL_DIR / str(cosplay_id)
+    with _single_flight(path):
+        # 等锁期间可能已由另一个请求生成
+        if path.is_file() and (cached or not rerender):
+            _cache.touch(path)
+            dimensions = None
+            evicted = []
+        else:
+            with _render_slots:
+                dimensions = thumbnail.render_thumbnail(src, path, width, fmt)
+            if dimensions is None:
+                return None
+            evicted = _cache.add(path) if cached else []
+        row = thumbnail.manifest_row(
+            cosplay_id, filename, width, fmt, path, version, dimensions
+        )
+        with database.SessionLocal() as db:
+            thumbnail.record_variants(db, [row])
+            _forget_files(db, evicted)
+            db.commit()
+    return path
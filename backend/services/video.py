@@ -0,0 +1,142 @@
+"""视频封面帧：后台处理任务用 ffmpeg 从每个视频截取一帧。
+
+封面帧存为 THUMBNAIL_DIR/<id>/posters/<文件名>.jpg，在缩略图接口中代替视频作为原图：
+/api/files/thumbnail/<id>/<视频文件名> 的各尺寸、格式都从它生成，400px AVIF 由任务
+预先生成并记入缩略图清单。帧的像素尺寸（ffmpeg 已按旋转元数据校正）写入文件清单的
+width/height，页面在视频加载前就能按比例占位，播放器不必预读视频。
+
+ffmpeg 是可选依赖：找不到时跳过封面帧，视频照常播放。截取失败（无法解码或超时）的
+视频记下当时的版本号，文件变化前不再重复调用 ffmpeg。
+"""
+
+import logging
+import os
+import shutil
+import subprocess
+import threading
+from pathlib import Path
+
+from PIL import Image
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from .. import config
+from ..models import Cosplay, MediaFile
+from . import thumbnail
+from .scanner import media_version
+
+logger = logging.getLogger(__name__)
+
+# 从第几秒截取（片头常是黑屏）；视频不够长时退回第一帧
+POSTER_SECONDS = 1
+
+
+def poster_path(cosplay_id: int, filename: str) -> Path:
+    return thumbnail.THUMBNAIL_DIR / str(cosplay_id) / "posters" / f"{filename}.jpg"
+
+
+def extract_poster(ffmpeg: str, src: Path, dest: Path) -> tuple[int, int] | None:
+    """Save one frame of ``src`` as a JPEG at ``dest`` and return its size.
+
+    Returns ``None`` if ffmpeg cannot decode a frame in time.
+    """
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    tmp = dest.with_name(f".{dest.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        for seconds in (POSTER_SECONDS, 0):
+            # -ss 放在 -i 之前：按关键帧快速定位，不解码前面的内容
+            command = [ffmpeg, "-nostdin", "-v", "error", "-y", "-ss", str(seconds)]
+            command += ["-i", str(src), "-frames:v", "1", "-q:v", "3"]
+            command += ["-f", "image2", "-c:v", "mjpeg", str(tmp)]
+            try:
+                subprocess.run(
+                    command, capture_output=True, timeout=config.FFMPEG_TIMEOUT_SECONDS
+                )
+            except subprocess.TimeoutExpired:
+                return None
+            if tmp.is_file() and tmp.stat().st_size > 0:
+                with Image.open(tmp) as img:
+                    size = img.size
+                os.replace(tmp, dest)
+                return size
+    finally:
+        tmp.unlink(missing_ok=True)
+    return None
+
+
+def process_cosplay_videos(cosplay: Cosplay, db: Session) -> int:
+    """Extract the poster frame of every video that has none yet.
+
+    Also renders the default thumbnail from it. Videos ffmpeg failed on are
+    skipped until they change. Returns how many posters were extracted; does
+    nothing without ffmpeg.
+    """
+    from .path_cache import invalidate_cosplay
+    from .thumbnail_cache import thumbnail_path
+
+    rows = (
+        db.query(
+            MediaFile.id,
+            MediaFile.filename,
+            MediaFile.mtime_ns,
+            MediaFile.size,
+            MediaFile.poster_failed_version,
+        )
+        .filter(
+            MediaFile.cosplay_id == cosplay.id,
+            MediaFile.kind == "video",
+            MediaFile.width.is_(None),
+        )
+        .order_by(MediaFile.position)
+        .all()
+    )
+    pending = [
+        row
+        for row in rows
+        if row.poster_failed_version != media_version(row.mtime_ns, row.size)
+    ]
+    if not pending:
+        return 0
+    ffmpeg = shutil.which(config.FFMPEG)
+    if ffmpeg is None:
+        logger.warning("ffmpeg not found (%s), skipping video posters", config.FFMPEG)
+        return 0
+
+    dir_path = Path(cosplay.dir_path)
+    metadata: list[dict] = []
+    failed: list[dict] = []
+    manifest: list[dict] = []
+    for row in pending:
+        version = media_version(row.mtime_ns, row.size)
+        poster = poster_path(cosplay.id, row.filename)
+        size = extract_poster(ffmpeg, dir_path / row.filename, poster)
+        if size is None:
+            logger.warning("ffmpeg could not extract a poster from %s", row.filename)
+            failed.append({"id": row.id, "poster_failed_version": version})
+            continue
+        metadata.append(
+            {
+                "id": row.id,
+                "width": size[0],
+                "height": size[1],
+                "poster_failed_version": None,
+            }
+        )
+        width = thumbnail.THUMBNAIL_WIDTH
+        thumb = thumbnail_path(cosplay.id, row.filename, version, width, "avif")
+        dimensions = thumbnail.render_thumbnail(poster, thumb, width, "avif")
+        if dimensions is not None:
+            manifest.append(
+                thumbnail.manifest_row(
+                    cosplay.id, row.filename, width, "avif", thumb, version, dimensions
+                )
+            )
+
+    thumbnail.record_variants(db, manifest)
+    for values in (metadata, failed):
+        if values:
+            db.execute(update(MediaFile), values)
+    db.commit()
+    if manifest:
+        invalidate_cosplay(cosplay.id)
+    return len(metadata)
@@ -0,0 +1,210 @@
+"""目录监听：图集目录中的文件增删后自动同步清单并排队处理新文件。
+
+安装了 watchdog 时使用原生文件系统事件（Linux 上即 inotify），否则按目录 mtime
+轮询。同一目录的事件会去抖合并，复制大批文件时只在安静下来后同步一次。
+"""
+
+import logging
+import os
+import threading
+import time
+
+from .. import config
+from ..database import SessionLocal
+from ..models import Cosplay
+from . import jobs
+from .scanner import rescan_cosplay
+
+logger = logging.getLogger(__name__)
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:  # 可选依赖
+    Observer = None
+
+
+def _normalize(path: str) -> str:
+    return os.path.normpath(os.path.abspath(path))
+
+
+class LibraryWatcher:
+    """Background thread that keeps cosplay manifests in step with their folders.
+
+    The set of watched directories is reloaded from the database every
+    ``poll_seconds``, which also picks up cosplays created in the meantime.
+    """
+
+    def __init__(
+        self, debounce_seconds: float, poll_seconds: float, polling: bool = False
+    ) -> None:
+        self.debounce_seconds = debounce_seconds
+        self.poll_seconds = poll_seconds
+        self.polling = polling or Observer is None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wakeup = threading.Event()
+        self._thread: threading.Thread | None = None
+        # 目录 -> cosplay id
+        self._dirs: dict[str, int] = {}
+        # 目录 -> 去抖截止时间
+        self._due: dict[str, float] = {}
+        # 轮询模式下上次看到的目录 mtime
+        self._mtimes: dict[str, int | None] = {}
+        self._observer = None
+        self._watches: dict[str, object] = {}
+
+    def start(self) -> None:
+        if not self.polling:
+            self._observer = Observer()
+            self._observer.start()
+        self._thread = threading.Thread(
+            target=self._loop, name="cosepic-watcher", daemon=True
+        )
+        self._thread.start()
+        logger.info(
+            "Library watcher started (%s)", "polling" if self.polling else "events"
+        )
+
+    def stop(self, timeout: float = 10.0) -> None:
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join(timeout)
+            self._observer = None
+
+    def notify(self, dir_path: str) -> None:
+        """Mark a directory as changed; it is synced once events stop for a while."""
+        dir_path = _normalize(dir_path)
+        with self._lock:
+            if dir_path not in self._dirs:
+                return
+            self._due[dir_path] = time.monotonic() + self.debounce_seconds
+        self._wakeup.set()
+
+    def _loop(self) -> None:
+        next_refresh = 0.0
+        while not self._stop.is_set():
+            now = time.monotonic()
+            if now >= next_refresh:
+                try:
+                    self._refresh()
+                except Exception:
+                    logger.exception("Failed to refresh watched directories")
+                next_refresh = now + self.poll_seconds
+            self._flush()
+            with self._lock:
+                next_due = min(self._due.values(), default=next_refresh)
+            self._wakeup.wait(max(0.0, min(next_due, next_refresh) - time.monotonic()))
+            self._wakeup.clear()
+
+    def _refresh(self) -> None:
+        with SessionLocal() as db:
+            rows = db.query(Cosplay.id, Cosplay.dir_path, Cosplay.dir_mtime_ns).all()
+        dirs = {_normalize(row.dir_path): row.id for row in rows}
+        with self._lock:
+            self._dirs = dirs
+        if self.polling:
+            for row in rows:
+                self._poll(_normalize(row.dir_path), row.dir_mtime_ns)
+        else:
+            self._schedule(dirs)
+
+    def _poll(self, dir_path: str, stored_mtime_ns: int | None) -> None:
+        try:
+            mtime_ns = os.stat(dir_path).st_mtime_ns
+        except OSError:
+            return
+        last = self._mtimes.get(dir_path, stored_mtime_ns)
+        self._mtimes[dir_path] = mtime_ns
+        if mtime_ns != last:
+            self.notify(dir_path)
+
+    def _schedule(self, dirs: dict[str, int]) -> None:
+        for dir_path in self._watches.keys() - dirs.keys():
+            self._observer.unschedule(self._watches.pop(dir_path))
+        for dir_path in dirs.keys() - self._watches.keys():
+            try:
+                self._watches[dir_path] = self._observer.schedule(
+                    _EventHandler(self), dir_path, recursive=False
+                )
+            except OSError:
+                # 目录暂不可达；下次刷新时重试
+                continue
+
+    def _flush(self) -> None:
+        now = time.monotonic()
+        with self._lock:
+            ready = [path for path, due in self._due.items() if due <= now]
+            for path in ready:
+                del self._due[path]
+            cosplay_ids = [self._dirs[path] for path in ready if path in self._dirs]
+        for cosplay_id in cosplay_ids:
+            try:
+                self._sync(cosplay_id)
+            except Exception:
+                logger.exception("Failed to sync cosplay %s", cosplay_id)
+
+    def _sync(self, cosplay_id: int) -> None:
+        with SessionLocal() as db:
+            cosplay = db.get(Cosplay, cosplay_id)
+            if cosplay is None:
+                return
+            # 事件可能只来自原地改写的文件，或是首次同步时仍在复制的文件，目录 mtime
+            # 不会再变；只做 stat 的全量比对才能发现这些文件
+            result = rescan_cosplay(db, cosplay, full=True)
+            if result.skipped:
+                return
+            logger.info(
+                "Cosplay %s: %d added, %d changed, %d removed",
+                cosplay_id,
+                len(result.added),
+                len(result.changed),
+                len(result.removed),
+            )
+            if result.added or result.changed:
+                jobs.enqueue_many(db, "process_cosplay", [cosplay_id])
+
+
+if Observer is not None:
+
+    class _EventHandler(FileSystemEventHandler):
+        def __init__(self, watcher: LibraryWatcher) -> None:
+            self.watcher = watcher
+
+        def on_any_event(self, event) -> None:
+            if event.event_type in {"opened", "closed_no_write"}:
+                return
+            for path in (event.src_path, getattr(event, "dest_path", "")):
+                if not path:
+                    continue
+                # 被监听目录自身的事件（如 mtime 变化）直接对应该目录
+                if event.is_directory and _normalize(path) in self.watcher._dirs:
+                    self.watcher.notify(path)
+                else:
+                    self.watcher.notify(os.path.dirname(path))
+
+
+_watcher: LibraryWatcher | None = None
+
+
+def start_watcher() -> None:
+    global _watcher
+    if _watcher is None and config.WATCHER_ENABLED:
+        _watcher = LibraryWatcher(
+            config.WATCHER_DEBOUNCE_SECONDS,
+            config.WATCHER_POLL_SECONDS,
+            polling=config.WATCHER_POLLING,
+        )
+        _watcher.start()
+
+
+def stop_watcher() -> None:
+    global _watcher
+    if _watcher is not None:
+        _watcher.stop()
+        _watcher = None
@@ -128,7 +128,7 @@ function DuplicateCard({ result }: { result: DedupResult }) {
         {result.images.map((img) => (
           <div key={img.id} className="bg-gray-800 rounded overflow-hidden">
             <img
-              src={thumbnailUrl(img.cosplay_id, img.filename.replace(/\.[^.]+$/, ".avif"))}
+              src={thumbnailUrl(img.cosplay_id, img.filename)}
               alt={img.filename}
               className="w-full aspect-[3/4] object-cover"
               onError={(e) => {
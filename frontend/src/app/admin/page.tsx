@@ -494,10 +494,7 @@ function CosplayTab({
   const handleGenerateThumbs = async (id: number) => {
     try {
       const result = await adminGenerateThumbnails(id);
-      showMessage(
-        "success",
-        `生成完成：${result.thumbnails_generated} 个缩略图，${result.hashes_computed} 个哈希`
-      );
+      showMessage("success", `已加入后台队列（任务 #${result.job_id}）`);
       loadData();
     } catch (e: unknown) {
       showMessage("error", e instanceof Error ? e.message : "生成失败");
@@ -48,7 +48,7 @@ export default async function CoserDetailPage({
       </div>
       <Pagination
         currentPage={page}
-        totalPages={data.total_pages}
+        totalPages={data.total_pages ?? 1}
         buildHref={(p) => `/coser/${coserId}/${p}`}
       />
     </div>
@@ -65,7 +65,7 @@ export default async function CosersPage({
       )}
       <Pagination
         currentPage={page}
-        totalPages={data.total_pages}
+        totalPages={data.total_pages ?? 1}
         buildHref={(p) =>
           `/cosers/${p}${search ? `?search=${encodeURIComponent(search)}` : ""}`
         }
@@ -6,11 +6,18 @@ import LazyImage from "@/components/LazyImage";
 import {
   fetchCosplay,
   fetchCosplayImages,
+  fetchImagePlaceholders,
+  fetchCosplayVideos,
+  archiveUrl,
+  videoUrl,
+  placeholderSpriteUrl,
   thumbnailUrl,
   imageUrl,
   formatSize,
   type CosplayItem,
+  type ImagePlaceholders,
   type ImageWithBlurhash,
+  type VideoItem,
 } from "@/lib/api";
 
 export default function CosplayDetailPage({
@@ -21,6 +28,10 @@ export default function CosplayDetailPage({
   const [params, setParams] = useState<{ id: string } | null>(null);
   const [cosplay, setCosplay] = useState<CosplayItem | null>(null);
   const [images, setImages] = useState<ImageWithBlurhash[]>([]);
+  const [placeholders, setPlaceholders] = useState<ImagePlaceholders | null>(
+    null
+  );
+  const [videos, setVideos] = useState<VideoItem[]>([]);
   const [visibleCount, setVisibleCount] = useState(20);
   const [lightboxIdx, setLightboxIdx] = useState<number | null>(null);
 
@@ -31,8 +42,18 @@ export default function CosplayDetailPage({
   useEffect(() => {
     if (!params) return;
     const id = parseInt(params.id);
-    fetchCosplay(id).then(setCosplay);
-    fetchCosplayImages(id).then(setImages);
+    fetchCosplay(id).then((item) => {
+      setCosplay(item);
+      if (item.video_count > 0) fetchCosplayVideos(id).then(setVideos);
+    });
+    // 占位图与图片列表一起到达，图片不会先按 blurhash 各自解码一遍
+    Promise.all([
+      fetchCosplayImages(id),
+      fetchImagePlaceholders(id).catch(() => null),
+    ]).then(([imgs, sprite]) => {
+      setPlaceholders(sprite);
+      setImages(imgs);
+    });
   }, [params]);
 
   useEffect(() => {
@@ -54,6 +75,21 @@ export default function CosplayDetailPage({
 
   const cosplayId = parseInt(params.id);
   const currentImage = lightboxIdx !== null ? images[lightboxIdx] : null;
+  const spriteSrc = placeholders?.version
+    ? placeholderSpriteUrl(cosplayId, placeholders.version)
+    : null;
+  const spriteTile = (filename: string) => {
+    const offset = placeholders?.offsets[filename];
+    if (!placeholders || !spriteSrc || !offset) return null;
+    return {
+      src: spriteSrc,
+      x: offset[0],
+      y: offset[1],
+      size: placeholders.tile_size,
+      spriteWidth: placeholders.width,
+      spriteHeight: placeholders.height,
+    };
+  };
 
   return (
     <div>
@@ -100,10 +136,42 @@ export default function CosplayDetailPage({
             {cosplay.video_count > 0 && ` / ${cosplay.video_count}V`}
           </span>
           <span>{formatSize(cosplay.total_size)}</span>
+          <a
+            href={archiveUrl(cosplayId)}
+            download
+            className="text-[var(--accent)] hover:underline"
+          >
+            打包下载
+          </a>
           <span>{new Date(cosplay.created_at).toLocaleDateString("zh-CN")}</span>
         </div>
       </div>
 
+      {videos.length > 0 && (
+        <div className="mb-6 grid grid-cols-1 gap-2 md:grid-cols-2">
+          {videos.map((video) => (
+            // preload="none"：只显示封面帧，点击播放时才开始请求视频
+            <video
+              key={video.filename}
+              src={videoUrl(cosplayId, video.filename, video.version)}
+              poster={
+                video.width
+                  ? thumbnailUrl(cosplayId, video.filename, video.version, 800)
+                  : undefined
+              }
+              preload="none"
+              controls
+              className="w-full rounded bg-black"
+              style={
+                video.width && video.height
+                  ? { aspectRatio: `${video.width} / ${video.height}` }
+                  : undefined
+              }
+            />
+          ))}
+        </div>
+      )}
+
       <div className="grid grid-cols-2 gap-2 sm:grid-cols-3 md:grid-cols-4 lg:grid-cols-5">
         {images.slice(0, visibleCount).map((img, idx) => (
           <button
@@ -113,7 +181,8 @@ export default function CosplayDetailPage({
           >
             <LazyImage
               blurhash={img.blurhash}
-              thumbnailSrc={thumbnailUrl(cosplayId, img.filename)}
+              placeholder={spriteTile(img.filename)}
+              thumbnailSrc={thumbnailUrl(cosplayId, img.filename, img.version)}
               alt={img.filename}
               className="h-full w-full"
             />
@@ -166,7 +235,7 @@ export default function CosplayDetailPage({
             </button>
           )}
           <img
-            src={imageUrl(cosplayId, currentImage.filename)}
+            src={imageUrl(cosplayId, currentImage.filename, currentImage.version)}
             alt={currentImage.filename}
             className="max-h-[90vh] max-w-[90vw] object-contain"
             onClick={(e) => e.stopPropagation()}
@@ -31,7 +31,7 @@ export default async function CosplaysPage({
       </div>
       <Pagination
         currentPage={page}
-        totalPages={data.total_pages}
+        totalPages={data.total_pages ?? 1}
         buildHref={(p) => `/cosplays/${p}`}
       />
     </div>
@@ -28,7 +28,7 @@ export default async function HomePage() {
       )}
       <Pagination
         currentPage={1}
-        totalPages={data.total_pages}
+        totalPages={data.total_pages ?? 1}
         buildHref={(page) => `/cosplays/${page}`}
       />
     </div>
@@ -17,7 +17,7 @@ export default function GalleryCard({ item }: { item: CosplayItem }) {
       <div className="relative aspect-[3/4] w-full overflow-hidden">
         {/* eslint-disable-next-line @next/next/no-img-element */}
         <img
-          src={coverUrl(item.id)}
+          src={coverUrl(item.id, item.cover_version)}
           alt={item.title}
           className="h-full w-full object-cover transition-transform duration-300 group-hover:scale-105"
           loading="lazy"
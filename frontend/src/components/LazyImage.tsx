@@ -1,10 +1,34 @@
 "use client";
 
-import { useEffect, useState, useRef } from "react";
+import { useEffect, useState, useRef, type CSSProperties } from "react";
 import { decode } from "blurhash";
 
+// 占位图拼图中的一块：src 为整张拼图，(x, y) 为小块左上角
+export interface SpriteTile {
+  src: string;
+  x: number;
+  y: number;
+  size: number;
+  spriteWidth: number;
+  spriteHeight: number;
+}
+
+// 把拼图中的一块拉伸铺满容器
+function spriteTileStyle(tile: SpriteTile): CSSProperties {
+  const { x, y, size, spriteWidth, spriteHeight } = tile;
+  const position = (offset: number, total: number) =>
+    total > size ? `${(offset / (total - size)) * 100}%` : "0%";
+  return {
+    backgroundImage: `url(${tile.src})`,
+    backgroundSize: `${(spriteWidth / size) * 100}% ${(spriteHeight / size) * 100}%`,
+    backgroundPosition: `${position(x, spriteWidth)} ${position(y, spriteHeight)}`,
+  };
+}
+
 interface LazyImageProps {
   blurhash: string | null;
+  // 有拼图时直接使用，不再在主线程上解码 blurhash
+  placeholder?: SpriteTile | null;
   thumbnailSrc: string;
   fullSrc?: string;
   alt: string;
@@ -14,6 +38,7 @@ interface LazyImageProps {
 
 export default function LazyImage({
   blurhash,
+  placeholder,
   thumbnailSrc,
   fullSrc,
   alt,
@@ -24,8 +49,10 @@ export default function LazyImage({
   const [blurDataUrl, setBlurDataUrl] = useState<string | null>(null);
   const imgRef = useRef<HTMLImageElement>(null);
 
+  const hasPlaceholder = placeholder != null;
+
   useEffect(() => {
-    if (!blurhash) {
+    if (!blurhash || hasPlaceholder) {
       setBlurDataUrl(null);
       return;
     }
@@ -45,7 +72,7 @@ export default function LazyImage({
     } catch {
       setBlurDataUrl(null);
     }
-  }, [blurhash]);
+  }, [blurhash, hasPlaceholder]);
 
   return (
     <div
@@ -53,7 +80,13 @@ export default function LazyImage({
       style={{ backgroundColor: "#1a1a1a" }}
       onClick={onClick}
     >
-      {blurDataUrl && !loaded && (
+      {placeholder && !loaded && (
+        <div
+          className="absolute inset-0 blur-xl scale-110"
+          style={spriteTileStyle(placeholder)}
+        />
+      )}
+      {!placeholder && blurDataUrl && !loaded && (
         <img
           src={blurDataUrl}
           alt={alt}
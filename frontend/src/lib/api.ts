@@ -22,6 +22,7 @@ export interface CosplayItem {
   parody_id: number | null;
   dir_path: string;
   cover_path: string | null;
+  cover_version: string | null;
   photo_count: number;
   video_count: number;
   total_size: number;
@@ -30,12 +31,14 @@ export interface CosplayItem {
   parody: Parody | null;
 }
 
+// 传 cursor 时为游标分页：page 为 null，total/total_pages 仅在 include_total 时返回
 export interface PaginatedResponse<T> {
   items: T[];
-  total: number;
-  page: number;
+  total: number | null;
+  page: number | null;
   page_size: number;
-  total_pages: number;
+  total_pages: number | null;
+  next_cursor: string | null;
 }
 
 export async function fetchCosplays(
@@ -59,9 +62,20 @@ export async function fetchCosplay(id: number): Promise<CosplayItem> {
   return res.json();
 }
 
+// width/height 为默认缩略图的尺寸，只用于计算宽高比；缩略图尚未生成时为 null
 export interface ImageWithBlurhash {
   filename: string;
   blurhash: string | null;
+  version: string | null;
+  width: number | null;
+  height: number | null;
+  size: number;
+  // 原图存储的像素尺寸；orientation（EXIF，1-8）为 5-8 时显示时宽高互换
+  original_width: number | null;
+  original_height: number | null;
+  orientation: number | null;
+  format: string | null;
+  dominant_color: string | null;
 }
 
 export async function fetchCosplayImages(
@@ -71,6 +85,36 @@ export async function fetchCosplayImages(
   return res.json();
 }
 
+// width/height 为封面帧尺寸（即视频显示尺寸），处理任务截取封面帧之前为 null
+export interface VideoItem {
+  filename: string;
+  version: string;
+  size: number;
+  width: number | null;
+  height: number | null;
+}
+
+export async function fetchCosplayVideos(id: number): Promise<VideoItem[]> {
+  const res = await fetch(`${API_BASE}/cosplays/${id}/videos`);
+  return res.json();
+}
+
+// 整个图集的占位图拼在一张图里；offsets 为每张图片的小块左上角坐标 [x, y]
+export interface ImagePlaceholders {
+  version: string | null;
+  tile_size: number;
+  width: number;
+  height: number;
+  offsets: Record<string, [number, number]>;
+}
+
+export async function fetchImagePlaceholders(
+  id: number
+): Promise<ImagePlaceholders> {
+  const res = await fetch(`${API_BASE}/cosplays/${id}/placeholders`);
+  return res.json();
+}
+
 export async function fetchCosers(
   page: number = 1,
   pageSize: number = 20,
@@ -97,16 +141,125 @@ export async function fetchParodies(
   return res.json();
 }
 
-export function coverUrl(cosplayId: number): string {
-  return `${API_BASE}/files/cover/${cosplayId}`;
+export interface SearchHit {
+  kind: "cosplay" | "coser" | "parody";
+  id: number;
+  name: string;
+}
+
+// 按相关度排序；kind 只搜索某一类
+export async function searchLibrary(
+  q: string,
+  page: number = 1,
+  pageSize: number = 20,
+  kind?: SearchHit["kind"]
+): Promise<PaginatedResponse<SearchHit>> {
+  const params = new URLSearchParams({
+    q,
+    page: String(page),
+    page_size: String(pageSize),
+  });
+  if (kind) params.set("kind", kind);
+  const res = await fetch(`${API_BASE}/search/?${params}`);
+  return res.json();
+}
+
+export interface SimilarImage {
+  cosplay_id: number;
+  cosplay_title: string;
+  filename: string;
+  distance: number;
 }
 
-export function thumbnailUrl(cosplayId: number, filename: string): string {
-  return `${API_BASE}/files/thumbnail/${cosplayId}/${encodeURIComponent(filename)}`;
+export interface SimilarCosplay {
+  id: number;
+  title: string;
+  cover_version: string | null;
+  distance: number;
+  matches: number;
 }
 
-export function imageUrl(cosplayId: number, filename: string): string {
-  return `${API_BASE}/files/image/${cosplayId}/${encodeURIComponent(filename)}`;
+export interface ImageSearchResult {
+  phash: string;
+  images: SimilarImage[];
+  cosplays: SimilarCosplay[];
+}
+
+// 以图搜图：threshold 为 pHash 允许相差的位数
+export async function searchByImage(
+  file: Blob,
+  threshold: number = 10,
+  limit: number = 20
+): Promise<ImageSearchResult> {
+  const params = new URLSearchParams({
+    threshold: String(threshold),
+    limit: String(limit),
+  });
+  const body = new FormData();
+  body.append("file", file);
+  const res = await fetch(`${API_BASE}/search/image?${params}`, {
+    method: "POST",
+    body,
+  });
+  return res.json();
+}
+
+// 带上文件版本号后，服务器会返回 Cache-Control: immutable，浏览器无需再验证
+function withVersion(url: string, version?: string | null): string {
+  return version ? `${url}?v=${encodeURIComponent(version)}` : url;
+}
+
+export function coverUrl(cosplayId: number, version?: string | null): string {
+  return withVersion(`${API_BASE}/files/cover/${cosplayId}`, version);
+}
+
+// 缩略图宽度只能取服务器允许的档位（默认 200/400/800/1600）
+export function thumbnailUrl(
+  cosplayId: number,
+  filename: string,
+  version?: string | null,
+  width?: number
+): string {
+  const params = new URLSearchParams();
+  if (width) params.set("w", String(width));
+  if (version) params.set("v", version);
+  const query = params.size ? `?${params}` : "";
+  return `${API_BASE}/files/thumbnail/${cosplayId}/${encodeURIComponent(filename)}${query}`;
+}
+
+export function imageUrl(
+  cosplayId: number,
+  filename: string,
+  version?: string | null
+): string {
+  return withVersion(
+    `${API_BASE}/files/image/${cosplayId}/${encodeURIComponent(filename)}`,
+    version
+  );
+}
+
+export function placeholderSpriteUrl(
+  cosplayId: number,
+  version?: string | null
+): string {
+  return withVersion(`${API_BASE}/files/placeholders/${cosplayId}`, version);
+}
+
+// 视频支持 Range 请求，拖动进度条时只下载需要的部分
+export function videoUrl(
+  cosplayId: number,
+  filename: string,
+  version?: string | null
+): string {
+  return withVersion(
+    `${API_BASE}/files/video/${cosplayId}/${encodeURIComponent(filename)}`,
+    version
+  );
+}
+
+// 整个图集打包为 ZIP（不压缩），支持断点续传
+export function archiveUrl(cosplayId: number): string {
+  return `${API_BASE}/files/archive/${cosplayId}`;
 }
 
 export function coserAvatarUrl(coserId: number): string {
@@ -275,10 +428,26 @@ export async function adminRescanCosplay(
   return res.json();
 }
 
-export async function adminGenerateThumbnails(cosplayId: number): Promise<{
-  thumbnails_generated: number;
-  hashes_computed: number;
-}> {
+export interface Job {
+  id: number;
+  kind: string;
+  cosplay_id: number | null;
+  status: "queued" | "running" | "succeeded" | "failed" | "cancelled";
+  progress: number;
+  total: number;
+  attempts: number;
+  max_attempts: number;
+  cancel_requested: boolean;
+  result: Record<string, unknown> | null;
+  error: string | null;
+  created_at: string;
+  started_at: string | null;
+  finished_at: string | null;
+}
+
+export async function adminGenerateThumbnails(
+  cosplayId: number
+): Promise<{ job_id: number }> {
   const res = await fetch(
     `${API_BASE}/admin/cosplays/${cosplayId}/generate-thumbnails`,
     { method: "POST" }
@@ -290,6 +459,26 @@ export async function adminGenerateThumbnails(cosplayId: number): Promise<{
   return res.json();
 }
 
+export async function fetchJob(jobId: number): Promise<Job> {
+  const res = await fetch(`${API_BASE}/admin/jobs/${jobId}`);
+  if (!res.ok) {
+    const err = await res.json().catch(() => ({}));
+    throw new Error(err.detail || "Failed to fetch job");
+  }
+  return res.json();
+}
+
+export async function adminCancelJob(jobId: number): Promise<Job> {
+  const res = await fetch(`${API_BASE}/admin/jobs/${jobId}/cancel`, {
+    method: "POST",
+  });
+  if (!res.ok) {
+    const err = await res.json().catch(() => ({}));
+    throw new Error(err.detail || "Failed to cancel job");
+  }
+  return res.json();
+}
+
 export interface DedupImage {
   id: number;
   cosplay_id: number;